@@ -0,0 +1,162 @@
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from app.core.metrics import IN_FLIGHT, REJECTED
+
+
+class OverloadedError(Exception):
+    """某个处理阶段已满，调用方应返回503并带上Retry-After"""
+
+    def __init__(self, stage: str, retry_after: int, message: Optional[str] = None):
+        super().__init__(message or f"服务繁忙（{stage}），请{retry_after}秒后重试")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class RateLimitedError(Exception):
+    """客户端请求过于频繁，调用方应返回429并带上Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"请求过于频繁，请{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1, now: Optional[float] = None) -> float:
+        """取出 cost 个令牌，成功返回0，否则返回需要等待的秒数（不扣除令牌）"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (min(cost, self.burst) - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """按客户端（IP）限流，每个客户端一个令牌桶
+
+    最多记录 max_clients 个客户端，超出时淘汰最久未访问的（其令牌桶已基本回满）。
+    per_minute <= 0 时不限流。
+    """
+
+    def __init__(self, per_minute: float = 30, burst: float = 10, max_clients: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self.allowed = 0
+        self.rejected = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, client: str, cost: float = 1):
+        """消耗 cost 个令牌，不足时抛出 RateLimitedError"""
+        if not self.enabled:
+            return
+        # 单次消耗不超过桶容量，否则批量请求永远无法通过
+        cost = min(cost, self.burst)
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client)
+
+        wait = bucket.take(cost)
+        if wait > 0:
+            self.rejected += 1
+            REJECTED.inc(reason="rate_limit")
+            raise RateLimitedError(max(1, int(wait + 0.999)))
+        self.allowed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected
+        }
+
+
+class StageGate:
+    """单个处理阶段（decode/upload/asr）的全局并发上限
+
+    名额已满时最多等待 wait_timeout 秒，仍拿不到名额就抛出 OverloadedError，
+    不让请求无限堆积、也不悄悄走回退路径。limit <= 0 表示不限制。
+    """
+
+    def __init__(self, stage: str, limit: int, wait_timeout: float = 5.0, retry_after: int = 5):
+        self.stage = stage
+        self.limit = limit
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            yield
+            return
+
+        if self._semaphore.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                REJECTED.inc(reason=self.stage)
+                raise OverloadedError(self.stage, self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        try:
+            with IN_FLIGHT.track(stage=f"admitted_{self.stage}"):
+                yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
+
+
+def build_stage_gates(settings) -> Dict[str, StageGate]:
+    """按配置创建各阶段的并发闸门"""
+    limits = {
+        "decode": settings.ADMISSION_DECODE_CONCURRENCY,
+        "upload": settings.ADMISSION_UPLOAD_CONCURRENCY,
+        "asr": settings.ADMISSION_ASR_CONCURRENCY,
+    }
+    return {
+        stage: StageGate(stage, limit, settings.ADMISSION_WAIT_TIMEOUT, settings.ADMISSION_RETRY_AFTER)
+        for stage, limit in limits.items()
+    }
@@ -0,0 +1,171 @@
+import struct
+from typing import Dict, Any
+
+import numpy as np
+
+TARGET_SAMPLE_RATE = 16000
+# 重采样前低通滤波器的阶数（加窗sinc）
+LOWPASS_TAPS = 63
+
+
+class NormalizedAudio:
+    """标准化后的音频：16kHz 单声道 int16 样本 + 元数据
+
+    整个分析流程只解码/重采样一次，后续的哈希、本地分析、上传编码
+    都直接使用同一个 ndarray（或它的 memoryview），不再反复导出/解析WAV。
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE,
+                 original: Dict[str, Any] = None, truncated: bool = False,
+                 timings: Dict[str, float] = None):
+        self.samples = np.ascontiguousarray(samples, dtype=np.int16)
+        self.sample_rate = sample_rate
+        self.original = original or {}
+        self.truncated = truncated
+        # 解码各阶段耗时（秒），由子进程填写，供主进程记录指标
+        self.timings = timings or {}
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def pcm(self) -> memoryview:
+        """小端16位PCM的只读视图（不复制）"""
+        view = memoryview(self.samples).cast("B")
+        return view.toreadonly()
+
+    @property
+    def nbytes(self) -> int:
+        return self.samples.nbytes
+
+    def segment(self, start: int, end: int) -> "NormalizedAudio":
+        """截取 [start, end) 样本区间（切片视图，不复制PCM）"""
+        return NormalizedAudio(self.samples[start:end], self.sample_rate, self.original)
+
+    def as_float(self) -> np.ndarray:
+        """转换为 [-1, 1] 范围的 float32，供DSP分析使用"""
+        return self.samples.astype(np.float32) / 32768.0
+
+    def wav_header(self) -> bytes:
+        """44字节的标准PCM WAV头"""
+        data_size = self.nbytes
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + data_size, b"WAVE",
+            b"fmt ", 16, 1, 1, self.sample_rate, self.sample_rate * 2, 2, 16,
+            b"data", data_size
+        )
+
+    def to_wav(self) -> bytes:
+        """编码为WAV字节（仅在需要上传时调用，只复制一次PCM）"""
+        return b"".join([self.wav_header(), self.pcm])
+
+    @classmethod
+    def from_wav(cls, wav_bytes: bytes) -> "NormalizedAudio":
+        """从16kHz单声道16位WAV构造（不复制PCM数据）"""
+        import io
+        import wave
+        with wave.open(io.BytesIO(wav_bytes)) as wav_file:
+            if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+                raise ValueError("只支持单声道16位PCM")
+            sample_rate = wav_file.getframerate()
+            raw = wav_file.readframes(wav_file.getnframes())
+        return cls(np.frombuffer(raw, dtype="<i2"), sample_rate)
+
+
+def _lowpass_taps(cutoff: float) -> np.ndarray:
+    n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    taps = np.sinc(2 * cutoff * n) * np.hamming(LOWPASS_TAPS)
+    taps /= taps.sum()
+    return taps.astype(np.float32)
+
+
+def _lowpass(samples: np.ndarray, cutoff: float) -> np.ndarray:
+    """加窗sinc低通滤波（cutoff 为相对采样率的归一化截止频率）"""
+    return np.convolve(samples, _lowpass_taps(cutoff), mode="same")
+
+
+def normalize_samples(raw: bytes, sample_width: int, channels: int, frame_rate: int,
+                      max_frames: int = None) -> np.ndarray:
+    """把原始交错PCM一步转成16kHz单声道 int16（混音、抗混叠、重采样）"""
+    dtype = {1: np.uint8, 2: "<i2", 4: "<i4"}[sample_width]
+    frames = np.frombuffer(raw, dtype=dtype)
+    frames = frames[:len(frames) - len(frames) % channels].reshape(-1, channels)
+    if max_frames is not None:
+        frames = frames[:max_frames]
+    scale = float(1 << (8 * sample_width - 1))
+    return normalize_frames(frames, frame_rate, scale, 128.0 if sample_width == 1 else 0.0)
+
+
+def normalize_frames(frames: np.ndarray, frame_rate: int, scale: float = 32768.0,
+                     bias: float = 0.0) -> np.ndarray:
+    """把 (帧数, 声道数) 的样本数组转成16kHz单声道 int16
+
+    frames 可以是任意整数/浮点类型（包括内存映射的数组），样本值按 (x - bias) / scale
+    换算到 [-1, 1]。已经是16kHz单声道16位时直接复制，不做浮点往返。
+    """
+    if frame_rate == TARGET_SAMPLE_RATE and frames.shape[1] == 1 and frames.dtype == np.dtype("<i2"):
+        return np.array(frames[:, 0], dtype=np.int16)
+
+    if frames.shape[1] == 1:
+        mono = frames[:, 0].astype(np.float32)
+    else:
+        mono = frames.mean(axis=1, dtype=np.float32)
+    if bias:
+        mono -= bias
+    mono /= scale
+
+    if frame_rate != TARGET_SAMPLE_RATE:
+        if frame_rate > TARGET_SAMPLE_RATE:
+            mono = _lowpass(mono, 0.5 * TARGET_SAMPLE_RATE / frame_rate)
+        n_out = int(len(mono) * TARGET_SAMPLE_RATE / frame_rate)
+        positions = np.arange(n_out, dtype=np.float64) * (frame_rate / TARGET_SAMPLE_RATE)
+        mono = np.interp(positions, np.arange(len(mono)), mono).astype(np.float32)
+
+    return np.clip(mono * 32768.0, -32768, 32767).astype(np.int16)
+
+
+class StreamResampler:
+    """分块输入的重采样（单声道 float32 -> 16kHz float32）
+
+    与 normalize_frames 的滤波和插值相同，但滤波器状态和插值位置在块之间延续：
+    每块末尾还不能确定的样本留到下一块再输出，拼接处没有毛刺，输出样本数也不会
+    因为逐块取整而漂移。
+    """
+
+    def __init__(self, frame_rate: int):
+        self.frame_rate = frame_rate
+        self.step = frame_rate / TARGET_SAMPLE_RATE
+        self._taps = _lowpass_taps(0.5 * TARGET_SAMPLE_RATE / frame_rate) if frame_rate > TARGET_SAMPLE_RATE else None
+        self._half = (LOWPASS_TAPS - 1) // 2 if self._taps is not None else 0
+        # 尚需保留的输入（开头补零，与 mode="same" 的边界一致）及其第一个样本的绝对位置
+        self._input = np.zeros(self._half, dtype=np.float32)
+        self._start = -self._half
+        self._produced = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        self._input = np.concatenate([self._input, samples.astype(np.float32, copy=False)])
+        if self._taps is not None:
+            if len(self._input) < LOWPASS_TAPS:
+                return np.zeros(0, dtype=np.float32)
+            # valid 卷积只输出两侧输入都已到达的样本
+            filtered = np.convolve(self._input, self._taps, mode="valid")
+        else:
+            filtered = self._input
+        first = self._start + self._half        # filtered[0] 的绝对位置
+        last = first + len(filtered) - 1
+        # 插值需要右侧相邻的样本，最后一个位置留到下一块
+        count = max(0, int(np.ceil((last - 1e-9) / self.step)) - self._produced)
+        positions = (self._produced + np.arange(count)) * self.step
+        output = np.interp(positions, first + np.arange(len(filtered)), filtered).astype(np.float32)
+        self._produced += count
+
+        keep_from = int(np.floor(self._produced * self.step)) - self._half
+        drop = max(0, keep_from - self._start)
+        self._input = self._input[drop:]
+        self._start += drop
+        return output
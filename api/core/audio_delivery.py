@@ -0,0 +1,100 @@
+import os
+import uuid
+import base64
+import asyncio
+from typing import Optional
+
+from app.core.oss_uploader import OSSUploader
+from app.core.log import get_logger
+from app.core.metrics import STAGE_SECONDS, IN_FLIGHT
+
+logger = get_logger(__name__)
+
+
+class AudioDelivery:
+    """把处理后的音频交给ASR的方式：deliver 返回ASR可读取的URL，release 在分析结束后清理"""
+
+    name = ""
+
+    async def deliver(self, data: bytes, suffix: str = ".wav", mime_type: str = "audio/wav") -> str:
+        raise NotImplementedError
+
+    async def release(self, url: str):
+        pass
+
+
+class InlineDelivery(AudioDelivery):
+    """以 data: URL 内联在ASR请求中，省去一次上传和一次下载（请求体增大约1/3）"""
+
+    name = "inline"
+
+    async def deliver(self, data: bytes, suffix: str = ".wav", mime_type: str = "audio/wav") -> str:
+        encoded = await asyncio.to_thread(base64.b64encode, bytes(data))
+        return f"data:{mime_type};base64,{encoded.decode('ascii')}"
+
+
+class OSSDelivery(AudioDelivery):
+    """上传到OSS并签名，分析结束后删除对象，不再留下孤立的 audios/*.wav"""
+
+    name = "oss"
+
+    def __init__(self, uploader: OSSUploader, prefix: str = "audios/", expires: int = 3600):
+        self.uploader = uploader
+        self.prefix = prefix
+        self.expires = expires
+        self._keys = {}
+
+    async def deliver(self, data: bytes, suffix: str = ".wav", mime_type: str = "audio/wav") -> str:
+        key = f"{self.prefix}{uuid.uuid4()}{suffix}"
+        with IN_FLIGHT.track(stage="oss_put"), STAGE_SECONDS.time(stage="oss_put"):
+            status = await self.uploader.put(key, data)
+        if status != 200:
+            raise Exception(f"OSS上传失败: {status}")
+        with STAGE_SECONDS.time(stage="sign_url"):
+            url = await self.uploader.sign_url(key, self.expires)
+        self._keys[url] = key
+        return url
+
+    async def release(self, url: str):
+        key = self._keys.pop(url, None)
+        if key is None:
+            return
+        try:
+            await self.uploader.delete(key)
+        except Exception as e:
+            # 删除失败时依赖OSS生命周期规则兜底
+            logger.warning("删除OSS音频失败", extra={"key": key, "error": str(e)})
+
+
+class LocalFileDelivery(AudioDelivery):
+    """写入本地目录，由本服务的 /api/delivery/{token} 提供下载（用于测试或内网部署）"""
+
+    name = "local"
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, token: str) -> Optional[str]:
+        # token 只能是 deliver 生成的文件名，防止路径穿越
+        if os.path.basename(token) != token:
+            return None
+        path = os.path.join(self.directory, token)
+        return path if os.path.isfile(path) else None
+
+    async def deliver(self, data: bytes, suffix: str = ".wav", mime_type: str = "audio/wav") -> str:
+        token = f"{uuid.uuid4().hex}{suffix}"
+        path = os.path.join(self.directory, token)
+        await asyncio.to_thread(_write_file, path, data)
+        return f"{self.base_url}/api/delivery/{token}"
+
+    async def release(self, url: str):
+        path = self.path_for(url.rsplit("/", 1)[-1])
+        if path is not None:
+            os.remove(path)
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
@@ -1,138 +1,396 @@
-import oss2
+import os
 import uuid
 import asyncio
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Union, AsyncIterator
 from app.core.config import settings
+from app.core.transcoder import TranscodePool, decode_audio
+from app.core.admission import OverloadedError, StageGate, build_stage_gates
+from app.core.audio_buffer import NormalizedAudio
+from app.core.oss_uploader import OSSUploader
+from app.core.audio_delivery import AudioDelivery, InlineDelivery, OSSDelivery, LocalFileDelivery
+from app.core.codecs import EncodedAudio, encode_audio, available_codecs
+from app.core.log import get_logger
+from app.core.metrics import STAGE_SECONDS, FALLBACKS, IN_FLIGHT, PAYLOAD_BYTES, DELIVERIES
+
+logger = get_logger(__name__)
+
+AudioInput = Union[bytes, str, NormalizedAudio]
+
+
+def _audio_size(audio_data: AudioInput) -> int:
+    """音频字节数（支持字节数据、文件路径或标准化音频）"""
+    if isinstance(audio_data, str):
+        return os.path.getsize(audio_data)
+    if isinstance(audio_data, NormalizedAudio):
+        return audio_data.nbytes
+    return len(audio_data)
+
 
 class CloudServiceManager:
-    def __init__(self, settings):
+    def __init__(self, settings, oss_bucket=None):
+        """oss_bucket 可注入一个与 oss2.Bucket 接口兼容的对象（如本地替身），此时跳过真实连接"""
         self.settings = settings
         self.fallback_mode = True
+        self.oss_uploader: Optional[OSSUploader] = None
+        self.transcoder = TranscodePool(
+            max_workers=settings.TRANSCODE_MAX_WORKERS,
+            max_queue=settings.TRANSCODE_MAX_QUEUE,
+            retry_after=settings.TRANSCODE_RETRY_AFTER
+        )
+        # 各阶段（decode/upload/asr）的全局并发闸门，满载时返回503而不是走回退
+        self.gates: Dict[str, StageGate] = build_stage_gates(settings)
+        
+        # 连接状态：initializing -> ready / fallback
+        # 构造时不做任何网络调用，真实连接在 start() 中后台进行
+        self.state = "initializing"
+        self.connect_error: Optional[str] = None
+        self._connect_task: Optional[asyncio.Task] = None
         
-        print("🔄 正在初始化阿里云服务...")
+        # 可用的音频交付方式（OSS在连接成功后加入）
+        self.deliveries: Dict[str, AudioDelivery] = {}
+        if settings.ASR_INLINE_AUDIO:
+            self.deliveries["inline"] = InlineDelivery()
+        if settings.AUDIO_LOCAL_BASE_URL:
+            self.deliveries["local"] = LocalFileDelivery(settings.AUDIO_LOCAL_DIR, settings.AUDIO_LOCAL_BASE_URL)
         
         # OSS连接
-        if (settings.ALIYUN_ACCESS_KEY_ID and 
+        if oss_bucket is not None:
+            self.oss_bucket = oss_bucket
+            self._init_uploader()
+            self.fallback_mode = False
+            self.state = "ready"
+            logger.info("使用注入的OSS存储")
+            self._init_asr_service()
+        elif not self._has_credentials():
+            self.state = "fallback"
+            logger.info("未配置阿里云凭证，使用模拟模式运行")
+    
+    def _has_credentials(self) -> bool:
+        settings = self.settings
+        return bool(settings.ALIYUN_ACCESS_KEY_ID and 
             settings.ALIYUN_ACCESS_KEY_SECRET and
-            "test" not in settings.ALIYUN_ACCESS_KEY_ID.lower()):
+            "test" not in settings.ALIYUN_ACCESS_KEY_ID.lower())
+    
+    def _connect_oss(self):
+        """创建OSS客户端并测试连接（阻塞调用，在线程中执行）"""
+        import oss2
+        
+        logger.info("尝试连接阿里云OSS", extra={"endpoint": self.settings.ALIYUN_OSS_ENDPOINT})
+        self.oss_auth = oss2.Auth(
+            self.settings.ALIYUN_ACCESS_KEY_ID,
+            self.settings.ALIYUN_ACCESS_KEY_SECRET
+        )
+        self.oss_bucket = oss2.Bucket(
+            self.oss_auth,
+            self.settings.ALIYUN_OSS_ENDPOINT,
+            self.settings.ALIYUN_OSS_BUCKET
+        )
+        
+        # 测试连接
+        self.oss_bucket.get_bucket_info()
+        
+        if self.settings.OSS_AUDIO_EXPIRE_DAYS > 0:
+            self._ensure_lifecycle(self.settings.OSS_AUDIO_EXPIRE_DAYS)
+    
+    def _ensure_lifecycle(self, days: int):
+        """为 audios/ 设置过期规则，兜底清理删除失败或进程退出时遗留的对象"""
+        from oss2.models import BucketLifecycle, LifecycleRule, LifecycleExpiration
+        
+        try:
+            rule = LifecycleRule(
+                "expire-analysis-audio", "audios/",
+                status=LifecycleRule.ENABLED,
+                expiration=LifecycleExpiration(days=days)
+            )
+            self.oss_bucket.put_bucket_lifecycle(BucketLifecycle([rule]))
+        except Exception as e:
+            logger.warning("设置OSS生命周期规则失败", extra={"error": str(e)})
+    
+    async def _connect(self):
+        """后台连接阿里云服务，失败时保持模拟模式"""
+        try:
+            logger.info("正在初始化阿里云服务")
+            await asyncio.to_thread(self._connect_oss)
+            self._init_uploader()
+            logger.info("阿里云OSS连接成功")
             
-            try:
-                print("📡 尝试连接阿里云OSS...")
-                self.oss_auth = oss2.Auth(
-                    settings.ALIYUN_ACCESS_KEY_ID,
-                    settings.ALIYUN_ACCESS_KEY_SECRET
-                )
-                self.oss_bucket = oss2.Bucket(
-                    self.oss_auth,
-                    settings.ALIYUN_OSS_ENDPOINT,
-                    settings.ALIYUN_OSS_BUCKET
-                )
-                
-                # 测试连接
-                bucket_info = self.oss_bucket.get_bucket_info()
-                self.fallback_mode = False
-                print(f"✅ 阿里云OSS连接成功！")
-                
-                # 初始化ASR服务
-                if hasattr(settings, 'ALIYUN_ASR_API_KEY') and settings.ALIYUN_ASR_API_KEY:
-                    from app.core.real_asr_service import RealASRService
-                    self.asr_service = RealASRService(api_key=settings.ALIYUN_ASR_API_KEY)
-                    print("🎤 Fun-ASR服务初始化完成 - 准备真实AI分析")
-                else:
-                    print("⚠️ 未找到ASR API Key，使用模拟模式")
+            # 初始化ASR服务
+            self._init_asr_service()
+            if hasattr(self, 'asr_service'):
+                await self.asr_service.start()
+            
+            self.fallback_mode = False
+            self.state = "ready"
+        except Exception as e:
+            logger.warning("云服务连接失败，使用模拟模式", extra={"error": str(e)})
+            self.connect_error = str(e)
+            self.state = "fallback"
+    
+    def _init_uploader(self):
+        """OSS的阻塞调用统一放到专用线程池中执行"""
+        self.oss_uploader = OSSUploader(
+            self.oss_bucket,
+            max_workers=self.settings.OSS_UPLOAD_WORKERS,
+            multipart_threshold=self.settings.OSS_MULTIPART_THRESHOLD,
+            part_size=self.settings.OSS_PART_SIZE
+        )
+        self.deliveries["oss"] = OSSDelivery(self.oss_uploader)
+    
+    def _select_delivery(self, size: int) -> Optional[AudioDelivery]:
+        """按配置和数据大小选择交付方式
+
+        auto 模式下小文件优先内联（只传一次，请求体约为1.33倍），
+        其余走OSS（上传一次，ASR从OSS内网读取），没有OSS时用本地文件。
+        """
+        mode = self.settings.AUDIO_DELIVERY
+        if mode != "auto":
+            return self.deliveries.get(mode)
+        if "inline" in self.deliveries and size <= self.settings.AUDIO_INLINE_MAX_BYTES:
+            return self.deliveries["inline"]
+        return self.deliveries.get("oss") or self.deliveries.get("local")
+    
+    @asynccontextmanager
+    async def deliver_audio(self, audio_data: AudioInput) -> AsyncIterator[str]:
+        """把预处理后的音频交给ASR，产出ASR可读取的URL；离开上下文时清理（删除OSS对象/本地文件）
+
+        交付失败时与 upload_audio 一样回退到模拟URL。
+        """
+        if self.fallback_mode:
+            logger.info("模拟上传音频", extra={"bytes": _audio_size(audio_data)})
+            yield f"https://example.com/audio-{uuid.uuid4()}.wav"
+            return
+        
+        delivery: Optional[AudioDelivery] = None
+        url = None
+        try:
+            async with self.gates["upload"].slot():
+                encoded = await self._encode_for_upload(audio_data)
+                delivery = self._select_delivery(len(encoded.data))
+                if delivery is None:
+                    raise Exception(f"没有可用的音频交付方式: {self.settings.AUDIO_DELIVERY}")
                 
-            except Exception as e:
-                print(f"❌ 连接失败: {e}")
+                with STAGE_SECONDS.time(stage=f"deliver_{delivery.name}") as timer:
+                    url = await delivery.deliver(encoded.data, encoded.suffix, encoded.mime_type)
+            DELIVERIES.inc(strategy=delivery.name)
+            PAYLOAD_BYTES.observe(len(encoded.data), kind=f"deliver_{delivery.name}")
+            logger.info("音频已交付", extra={
+                "strategy": delivery.name, "codec": encoded.codec,
+                "bytes": len(encoded.data), "seconds": round(timer.elapsed, 3)
+            })
+        except OverloadedError:
+            raise
+        except Exception as e:
+            logger.error("音频交付失败，使用模拟URL", extra={"error": str(e)})
+            FALLBACKS.inc(path="upload_audio")
+        
+        if url is None:
+            yield f"https://example.com/audio-{uuid.uuid4()}.wav"
+            return
+        try:
+            yield url
+        finally:
+            await delivery.release(url)
+    
+    async def _encode_for_upload(self, audio_data: AudioInput) -> EncodedAudio:
+        """按 UPLOAD_CODEC 编码；FLAC/Opus 在转码进程池中执行，WAV只需拼接头部，直接在本进程完成
+
+        没有ffmpeg时只能得到WAV，不再把PCM送进进程池再退回WAV。
+        """
+        if not isinstance(audio_data, NormalizedAudio):
+            # 预处理失败时的原始字节，原样上传
+            return EncodedAudio(bytes(audio_data), "original", ".wav", "application/octet-stream")
+        
+        codec = self.settings.UPLOAD_CODEC
+        if codec != "wav" and available_codecs() == ["wav"]:
+            codec = "wav"
+        with STAGE_SECONDS.time(stage="export" if codec == "wav" else "encode"):
+            if codec == "wav":
+                encoded = encode_audio(audio_data)
+            else:
+                encoded = await self.transcoder.run(
+                    encode_audio, audio_data, codec,
+                    self.settings.UPLOAD_OPUS_BITRATE, self.settings.UPLOAD_ALLOW_LOSSY
+                )
+        PAYLOAD_BYTES.observe(len(encoded.data), kind=f"codec_{encoded.codec}")
+        return encoded
+    
+    def _init_asr_service(self):
+        settings = self.settings
+        if hasattr(settings, 'ALIYUN_ASR_API_KEY') and settings.ALIYUN_ASR_API_KEY:
+            from app.core.real_asr_service import RealASRService
+            self.asr_service = RealASRService(
+                api_key=settings.ALIYUN_ASR_API_KEY,
+                base_url=settings.ALIYUN_ASR_BASE_URL,
+                max_concurrency=settings.ASR_MAX_CONCURRENCY,
+                connection_limit=settings.ASR_CONNECTION_LIMIT,
+                connection_limit_per_host=settings.ASR_CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=settings.ASR_KEEPALIVE_TIMEOUT,
+                request_timeout=settings.ASR_REQUEST_TIMEOUT,
+                breaker_threshold=settings.ASR_BREAKER_THRESHOLD,
+                breaker_cooldown=settings.ASR_BREAKER_COOLDOWN,
+                hedge_delay=settings.ASR_HEDGE_DELAY
+            )
+            logger.info("Fun-ASR服务初始化完成")
         else:
-            print("ℹ️ 使用模拟模式运行")
+            logger.warning("未找到ASR API Key，使用模拟分析")
     
-    async def upload_audio(self, audio_data: bytes) -> str:
-        """上传音频到OSS并返回签名URL（自动压缩优化）"""
+    async def upload_audio(self, audio_data: AudioInput, preprocessed: bool = False) -> str:
+        """上传音频到OSS并返回签名URL（自动压缩优化）
+
+        preprocessed=True 表示 audio_data 已经是 preprocess_audio 的输出，不再重复转码。
+        """
         if self.fallback_mode:
-            print(f"📤 模拟上传音频，大小: {len(audio_data)} 字节")
+            logger.info("模拟上传音频", extra={"bytes": _audio_size(audio_data)})
             return f"https://example.com/audio-{uuid.uuid4()}.wav"
         else:
             try:
-                print(f"📦 原始音频大小: {len(audio_data)} 字节 ({len(audio_data)/1024/1024:.1f} MB)")
-                
                 # 音频预处理：转换为WAV并压缩
-                processed_data = await self._preprocess_audio(audio_data)
+                if preprocessed:
+                    processed_data = audio_data
+                else:
+                    processed_data = await self._preprocess_audio(audio_data)
+                if isinstance(processed_data, NormalizedAudio):
+                    with STAGE_SECONDS.time(stage="export"):
+                        processed_data = processed_data.to_wav()
                 
                 file_name = f"audios/{uuid.uuid4()}.wav"
-                print(f"📤 正在上传到阿里云OSS: {file_name}")
+                PAYLOAD_BYTES.observe(len(processed_data), kind="oss_put")
                 
-                # 上传到OSS
-                result = self.oss_bucket.put_object(file_name, processed_data)
-                if result.status == 200:
+                # 上传到OSS（在线程池中执行，大文件分片并行上传）
+                with IN_FLIGHT.track(stage="oss_put"), STAGE_SECONDS.time(stage="oss_put") as timer:
+                    status = await self.oss_uploader.put(file_name, processed_data)
+                if status == 200:
                     # 生成签名URL（1小时有效期）
-                    signed_url = self.oss_bucket.sign_url('GET', file_name, 3600)
-                    print("✅ 上传成功，生成签名URL")
+                    with STAGE_SECONDS.time(stage="sign_url"):
+                        signed_url = await self.oss_uploader.sign_url(file_name, 3600)
+                    logger.info("上传到OSS成功", extra={
+                        "key": file_name, "bytes": len(processed_data), "seconds": round(timer.elapsed, 3)
+                    })
                     return signed_url
                 else:
-                    raise Exception(f"OSS上传失败: {result.status}")
+                    raise Exception(f"OSS上传失败: {status}")
                     
+            except OverloadedError:
+                # 转码队列满时不回退，交给接口层返回503
+                raise
             except Exception as e:
-                print(f"❌ 上传失败: {e}")
+                logger.error("上传失败，使用模拟URL", extra={"error": str(e)})
+                FALLBACKS.inc(path="upload_audio")
                 # 回退到模拟模式
                 return f"https://example.com/audio-{uuid.uuid4()}.wav"
     
     async def analyze_singing(self, audio_url: str) -> Dict[str, Any]:
         """分析唱歌音频"""
         if self.fallback_mode or not hasattr(self, 'asr_service'):
-            print("🔄 使用模拟分析")
             return await self._simulate_analysis()
         else:
             try:
-                print(f"🔍 开始真实AI分析: {audio_url}")
-                result = await self.asr_service.analyze_singing(audio_url)
-                return result
+                async with self.gates["asr"].slot():
+                    with IN_FLIGHT.track(stage="asr"), STAGE_SECONDS.time(stage="asr"):
+                        return await self.asr_service.analyze_singing(audio_url)
+            except OverloadedError:
+                # ASR名额已满或上游限流时明确返回503，不用随机分数顶替
+                raise
             except Exception as e:
-                print(f"❌ 真实API分析失败: {e}")
-                print("🔄 回退到增强模拟分析")
+                logger.error("真实API分析失败，回退到模拟分析", extra={"error": str(e)})
                 return await self._simulate_analysis()
     
-    async def _preprocess_audio(self, audio_data: bytes) -> bytes:
-        """高质量音频预处理（使用ffmpeg）"""
+    async def preprocess_audio(self, audio_data: Union[bytes, str]) -> Union[NormalizedAudio, bytes]:
+        """把音频统一转成16kHz单声道PCM（供缓存键计算、本地分析和上传复用）"""
+        return await self._preprocess_audio(audio_data)
+    
+    async def _preprocess_audio(self, audio_data: Union[bytes, str]) -> Union[NormalizedAudio, bytes]:
+        """高质量音频预处理（使用ffmpeg），audio_data 可以是字节或文件路径
+
+        成功时返回 NormalizedAudio；解码失败时返回原始字节。
+        """
+        input_size = _audio_size(audio_data)
+        PAYLOAD_BYTES.observe(input_size, kind="input")
         try:
-            print("🔧 开始高质量音频预处理...")
+            # 解码/重采样是CPU密集操作，放到进程池中执行，避免阻塞事件循环
+            max_duration_ms = int(self.settings.AUDIO_MAX_DURATION * 1000)
+            async with self.gates["decode"].slot():
+                audio = await self.transcoder.run(decode_audio, audio_data, max_duration_ms)
+            for stage, seconds in audio.timings.items():
+                STAGE_SECONDS.observe(seconds, stage=stage)
+            PAYLOAD_BYTES.observe(audio.nbytes, kind="normalized")
             
-            from pydub import AudioSegment
-            import io
-            
-            # 从字节数据创建音频对象
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
-            
-            print(f"🎵 原始音频信息: {len(audio)/1000:.1f}秒, {audio.channels}声道, {audio.frame_rate}Hz")
-            
-            # 如果音频过长，截取前45秒
-            max_duration = 45 * 1000  # 45秒
-            if len(audio) > max_duration:
-                print(f"⏰ 音频过长 ({len(audio)/1000:.1f}秒)，截取前45秒")
-                audio = audio[:max_duration]
-            
-            # 优化设置（语音识别最佳参数）
-            audio = audio.set_frame_rate(16000)  # 16kHz
-            audio = audio.set_channels(1)        # 单声道
-            audio = audio.set_sample_width(2)    # 16位
-            
-            # 导出为WAV格式
-            buffer = io.BytesIO()
-            audio.export(buffer, format="wav")
-            processed_data = buffer.getvalue()
-            
-            print(f"✅ 预处理完成: {len(processed_data)} 字节 ({len(processed_data)/1024/1024:.1f} MB)")
-            print(f"📊 压缩率: {len(audio_data)/len(processed_data)*100:.1f}%, 时长: {len(audio)/1000:.1f}秒")
-            
-            return processed_data
+            original = audio.original
+            if audio.truncated:
+                logger.warning("音频超过解码上限，已截断", extra={
+                    "duration": original["duration"], "max_duration": self.settings.AUDIO_MAX_DURATION
+                })
+            logger.info("预处理完成", extra={
+                "decoder": original.get("decoder"),
+                "original_duration": original["duration"],
+                "channels": original["channels"],
+                "frame_rate": original["frame_rate"],
+                "duration": round(audio.duration, 2),
+                "input_bytes": input_size,
+                "normalized_bytes": audio.nbytes,
+                **{f"{stage}_seconds": round(seconds, 4) for stage, seconds in audio.timings.items()}
+            })
+            return audio
             
+        except OverloadedError:
+            raise
         except Exception as e:
-            print(f"⚠️ 高质量预处理失败: {e}")
-            print("🔄 使用原始数据继续处理...")
+            logger.warning("音频预处理失败，使用原始数据继续处理", extra={"error": str(e)})
+            FALLBACKS.inc(path="raw_audio")
+            if isinstance(audio_data, str):
+                with open(audio_data, 'rb') as f:
+                    return f.read()
             return audio_data
     
+    async def start(self):
+        """应用启动时调用：后台连接云服务，不阻塞启动"""
+        if self.state == "initializing":
+            if self._connect_task is None:
+                self._connect_task = asyncio.create_task(self._connect())
+        elif hasattr(self, 'asr_service'):
+            await self.asr_service.start()
+    
+    async def wait_until_ready(self, timeout: float):
+        """等待后台连接完成（最多 timeout 秒），超时后按当前模式继续"""
+        if self.state != "initializing":
+            return
+        if self._connect_task is None:
+            await self.start()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._connect_task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("云服务连接超时，本次请求使用模拟模式", extra={"timeout": timeout})
+    
+    def readiness(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "oss": self.oss_uploader is not None,
+            "asr": hasattr(self, 'asr_service'),
+            "deliveries": list(self.deliveries),
+            "error": self.connect_error
+        }
+    
+    def admission_stats(self) -> Dict[str, Any]:
+        """各阶段并发闸门和转码进程池的占用情况"""
+        stats = {stage: gate.stats() for stage, gate in self.gates.items()}
+        stats["transcode"] = self.transcoder.stats()
+        return stats
+    
+    async def close(self):
+        """应用关闭时调用：释放ASR连接池和转码进程池"""
+        if self._connect_task is not None and not self._connect_task.done():
+            self._connect_task.cancel()
+        if hasattr(self, 'asr_service'):
+            await self.asr_service.close()
+        if self.oss_uploader is not None:
+            self.oss_uploader.close()
+        self.transcoder.shutdown()
+    
     async def _simulate_analysis(self) -> Dict[str, Any]:
         """模拟分析（回退方案）"""
-        print("🔄 使用增强模拟分析")
+        logger.info("使用模拟分析")
+        FALLBACKS.inc(path="simulate_analysis")
         
         # 模拟分析结果
         return {
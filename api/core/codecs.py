@@ -0,0 +1,86 @@
+import shutil
+import subprocess
+from typing import Optional, List, NamedTuple
+
+from app.core.audio_buffer import NormalizedAudio
+
+# Opus 低于该码率时（16kHz语音）识别准确率开始明显下降
+MIN_OPUS_BITRATE = 16000
+
+
+class EncodedAudio(NamedTuple):
+    data: bytes
+    codec: str
+    suffix: str
+    mime_type: str
+
+
+# 编码器参数：ffmpeg 从 stdin 读取16kHz单声道s16le PCM，编码结果写到 stdout
+_FFMPEG_CODECS = {
+    "flac": (["-c:a", "flac", "-compression_level", "5", "-f", "flac"], ".flac", "audio/flac"),
+    "opus": (["-c:a", "libopus", "-application", "voip", "-f", "ogg"], ".ogg", "audio/ogg"),
+}
+
+
+def mime_type_for(suffix: str) -> str:
+    """交付文件后缀对应的MIME类型（未知后缀按WAV处理）"""
+    for _, codec_suffix, mime_type in _FFMPEG_CODECS.values():
+        if suffix == codec_suffix:
+            return mime_type
+    return "audio/wav"
+
+
+def available_codecs() -> List[str]:
+    """当前环境可用的上传编码（WAV始终可用，FLAC/Opus需要ffmpeg）"""
+    if shutil.which("ffmpeg") is None:
+        return ["wav"]
+    return ["wav"] + list(_FFMPEG_CODECS)
+
+
+def _ffmpeg_encode(audio: NormalizedAudio, codec: str, opus_bitrate: int) -> EncodedAudio:
+    args, suffix, mime_type = _FFMPEG_CODECS[codec]
+    if codec == "opus":
+        args = args[:2] + ["-b:a", str(max(opus_bitrate, MIN_OPUS_BITRATE))] + args[2:]
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(audio.sample_rate), "-ac", "1", "-i", "pipe:0",
+        *args, "pipe:1"
+    ]
+    result = subprocess.run(command, input=audio.pcm, capture_output=True, check=True)
+    return EncodedAudio(result.stdout, codec, suffix, mime_type)
+
+
+def encode_audio(audio: NormalizedAudio, codec: str = "wav", opus_bitrate: int = 24000,
+                 allow_lossy: bool = True) -> EncodedAudio:
+    """把标准化音频编码为上传格式（在转码进程池中运行）
+
+    codec 为 wav / flac / opus / auto。auto 按预期体积从小到大尝试 Opus（允许有损时）
+    和FLAC，用第一个成功的结果；结果不比WAV小、ffmpeg 不可用或编码失败时退回WAV，
+    保证总能得到可上传的数据。
+    """
+    if codec == "wav":
+        return _encode_wav(audio)
+
+    if codec == "auto":
+        candidates = (["opus"] if allow_lossy else []) + ["flac"]
+    elif codec in _FFMPEG_CODECS:
+        candidates = [codec]
+    else:
+        raise ValueError(f"不支持的上传编码: {codec}")
+
+    best: Optional[EncodedAudio] = None
+    if shutil.which("ffmpeg") is not None:
+        for candidate in candidates:
+            try:
+                encoded = _ffmpeg_encode(audio, candidate, opus_bitrate)
+            except (OSError, subprocess.CalledProcessError):
+                continue
+            best = encoded
+            break
+    if best is None or len(best.data) >= audio.nbytes + 44:
+        return _encode_wav(audio)
+    return best
+
+
+def _encode_wav(audio: NormalizedAudio) -> EncodedAudio:
+    return EncodedAudio(audio.to_wav(), "wav", ".wav", "audio/wav")
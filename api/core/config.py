@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,10 @@ class Settings:
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "AI唱歌分析"
     
+    # 日志配置（LOG_FORMAT: json 或 text）
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    
     # 阿里云OSS配置
     ALIYUN_ACCESS_KEY_ID: str = os.getenv("ALIYUN_ACCESS_KEY_ID", "test_key")
     ALIYUN_ACCESS_KEY_SECRET: str = os.getenv("ALIYUN_ACCESS_KEY_SECRET", "test_secret")
@@ -15,8 +20,122 @@ class Settings:
     ALIYUN_OSS_ENDPOINT: str = os.getenv("ALIYUN_OSS_ENDPOINT", "oss-cn-hangzhou.aliyuncs.com")
     ALIYUN_NLS_APP_KEY: str = os.getenv("ALIYUN_NLS_APP_KEY", "test_app_key")
     
+    # 请求等待后台云服务连接完成的最长时间（秒）
+    CLOUD_READY_TIMEOUT: float = float(os.getenv("CLOUD_READY_TIMEOUT", "10"))
+    
+    # OSS上传配置（超过阈值的文件分片并行上传）
+    OSS_UPLOAD_WORKERS: int = int(os.getenv("OSS_UPLOAD_WORKERS", "4"))
+    OSS_MULTIPART_THRESHOLD: int = int(os.getenv("OSS_MULTIPART_THRESHOLD", str(5 * 1024 * 1024)))
+    OSS_PART_SIZE: int = int(os.getenv("OSS_PART_SIZE", str(1024 * 1024)))
+    
+    # 上传给ASR的编码：wav / flac / opus / auto（auto 取最小的可用编码，不允许有损时只用FLAC）
+    UPLOAD_CODEC: str = os.getenv("UPLOAD_CODEC", "auto")
+    UPLOAD_ALLOW_LOSSY: bool = os.getenv("UPLOAD_ALLOW_LOSSY", "true").lower() == "true"
+    UPLOAD_OPUS_BITRATE: int = int(os.getenv("UPLOAD_OPUS_BITRATE", "24000"))
+    
+    # 音频交付方式：auto（按大小选择）/ inline / oss / local
+    # ASR_INLINE_AUDIO 表示ASR接口接受 data: URL；AUDIO_LOCAL_BASE_URL 为空时不启用本地文件方式
+    AUDIO_DELIVERY: str = os.getenv("AUDIO_DELIVERY", "auto")
+    ASR_INLINE_AUDIO: bool = os.getenv("ASR_INLINE_AUDIO", "false").lower() == "true"
+    AUDIO_INLINE_MAX_BYTES: int = int(os.getenv("AUDIO_INLINE_MAX_BYTES", str(2 * 1024 * 1024)))
+    AUDIO_LOCAL_DIR: str = os.getenv("AUDIO_LOCAL_DIR", os.path.join(tempfile.gettempdir(), "singing-delivery"))
+    AUDIO_LOCAL_BASE_URL: str = os.getenv("AUDIO_LOCAL_BASE_URL", "")
+    # 大于0时为 audios/ 前缀设置OSS生命周期规则（会覆盖存储桶已有的生命周期配置）
+    OSS_AUDIO_EXPIRE_DAYS: int = int(os.getenv("OSS_AUDIO_EXPIRE_DAYS", "0"))
+    
     # Fun-ASR API配置
     ALIYUN_ASR_API_KEY: str = os.getenv("ALIYUN_ASR_API_KEY", "sk-436f4d6bf2814b87aa8ad4418b1bcb3a")
+    ALIYUN_ASR_BASE_URL: str = os.getenv("ALIYUN_ASR_BASE_URL", "https://dashscope.aliyuncs.com")
+    
+    # ASR连接池配置
+    ASR_MAX_CONCURRENCY: int = int(os.getenv("ASR_MAX_CONCURRENCY", "8"))
+    ASR_CONNECTION_LIMIT: int = int(os.getenv("ASR_CONNECTION_LIMIT", "32"))
+    ASR_CONNECTION_LIMIT_PER_HOST: int = int(os.getenv("ASR_CONNECTION_LIMIT_PER_HOST", "16"))
+    ASR_KEEPALIVE_TIMEOUT: int = int(os.getenv("ASR_KEEPALIVE_TIMEOUT", "30"))
+    ASR_REQUEST_TIMEOUT: int = int(os.getenv("ASR_REQUEST_TIMEOUT", "30"))
+    
+    # ASR端点熔断与竞速（ASR_HEDGE_DELAY=0 表示不竞速）
+    ASR_BREAKER_THRESHOLD: int = int(os.getenv("ASR_BREAKER_THRESHOLD", "3"))
+    ASR_BREAKER_COOLDOWN: float = float(os.getenv("ASR_BREAKER_COOLDOWN", "60"))
+    ASR_HEDGE_DELAY: float = float(os.getenv("ASR_HEDGE_DELAY", "0"))
+    
+    # 转码进程池配置
+    TRANSCODE_MAX_WORKERS: int = int(os.getenv("TRANSCODE_MAX_WORKERS", os.cpu_count() or 2))
+    TRANSCODE_MAX_QUEUE: int = int(os.getenv("TRANSCODE_MAX_QUEUE", "8"))
+    TRANSCODE_RETRY_AFTER: int = int(os.getenv("TRANSCODE_RETRY_AFTER", "5"))
+    
+    # 分析结果缓存配置（RESULT_CACHE_DB_PATH 为空时只使用内存缓存）
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+    RESULT_CACHE_TTL: int = int(os.getenv("RESULT_CACHE_TTL", str(24 * 3600)))
+    RESULT_CACHE_DB_PATH: str = os.getenv("RESULT_CACHE_DB_PATH", "")
+    
+    # 异步分析任务配置（JOB_STORE_PATH 为空时任务只保存在内存中）
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_QUEUE: int = int(os.getenv("JOB_MAX_QUEUE", "32"))
+    JOB_RETRY_AFTER: int = int(os.getenv("JOB_RETRY_AFTER", "10"))
+    JOB_STORE_PATH: str = os.getenv("JOB_STORE_PATH", "")
+    
+    # 用户分析历史（SQLite，HISTORY_DB_PATH 为空时不记录历史）
+    # 记录先放入内存队列，按 HISTORY_BATCH_SIZE 条或 HISTORY_FLUSH_INTERVAL 秒批量写入
+    HISTORY_DB_PATH: str = os.getenv("HISTORY_DB_PATH", "")
+    HISTORY_BATCH_SIZE: int = int(os.getenv("HISTORY_BATCH_SIZE", "64"))
+    HISTORY_FLUSH_INTERVAL: float = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+    HISTORY_MAX_PENDING: int = int(os.getenv("HISTORY_MAX_PENDING", "10000"))
+    
+    # 参考旋律比对：曲库文件（音符序列，启动时渲染一次，为空时不启用）和DTW带宽（秒）
+    REFERENCE_MELODIES_PATH: str = os.getenv(
+        "REFERENCE_MELODIES_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "reference_melodies.json")
+    )
+    REFERENCE_DTW_BAND_SECONDS: float = float(os.getenv("REFERENCE_DTW_BAND_SECONDS", "5"))
+    
+    # 哼唱识曲：离线构建的旋律指纹索引（scripts/build_melody_index.py 生成，为空时不启用）
+    # 未指定歌曲时，首位候选置信度不低于 SONG_ID_MIN_CONFIDENCE 且在参考曲库中的，自动做逐音符比对
+    SONG_INDEX_PATH: str = os.getenv("SONG_INDEX_PATH", "")
+    SONG_INDEX_TOP_K: int = int(os.getenv("SONG_INDEX_TOP_K", "5"))
+    SONG_ID_MIN_CONFIDENCE: float = float(os.getenv("SONG_ID_MIN_CONFIDENCE", "0.6"))
+    
+    # 上传暂存区：不超过 UPLOAD_SPOOL_MEMORY_THRESHOLD 字节的上传放在内存中（总量不超过 UPLOAD_SPOOL_MEMORY_LIMIT），
+    # 其余写入 UPLOAD_SPOOL_DIR（为空时优先使用 /dev/shm 下的tmpfs），磁盘占用超过 UPLOAD_SPOOL_DISK_QUOTA 时返回503
+    # 后台每 UPLOAD_SPOOL_SWEEP_INTERVAL 秒删除超过 UPLOAD_SPOOL_MAX_AGE 秒且不在使用中的遗留文件
+    UPLOAD_SPOOL_DIR: str = os.getenv("UPLOAD_SPOOL_DIR", "")
+    UPLOAD_SPOOL_MEMORY_THRESHOLD: int = int(os.getenv("UPLOAD_SPOOL_MEMORY_THRESHOLD", str(1024 * 1024)))
+    UPLOAD_SPOOL_MEMORY_LIMIT: int = int(os.getenv("UPLOAD_SPOOL_MEMORY_LIMIT", str(64 * 1024 * 1024)))
+    UPLOAD_SPOOL_DISK_QUOTA: int = int(os.getenv("UPLOAD_SPOOL_DISK_QUOTA", str(1024 * 1024 * 1024)))
+    UPLOAD_SPOOL_MAX_AGE: float = float(os.getenv("UPLOAD_SPOOL_MAX_AGE", "3600"))
+    UPLOAD_SPOOL_SWEEP_INTERVAL: float = float(os.getenv("UPLOAD_SPOOL_SWEEP_INTERVAL", "300"))
+    UPLOAD_SPOOL_RETRY_AFTER: int = int(os.getenv("UPLOAD_SPOOL_RETRY_AFTER", "10"))
+    
+    # 批量分析配置
+    BATCH_MAX_FILES: int = int(os.getenv("BATCH_MAX_FILES", "50"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+    
+    # 长音频处理：解码上限（秒），超过 SEGMENT_MAX_SECONDS 的音频按乐句切段并行分析
+    AUDIO_MAX_DURATION: float = float(os.getenv("AUDIO_MAX_DURATION", "600"))
+    SEGMENT_TARGET_SECONDS: float = float(os.getenv("SEGMENT_TARGET_SECONDS", "30"))
+    SEGMENT_MAX_SECONDS: float = float(os.getenv("SEGMENT_MAX_SECONDS", "45"))
+    # 单个请求同时分析的分段数上限，实际取值不超过上传/ASR闸门的名额，避免请求自己把闸门占满后503
+    SEGMENT_MAX_PARALLEL: int = int(os.getenv("SEGMENT_MAX_PARALLEL", "4"))
+    
+    # 准入控制：按客户端IP的令牌桶限流（RATE_LIMIT_PER_MINUTE<=0 表示不限流）
+    # RATE_LIMIT_TRUST_PROXY 为true时按 X-Forwarded-For 的第一个地址识别客户端
+    RATE_LIMIT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+    RATE_LIMIT_BURST: float = float(os.getenv("RATE_LIMIT_BURST", "10"))
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+    RATE_LIMIT_TRUST_PROXY: bool = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+    
+    # 准入控制：各阶段全局并发上限（<=0 表示不限制），名额满时最多等待 ADMISSION_WAIT_TIMEOUT 秒后返回503
+    ADMISSION_DECODE_CONCURRENCY: int = int(os.getenv("ADMISSION_DECODE_CONCURRENCY", str((os.cpu_count() or 2) * 2)))
+    ADMISSION_UPLOAD_CONCURRENCY: int = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "16"))
+    ADMISSION_ASR_CONCURRENCY: int = int(os.getenv("ADMISSION_ASR_CONCURRENCY", "16"))
+    ADMISSION_WAIT_TIMEOUT: float = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "5"))
+    ADMISSION_RETRY_AFTER: int = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+    
+    # 实时分析（WebSocket）最大并发会话数；单条音频消息的字节数上限，
+    # 超过 LIVE_THREAD_CHUNK_BYTES 的音频块在线程中分析，不占用事件循环
+    LIVE_MAX_SESSIONS: int = int(os.getenv("LIVE_MAX_SESSIONS", "200"))
+    LIVE_MAX_CHUNK_BYTES: int = int(os.getenv("LIVE_MAX_CHUNK_BYTES", str(256 * 1024)))
+    LIVE_THREAD_CHUNK_BYTES: int = int(os.getenv("LIVE_THREAD_CHUNK_BYTES", str(32 * 1024)))
 
 settings = Settings()
 
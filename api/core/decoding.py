@@ -0,0 +1,166 @@
+import re
+import shutil
+import struct
+import subprocess
+from typing import Dict, Any, Union, NamedTuple, Tuple
+
+import numpy as np
+
+from app.core.audio_buffer import TARGET_SAMPLE_RATE, normalize_frames
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# 录音程序边录边写时，data 块长度常常还是占位值
+_UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+
+class WavInfo(NamedTuple):
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    frames: int
+
+
+def is_wav(head: bytes) -> bool:
+    return len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+def parse_wav_header(data: Union[bytes, memoryview], total_size: int) -> WavInfo:
+    """解析WAV头，返回样本格式和 data 块位置（只支持PCM整数和IEEE浮点）
+
+    data 为文件开头的一段（需包含 data 块头），total_size 为整个文件的字节数，
+    用于修正长度缺失或超出文件的 data 块。
+    """
+    if not is_wav(bytes(data[:12])):
+        raise ValueError("不是WAV文件")
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, position)
+        body = position + 8
+        if chunk_id == b"fmt ":
+            if size < 16 or body + size > len(data):
+                raise ValueError("WAV fmt 块不完整")
+            audio_format, channels, sample_rate, _, block_align, bits = struct.unpack_from("<HHIIHH", data, body)
+            if audio_format == _WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # 子格式GUID的前两个字节就是实际的格式编号
+                audio_format = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (audio_format, channels, sample_rate, bits, block_align)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV缺少 fmt 块")
+            audio_format, channels, sample_rate, bits, block_align = fmt
+            if audio_format == _WAVE_FORMAT_PCM and bits not in (8, 16, 24, 32):
+                raise ValueError(f"不支持的PCM位宽: {bits}")
+            if audio_format == _WAVE_FORMAT_FLOAT and bits not in (32, 64):
+                raise ValueError(f"不支持的浮点位宽: {bits}")
+            if audio_format not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_FLOAT):
+                raise ValueError(f"不支持的WAV编码: {audio_format}")
+            if channels < 1 or sample_rate < 1 or block_align != channels * bits // 8:
+                raise ValueError("WAV格式参数无效")
+            available = total_size - body
+            if size in _UNKNOWN_SIZES or size > available:
+                size = available
+            return WavInfo(audio_format, channels, sample_rate, bits, body, size // block_align)
+        position = body + size + (size & 1)
+    raise ValueError("WAV缺少 data 块")
+
+
+def _wav_frames(source: Union[bytes, str], info: WavInfo, max_frames: int) -> Tuple[np.ndarray, float, float]:
+    """按 info 映射样本，返回 ((帧数, 声道数) 数组, scale, bias)；文件用 memmap，不读入内存"""
+    frames = min(info.frames, max_frames)
+    width = info.bits // 8
+    if info.audio_format == _WAVE_FORMAT_FLOAT:
+        dtype, scale, bias = ("<f4" if width == 4 else "<f8"), 1.0, 0.0
+    elif width == 3:
+        dtype, scale, bias = np.uint8, float(1 << 23), 0.0
+    else:
+        dtype = {1: np.uint8, 2: "<i2", 4: "<i4"}[width]
+        scale, bias = float(1 << (info.bits - 1)), (128.0 if width == 1 else 0.0)
+
+    shape = (frames, info.channels * (3 if width == 3 else 1))
+    if isinstance(source, str):
+        array = np.memmap(source, dtype=dtype, mode="r", offset=info.data_offset, shape=shape) if frames else \
+            np.empty(shape, dtype=dtype)
+    else:
+        array = np.frombuffer(source, dtype=dtype, count=shape[0] * shape[1], offset=info.data_offset).reshape(shape)
+
+    if width == 3:
+        # 24位小端：三个字节拼成 int32，最高字节按有符号数扩展
+        raw = array.reshape(frames, info.channels, 3)
+        array = raw[..., 0].astype(np.int32) | (raw[..., 1].astype(np.int32) << 8) | \
+            (raw[..., 2].astype(np.int8).astype(np.int32) << 16)
+    return array, scale, bias
+
+
+def decode_wav(source: Union[bytes, str], max_seconds: float) -> Tuple[np.ndarray, Dict[str, Any], bool]:
+    """不经过子进程直接解码WAV，返回 (16kHz单声道 int16, 原始参数, 是否截断)"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            head = f.read(64 * 1024)
+            f.seek(0, 2)
+            total = f.tell()
+    else:
+        head, total = source, len(source)
+    info = parse_wav_header(memoryview(head), total)
+    max_frames = int(info.sample_rate * max_seconds)
+    frames, scale, bias = _wav_frames(source, info, max_frames)
+    samples = normalize_frames(frames, info.sample_rate, scale, bias)
+    original = {
+        "duration": info.frames / info.sample_rate,
+        "channels": info.channels,
+        "frame_rate": info.sample_rate,
+    }
+    return samples, original, info.frames > max_frames
+
+
+_DURATION = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_AUDIO_STREAM = re.compile(r"Audio: [^,]+, (\d+) Hz, ([^,\n]+)")
+_LAYOUT_CHANNELS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "7.1": 8}
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def decode_with_ffmpeg(source: Union[bytes, str], max_seconds: float) -> Tuple[np.ndarray, Dict[str, Any], bool]:
+    """用ffmpeg管道解码压缩格式，直接输出16kHz单声道s16le，不写临时文件
+
+    字节输入经 stdin 送入，文件输入直接交给ffmpeg读取（可以随机访问，moov 在文件末尾
+    的M4A也能解码）。原始时长/声道/采样率从ffmpeg的流信息中解析，解析不到时按输出估算。
+    """
+    from_pipe = not isinstance(source, str)
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        *([] if from_pipe else ["-nostdin"]),
+        "-i", "pipe:0" if from_pipe else source,
+        # 多解码一小段用于判断是否超过上限
+        "-t", f"{max_seconds + 0.1:.3f}", "-vn",
+        "-f", "s16le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), "pipe:1"
+    ]
+    result = subprocess.run(command, input=source if from_pipe else None, capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        message = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise ValueError(f"ffmpeg解码失败: {message[-1] if message else result.returncode}")
+
+    samples = np.frombuffer(result.stdout, dtype="<i2")
+    max_frames = int(TARGET_SAMPLE_RATE * max_seconds)
+    truncated = len(samples) > max_frames
+    samples = samples[:max_frames]
+
+    log = result.stderr.decode("utf-8", "replace")
+    original = {"duration": len(samples) / TARGET_SAMPLE_RATE, "channels": None, "frame_rate": None}
+    duration = _DURATION.search(log)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        original["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    stream = _AUDIO_STREAM.search(log)
+    if stream:
+        original["frame_rate"] = int(stream.group(1))
+        layout = stream.group(2).strip()
+        count = re.match(r"(\d+) channels", layout)
+        original["channels"] = int(count.group(1)) if count else _LAYOUT_CHANNELS.get(layout.split("(")[0])
+    return samples, original, truncated
@@ -0,0 +1,66 @@
+import time
+from typing import Dict, Any, List, Optional
+
+
+class EndpointState:
+    """单个端点的健康状态"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.score = 0.5               # 成功率的指数滑动平均（0~1）
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0          # 熔断结束时间（0 表示未熔断）
+        self.successes = 0
+        self.failures = 0
+
+
+class EndpointSelector:
+    """记住可用的端点并按健康分排序，连续失败的端点在冷却期内被熔断跳过"""
+
+    def __init__(self, endpoints: List[str], failure_threshold: int = 3, cooldown: float = 60.0, alpha: float = 0.3):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._states = {path: EndpointState(path) for path in endpoints}
+        # 初始顺序作为同分时的优先级
+        self._priority = {path: i for i, path in enumerate(endpoints)}
+
+    def ordered(self) -> List[str]:
+        """返回本次请求应尝试的端点顺序（已熔断的端点被跳过）"""
+        now = time.monotonic()
+        available = [s for s in self._states.values() if s.open_until <= now]
+        if not available:
+            # 全部熔断时，放行冷却最早结束的一个作为半开探测
+            return [min(self._states.values(), key=lambda s: s.open_until).path]
+        available.sort(key=lambda s: (-s.score, s.latency if s.latency is not None else float("inf"), self._priority[s.path]))
+        return [s.path for s in available]
+
+    def record_success(self, path: str, latency: float):
+        state = self._states[path]
+        state.successes += 1
+        state.consecutive_failures = 0
+        state.open_until = 0.0
+        state.score = (1 - self.alpha) * state.score + self.alpha
+        state.latency = latency if state.latency is None else (1 - self.alpha) * state.latency + self.alpha * latency
+
+    def record_failure(self, path: str):
+        state = self._states[path]
+        state.failures += 1
+        state.consecutive_failures += 1
+        state.score = (1 - self.alpha) * state.score
+        if state.consecutive_failures >= self.failure_threshold:
+            state.open_until = time.monotonic() + self.cooldown
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            s.path: {
+                "score": round(s.score, 3),
+                "latency": round(s.latency, 3) if s.latency is not None else None,
+                "successes": s.successes,
+                "failures": s.failures,
+                "circuit_open": s.open_until > now,
+            }
+            for s in self._states.values()
+        }
@@ -0,0 +1,63 @@
+import json
+import uuid
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+# 当前请求/任务的ID，由HTTP中间件或任务worker设置，日志自动带上
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# LogRecord 自带的属性，其余通过 extra= 传入的字段会作为结构化字段输出
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id(value: Optional[str] = None) -> str:
+    """设置当前上下文的请求ID（未提供时生成一个），返回该ID"""
+    request_id = value or uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出一行JSON：时间、级别、模块、请求ID、消息以及 extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json"):
+    """配置根日志（重复调用不会重复添加handler）；fmt 为 json 或 text"""
+    root = logging.getLogger()
+    if any(getattr(handler, "_singing_handler", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._singing_handler = True
+    handler.addFilter(RequestIdFilter())
+    if fmt == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
@@ -0,0 +1,239 @@
+import time
+import bisect
+import functools
+import threading
+import asyncio
+from typing import Dict, Any, List, Tuple, Optional, Sequence
+
+# 默认的耗时分桶（秒）与字节数分桶（16KB ~ 64MB，按4倍递增）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(16 * 1024 * 4 ** i for i in range(7))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def track(self, **labels) -> "_InFlight":
+        """进行中的数量：进入时+1，退出时-1（上下文管理器或装饰器）"""
+        return _InFlight(self, labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数..., +Inf计数], 总和
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def time(self, **labels) -> "_Timer":
+        """记录代码块耗时（上下文管理器或装饰器）"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Scope:
+    """同时支持 with / async with / 装饰同步或异步函数的轻量作用域"""
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+    def __call__(self, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self._copy():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._copy():
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class _Timer(_Scope):
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started: Optional[float] = None
+        self.elapsed = 0.0
+
+    def _copy(self) -> "_Timer":
+        # 装饰器每次调用使用独立的计时状态，支持并发调用
+        return _Timer(self.histogram, self.labels)
+
+    def _start(self):
+        self.started = time.perf_counter()
+
+    def _stop(self):
+        self.elapsed = time.perf_counter() - self.started
+        self.histogram.observe(self.elapsed, **self.labels)
+
+
+class _InFlight(_Scope):
+    def __init__(self, gauge: Gauge, labels: Dict[str, Any]):
+        self.gauge = gauge
+        self.labels = labels
+
+    def _copy(self) -> "_InFlight":
+        return self
+
+    def _start(self):
+        self.gauge.inc(**self.labels)
+
+    def _stop(self):
+        self.gauge.dec(**self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 分析流水线指标
+STAGE_SECONDS = REGISTRY.histogram(
+    "singing_stage_duration_seconds",
+    "各处理阶段耗时（decode/resample/export/oss_put/sign_url/asr/local_analysis/report）",
+    ["stage"]
+)
+ASR_REQUEST_SECONDS = REGISTRY.histogram(
+    "singing_asr_request_duration_seconds", "每个ASR端点的请求耗时", ["endpoint", "outcome"]
+)
+FALLBACKS = REGISTRY.counter("singing_fallback_total", "回退路径触发次数", ["path"])
+DELIVERIES = REGISTRY.counter("singing_audio_delivery_total", "各音频交付方式的使用次数", ["strategy"])
+DEDUPLICATED = REGISTRY.counter("singing_dedup_total", "与进行中的相同请求合并的次数", ["name"])
+REJECTED = REGISTRY.counter("singing_rejected_total", "被准入控制拒绝的请求数（rate_limit 或阶段名）", ["reason"])
+IN_FLIGHT = REGISTRY.gauge("singing_in_flight", "正在进行中的操作数", ["stage"])
+SPOOL_BYTES = REGISTRY.gauge("singing_spool_bytes", "上传暂存区占用的字节数（memory/disk）", ["storage"])
+PAYLOAD_BYTES = REGISTRY.histogram("singing_payload_bytes", "各环节的数据大小（字节）", ["kind"], buckets=SIZE_BUCKETS)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "singing_http_request_duration_seconds", "HTTP请求耗时", ["method", "route", "status"]
+)
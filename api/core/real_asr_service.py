@@ -1,25 +1,103 @@
 import aiohttp
 import json
+import time
 import asyncio
 import random
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from app.core.endpoint_selector import EndpointSelector
+from app.core.admission import OverloadedError
+from app.core.log import get_logger
+from app.core.metrics import ASR_REQUEST_SECONDS, FALLBACKS
+
+logger = get_logger(__name__)
+
+# 可用的转写端点（初始尝试顺序）
+ASR_ENDPOINTS = [
+    "/api/v1/services/asr/transcription",
+    "/api/v1/recognize",
+    "/api/v1/tasks"
+]
 
 class RealASRService:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://dashscope.aliyuncs.com",
+        max_concurrency: int = 8,
+        connection_limit: int = 32,
+        connection_limit_per_host: int = 16,
+        keepalive_timeout: int = 30,
+        request_timeout: int = 30,
+        breaker_threshold: int = 3,
+        breaker_cooldown: float = 60.0,
+        hedge_delay: float = 0.0
+    ):
         self.api_key = api_key
-        self.base_url = "https://dashscope.aliyuncs.com"
+        self.base_url = base_url
         self.fallback_used = False
+        
+        # 连接池参数：整个进程共享一个 ClientSession，复用TCP/TLS连接
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # 限制同时进行的ASR请求数，避免突发流量耗尽连接
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        
+        # 记住可用端点并熔断持续失败的端点；hedge_delay>0 时并发竞速前两个端点
+        self.endpoint_selector = EndpointSelector(
+            ASR_ENDPOINTS,
+            failure_threshold=breaker_threshold,
+            cooldown=breaker_cooldown
+        )
+        self.hedge_delay = hedge_delay
+        
+        # 上游返回429时记录限流截止时间，所有端点都失败时据此返回503而不是智能模拟
+        self._throttled_until = 0.0
+    
+    async def start(self):
+        """创建共享的HTTP会话（由应用启动时调用）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+    
+    async def close(self):
+        """关闭共享的HTTP会话（由应用关闭时调用）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # 未经过应用启动流程（如脚本直接调用）时按需创建
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
     
     async def analyze_singing(self, audio_url: str) -> Dict[str, Any]:
         """完整的唱歌分析流程（带自动回退）"""
         try:
-            print("🎤 调用真实Fun-ASR API...")
-            
             # 1. 语音转写
             transcription_result = await self.transcribe_audio(audio_url)
             
+            if "retry_after" in transcription_result:
+                raise OverloadedError(
+                    "asr", transcription_result["retry_after"],
+                    f"ASR服务限流，请{transcription_result['retry_after']}秒后重试"
+                )
+            
             if "error" in transcription_result:
-                print("🔄 API转写失败，使用智能模拟")
+                logger.warning("API转写失败，使用智能模拟", extra={"error": transcription_result["error"]})
                 self.fallback_used = True
                 return await self.smart_fallback_analysis(audio_url)
             
@@ -32,16 +110,16 @@ class RealASRService:
                 "source": "real_api"
             }
             
+        except OverloadedError:
+            raise
         except Exception as e:
-            print(f"❌ 完整分析流程失败: {e}")
+            logger.error("完整分析流程失败，使用智能模拟", extra={"error": str(e)})
             self.fallback_used = True
             return await self.smart_fallback_analysis(audio_url)
     
     async def transcribe_audio(self, audio_url: str) -> Dict[str, Any]:
         """语音转写"""
         try:
-            print("🔊 开始语音转写...")
-            
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
@@ -59,58 +137,100 @@ class RealASRService:
                 }
             }
             
-            print(f"🔑 API Key: {self.api_key[:10]}...")
-            print(f"📁 音频URL: {audio_url[:80]}...")
-            
-            async with aiohttp.ClientSession() as session:
-                print("🚀 发送语音转写请求...")
+            session = await self._get_session()
+            async with self._semaphore:
+                # 按健康分排序的端点，优先尝试上次成功的
+                endpoints = self.endpoint_selector.ordered()
                 
-                # 尝试不同的API端点
-                endpoints = [
-                    "/api/v1/services/asr/transcription",
-                    "/api/v1/recognize", 
-                    "/api/v1/tasks"
-                ]
+                if self.hedge_delay > 0 and len(endpoints) >= 2:
+                    result = await self._hedged_request(session, endpoints[:2], headers, payload)
+                    if result is not None:
+                        return result
+                    endpoints = endpoints[2:]
                 
                 for endpoint in endpoints:
-                    try:
-                        print(f"🔄 尝试端点: {endpoint}")
-                        async with session.post(
-                            f"{self.base_url}{endpoint}",
-                            headers=headers,
-                            json=payload,
-                            timeout=30
-                        ) as response:
-                            
-                            print(f"📡 API响应状态: {response.status}")
-                            
-                            if response.status == 200:
-                                result = await response.json()
-                                print("✅ 语音转写成功")
-                                return result
-                            else:
-                                error_text = await response.text()
-                                print(f"❌ 端点 {endpoint} 失败: {error_text}")
-                                
-                    except Exception as e:
-                        print(f"❌ 端点 {endpoint} 异常: {e}")
-                        continue
+                    result = await self._request_endpoint(session, endpoint, headers, payload)
+                    if result is not None:
+                        return result
                 
-                # 所有端点都失败
+                # 所有端点都失败；期间被上游限流时交给调用方返回503
+                throttled = self._throttled_until - time.monotonic()
+                if throttled > 0:
+                    return {"error": "ASR服务限流", "retry_after": max(1, int(throttled + 0.999))}
                 return {"error": "所有API端点都失败"}
                         
         except asyncio.TimeoutError:
-            print("❌ API请求超时")
+            logger.error("ASR请求超时")
             return {"error": "请求超时"}
         except Exception as e:
-            print(f"❌ 语音转写异常: {e}")
+            logger.error("语音转写异常", extra={"error": str(e)})
             return {"error": str(e)}
     
+    async def _request_endpoint(self, session: aiohttp.ClientSession, endpoint: str,
+                                headers: Dict[str, str], payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """请求单个端点，成功返回结果，失败返回None并更新端点健康状态"""
+        started = time.monotonic()
+        try:
+            async with session.post(
+                f"{self.base_url}{endpoint}",
+                headers=headers,
+                json=payload
+            ) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    elapsed = time.monotonic() - started
+                    self.endpoint_selector.record_success(endpoint, elapsed)
+                    ASR_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, outcome="success")
+                    logger.info("语音转写成功", extra={"endpoint": endpoint, "seconds": round(elapsed, 3)})
+                    return result
+                else:
+                    if response.status == 429:
+                        self._throttled_until = max(
+                            self._throttled_until, time.monotonic() + _retry_after(response.headers.get("Retry-After"))
+                        )
+                    error_text = await response.text()
+                    logger.warning("ASR端点返回错误", extra={
+                        "endpoint": endpoint, "status": response.status, "error": error_text[:200]
+                    })
+                    
+        except asyncio.CancelledError:
+            # 竞速中被取消不算端点失败
+            ASR_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint=endpoint, outcome="cancelled")
+            raise
+        except Exception as e:
+            logger.warning("ASR端点异常", extra={"endpoint": endpoint, "error": str(e)})
+        
+        ASR_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint=endpoint, outcome="failure")
+        self.endpoint_selector.record_failure(endpoint)
+        return None
+    
+    async def _hedged_request(self, session: aiohttp.ClientSession, endpoints: list,
+                              headers: Dict[str, str], payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """先请求首选端点，hedge_delay 秒内未返回则同时请求备选端点，取最先成功的结果
+
+        调用方被取消或提前返回时，仍在进行的请求在 finally 中一并取消。
+        """
+        tasks = {asyncio.create_task(self._request_endpoint(session, endpoints[0], headers, payload))}
+        try:
+            done, tasks = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            for task in done:
+                if task.result() is not None:
+                    return task.result()
+            
+            tasks.add(asyncio.create_task(self._request_endpoint(session, endpoints[1], headers, payload)))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+    
     async def generate_singing_analysis(self, transcription_data: Dict[str, Any]) -> Dict[str, Any]:
         """基于转写结果生成唱歌分析"""
         try:
-            print("🎵 生成唱歌分析...")
-            
             # 从转写结果提取文本
             text = self._extract_text_from_transcription(transcription_data)
             
@@ -154,11 +274,10 @@ class RealASRService:
                 "source": "real_api"
             }
             
-            print("✅ 唱歌分析生成完成")
             return analysis
             
         except Exception as e:
-            print(f"❌ 分析生成失败: {e}")
+            logger.error("分析生成失败", extra={"error": str(e)})
             return {
                 "score": 70,
                 "feedback": "分析完成，但遇到一些小问题",
@@ -171,7 +290,7 @@ class RealASRService:
     
     async def smart_fallback_analysis(self, audio_url: str) -> Dict[str, Any]:
         """智能回退分析（当API失败时使用）"""
-        print("🎵 使用智能模拟分析...")
+        FALLBACKS.inc(path="smart_fallback_analysis")
         
         # 基于音频URL生成一些智能信息
         scores = {
@@ -229,3 +348,11 @@ class RealASRService:
                 return "未能提取文本内容"
         except:
             return "文本提取失败"
+
+
+def _retry_after(value: Optional[str], default: int = 5) -> int:
+    """解析 Retry-After 头（只支持秒数形式）"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,146 @@
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Union
+
+from app.core.audio_buffer import NormalizedAudio
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# 磁盘层每写入这么多条就批量删除一次过期行，避免只在被再次读取时才删、文件无限增长
+PURGE_EVERY_WRITES = 100
+
+
+def hash_audio(audio_data: Union[bytes, str, NormalizedAudio], user_level: str) -> str:
+    """计算音频内容（字节、文件路径或标准化PCM）+ 用户水平的哈希，作为缓存键"""
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(audio_data, str):
+        with open(audio_data, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    elif isinstance(audio_data, NormalizedAudio):
+        digest.update(audio_data.pcm)
+    else:
+        digest.update(audio_data)
+    digest.update(b"\0" + user_level.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """分析结果缓存：内存LRU（带TTL）+ 可选的SQLite磁盘层
+
+    内存层按条目数淘汰最久未使用的结果；磁盘层在进程重启后仍然有效，
+    命中时会回填到内存层。磁盘层的过期行在启动时和每 PURGE_EVERY_WRITES
+    次写入后批量删除。
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: int = 24 * 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS analysis_cache_expires ON analysis_cache (expires_at)"
+            )
+            self._purge_expired(time.time())
+            self._db.commit()
+
+    async def get(self, key: str, record_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """查询缓存，未命中返回None（record_miss=False 时未命中不计入统计）"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._db_get, key, now)
+            if row is not None:
+                expires_at, value = row
+                self._remember(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        if record_miss:
+            self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存（内存层立即生效，磁盘层在线程中写入）"""
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_set, key, value, expires_at)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_enabled": self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, value: Dict[str, Any], expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        return row[1], json.loads(row[0])
+
+    def _db_set(self, key: str, value: Dict[str, Any], expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            self._writes += 1
+            if self._writes % PURGE_EVERY_WRITES == 0:
+                self._purge_expired(time.time())
+            self._db.commit()
+
+    def _purge_expired(self, now: float) -> int:
+        """批量删除磁盘层的过期行（调用方负责加锁和提交），返回删除的行数"""
+        return self._db.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,)).rowcount
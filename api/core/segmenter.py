@@ -0,0 +1,66 @@
+from typing import List, Tuple
+
+import numpy as np
+
+# 能量分析的帧长（20ms）与判断乐句间停顿的平滑窗口（300ms）
+ENERGY_FRAME_SECONDS = 0.02
+PAUSE_WINDOW_SECONDS = 0.3
+
+
+def frame_energy(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """不重叠的20ms帧的RMS能量（直接reshape，不复制样本）"""
+    frame = max(int(sample_rate * ENERGY_FRAME_SECONDS), 1)
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:count * frame].reshape(count, frame).astype(np.float32)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def find_segments(samples: np.ndarray, sample_rate: int,
+                  target_seconds: float = 30, max_seconds: float = 45) -> List[Tuple[int, int]]:
+    """按乐句间的停顿把长音频切成若干段，返回 [(起始样本, 结束样本)]
+
+    每段不超过 max_seconds；切点选在 [target/2, max] 范围内平滑能量最低处
+    （即最接近换气/间奏的位置），离 target_seconds 越近越优先。
+    各段首尾相接，覆盖整段音频。target_seconds 大于 max_seconds 时按 max_seconds 处理。
+    """
+    if max_seconds <= 0:
+        raise ValueError(f"分段时长上限必须大于0: {max_seconds}")
+    # 目标超过上限时 [target/2, max] 可能为空，按上限切段
+    target_seconds = min(target_seconds, max_seconds)
+    total = len(samples)
+    max_samples = int(max_seconds * sample_rate)
+    if total <= max_samples:
+        return [(0, total)]
+
+    frame = max(int(sample_rate * ENERGY_FRAME_SECONDS), 1)
+    energy = frame_energy(samples, sample_rate)
+    # 滑动平均后，短暂的辅音间隙不会被当成乐句停顿
+    window = max(int(PAUSE_WINDOW_SECONDS / ENERGY_FRAME_SECONDS), 1)
+    smoothed = np.convolve(energy, np.ones(window, dtype=np.float32) / window, mode="same")
+    # 归一化到 [0, 1]，使距离惩罚与音量无关
+    smoothed = smoothed / (smoothed.max() or 1.0)
+
+    target_frames = int(target_seconds / ENERGY_FRAME_SECONDS)
+    # 每次至少前进一帧，切点区间也至少有一帧
+    min_frames = max(target_frames // 2, 1)
+    max_frames = max(int(max_seconds / ENERGY_FRAME_SECONDS), min_frames + 1)
+
+    segments = []
+    start_frame = 0
+    total_frames = len(energy)
+    while (total_frames - start_frame) * frame > max_samples:
+        low = start_frame + min_frames
+        # 给最后一段至少留下 min_frames，避免切出极短的尾段
+        high = min(start_frame + max_frames, total_frames - min_frames)
+        if high <= low:
+            # 只有上限短于两三帧时才会出现，剩下的部分整体作为最后一段
+            break
+        candidates = np.arange(low, high)
+        penalty = 0.1 * np.abs(candidates - (start_frame + target_frames)) / max(target_frames, 1)
+        cut = int(candidates[np.argmin(smoothed[low:high] + penalty)])
+        segments.append((start_frame * frame, cut * frame))
+        start_frame = cut
+    segments.append((start_frame * frame, total))
+    return segments
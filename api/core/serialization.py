@@ -0,0 +1,107 @@
+import json
+import zlib
+import base64
+from typing import Dict, Any, Optional
+
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 输出格式：json（数组为数字列表）/ compact（数组压缩编码后base64）/ msgpack（数组为二进制，由 Accept 协商）
+OUTPUT_FORMATS = ("json", "compact")
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+class FrameSeries:
+    """逐帧数据（基频曲线、能量包络等），按输出格式编码
+
+    values 为一维NumPy数组，precision 为需要保留的精度（同时是紧凑编码的量化步长）。
+    普通JSON中按精度取整输出为数字列表；紧凑编码为：
+        {"$frames": "i16-delta" | "f16", "scale": precision, "length": N, "data": ...}
+    i16-delta 为量化后的差分（int16小端），解码时累加再乘以 scale；差分超出 int16 时
+    退回 f16（float16小端）。字节数据均经 zlib 压缩（最快一级，逐帧差分再压缩收益很小），
+    JSON中再做 base64，msgpack中直接为二进制。
+    """
+
+    __slots__ = ("values", "precision")
+
+    def __init__(self, values: np.ndarray, precision: float = 0.1):
+        self.values = np.asarray(values)
+        self.precision = precision
+
+    def to_list(self) -> list:
+        decimals = max(0, int(np.ceil(-np.log10(self.precision))))
+        return np.round(self.values.astype(np.float64), decimals).tolist()
+
+    def pack(self) -> Dict[str, Any]:
+        """紧凑编码，data 为压缩后的字节"""
+        quantized = np.round(self.values.astype(np.float64) / self.precision)
+        deltas = np.diff(quantized, prepend=0.0)
+        if len(deltas) == 0 or np.abs(deltas).max() <= 32767:
+            kind, raw = "i16-delta", deltas.astype("<i2").tobytes()
+        else:
+            kind, raw = "f16", self.values.astype("<f2").tobytes()
+        return {
+            "$frames": kind,
+            "scale": self.precision,
+            "length": len(self.values),
+            "data": zlib.compress(raw, 1)
+        }
+
+
+def prepare(content: Any, output_format: str = "json") -> Any:
+    """把内容中的 FrameSeries 按输出格式换成可序列化的值（其余内容原样保留）"""
+    if isinstance(content, FrameSeries):
+        if output_format == "json":
+            return content.to_list()
+        packed = content.pack()
+        if output_format == "compact":
+            packed["data"] = base64.b64encode(packed["data"]).decode("ascii")
+        return packed
+    if isinstance(content, dict):
+        return {key: prepare(value, output_format) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [prepare(value, output_format) for value in content]
+    return content
+
+
+def negotiate_format(accept: Optional[str], requested: str = "json") -> str:
+    """Accept 中要求MessagePack（且已安装msgpack）时返回 msgpack，否则按请求的格式"""
+    if msgpack is not None and accept and any(media in accept for media in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    return requested if requested in OUTPUT_FORMATS else "json"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON序列化：优先用orjson（比标准库快数倍），未安装时退回 json"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def render(content: Any, output_format: str = "json", status_code: int = 200) -> Response:
+    """按输出格式生成响应（内容可以包含 FrameSeries）"""
+    prepared = prepare(content, output_format)
+    # 同一URL按 Accept 返回不同格式，缓存需要区分
+    headers = {"Vary": "Accept"}
+    if output_format == "msgpack":
+        body = msgpack.packb(prepared, use_bin_type=True, default=_default)
+        return Response(body, status_code=status_code, media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+    return Response(dumps(prepared), status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, TypeVar
+
+from app.core.log import get_logger
+from app.core.metrics import DEDUPLICATED
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻每个键只执行一次，所有调用方共享结果或异常
+
+    实际工作在独立的任务中执行，调用方通过 shield 等待它。某个调用方被取消
+    （例如首个请求的客户端断开）只会让它自己退出，其余调用方继续等待同一结果；
+    最后一个调用方也取消时才取消工作本身，不在没人需要结果时继续占用转码和ASR。
+    """
+
+    def __init__(self, name: str = "analysis"):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            DEDUPLICATED.inc(name=self.name)
+            logger.info("合并相同的并发请求", extra={"flight": self.name, "waiters": call.waiters + 1})
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # 正在取消的任务不能再被新的调用方加入
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "deduplicated": self.followers
+        }
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.done():
+            return
+        # 所有调用方都已取消时没人读取结果，避免 "exception was never retrieved" 警告
+        if not call.task.cancelled() and call.waiters == 0:
+            call.task.exception()
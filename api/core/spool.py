@@ -0,0 +1,336 @@
+import os
+import uuid
+import time
+import errno
+import shutil
+import asyncio
+import weakref
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Union, Set
+
+import aiofiles
+
+from app.core.admission import OverloadedError
+from app.core.log import get_logger
+from app.core.metrics import REJECTED, SPOOL_BYTES
+
+logger = get_logger(__name__)
+
+
+class SpoolFullError(OverloadedError):
+    """暂存区磁盘配额已满，调用方应返回503并带上Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("spool", retry_after, f"上传暂存区已满，请{retry_after}秒后重试")
+
+
+def default_spool_dir(disk_quota: int) -> str:
+    """优先使用 /dev/shm（tmpfs，读写不落盘）；容量装不下整个配额时（如容器默认的64MB）使用系统临时目录"""
+    shm = "/dev/shm"
+    try:
+        if os.access(shm, os.W_OK) and shutil.disk_usage(shm).total >= disk_quota:
+            return os.path.join(shm, "singing-spool")
+    except OSError:
+        pass
+    return os.path.join(tempfile.gettempdir(), "singing-spool")
+
+
+def _filesystem_type(path: str) -> Optional[str]:
+    """path 所在挂载点的文件系统类型（读取 /proc/mounts，非Linux返回None）"""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    for mount_point, kind in mounts:
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fs_type = mount_point, kind
+    return fs_type
+
+
+class SpooledUpload:
+    """暂存区中的一个上传：小文件是内存中的字节，大文件是暂存目录中的路径
+
+    release() 删除文件并归还配额，可以重复调用；持有者忘记释放时，对象被回收
+    （或进程正常退出）时兜底释放。
+    """
+
+    def __init__(self, spool: "UploadSpool", size: int, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.size = size
+        self.data = data
+        self.path = path
+        self._release = weakref.finalize(
+            self, spool._discard, path, size if path is None else 0, size if path is not None else 0
+        )
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """交给分析流程的输入：字节或文件路径"""
+        return self.data if self.path is None else self.path
+
+    @property
+    def released(self) -> bool:
+        return not self._release.alive
+
+    def release(self):
+        self._release()
+        self.data = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SpoolWriter:
+    """逐块接收一个上传：先放在内存中，超过阈值或内存额度不足时转存到暂存目录
+
+    落盘后每写一块都先预留磁盘配额，配额不足或磁盘写满时抛出 SpoolFullError。
+    """
+
+    def __init__(self, spool: "UploadSpool", suffix: str = "", in_memory: bool = True):
+        self.spool = spool
+        self.suffix = suffix
+        self.size = 0
+        self._buffer: Optional[bytearray] = bytearray() if in_memory else None
+        self._path: Optional[str] = None
+        self._file = None
+        self._disk = 0
+
+    async def write(self, chunk: bytes):
+        if self._buffer is not None:
+            if len(self._buffer) + len(chunk) <= self.spool.memory_threshold and self.spool._take_memory(len(chunk)):
+                self._buffer += chunk
+                self.size += len(chunk)
+                return
+        if self._file is None:
+            await self._spill()
+        await self._write_disk(chunk)
+        self.size += len(chunk)
+
+    async def finish(self) -> SpooledUpload:
+        """写入完成，返回 SpooledUpload（之后由它负责清理）"""
+        self.spool.received += 1
+        if self._buffer is not None:
+            data, self._buffer = bytes(self._buffer), None
+            self.spool.memory_files += 1
+            return SpooledUpload(self.spool, len(data), data=data)
+        if self._file is None:
+            # 空上传且不允许放在内存中
+            await self._spill()
+        await self._file.close()
+        self._file = None
+        upload = SpooledUpload(self.spool, self._disk, path=self._path)
+        self._path = None
+        return upload
+
+    async def abort(self):
+        """中止接收，删除已写入的内容并归还配额"""
+        if self._buffer is not None:
+            self.spool._give_back(memory=len(self._buffer))
+            self._buffer = None
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        if self._path is not None:
+            self.spool._discard(self._path, 0, self._disk)
+            self._path = None
+
+    async def _spill(self):
+        self._path = self.spool._new_path(self.suffix)
+        self._file = await aiofiles.open(self._path, "wb")
+        if self._buffer is not None:
+            buffered, self._buffer = bytes(self._buffer), None
+            self.spool.spilled += 1
+            self.spool._give_back(memory=len(buffered))
+            if buffered:
+                await self._write_disk(buffered)
+
+    async def _write_disk(self, chunk: bytes):
+        self.spool._take_disk(len(chunk))
+        self._disk += len(chunk)
+        try:
+            await self._file.write(chunk)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            self.spool.rejected += 1
+            REJECTED.inc(reason="spool")
+            logger.warning("暂存目录所在磁盘已满", extra={"directory": self.spool.directory})
+            raise SpoolFullError(self.spool.retry_after)
+
+
+class UploadSpool:
+    """上传暂存区：小上传放在内存中，大上传写入暂存目录（默认优先tmpfs）
+
+    内存和磁盘分别有总额度：内存额度用完时新上传直接落盘，磁盘配额用完时拒绝上传
+    （SpoolFullError -> 503），不让临时文件无限堆积。每个上传由持有它的请求或任务
+    在结束时释放；后台清理任务定期删除暂存目录中超过 max_age 秒、且不属于本进程
+    在用上传的文件（进程崩溃或被杀死时遗留的）。多个worker进程共用同一目录时，
+    配额按进程分别计算。
+    """
+
+    def __init__(self, directory: str = "", memory_threshold: int = 1024 * 1024,
+                 memory_limit: int = 64 * 1024 * 1024, disk_quota: int = 1024 * 1024 * 1024,
+                 max_age: float = 3600, sweep_interval: float = 300, retry_after: int = 10):
+        self.directory = directory or default_spool_dir(disk_quota)
+        self.memory_threshold = memory_threshold
+        self.memory_limit = memory_limit
+        self.disk_quota = disk_quota
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self.retry_after = retry_after
+        os.makedirs(self.directory, exist_ok=True)
+        self.filesystem = _filesystem_type(self.directory)
+
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.memory_files = 0
+        self.received = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.swept = 0
+        self._files: Set[str] = set()
+        # 额度在事件循环和线程（zip解压）中都会修改
+        self._lock = threading.Lock()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def writer(self, suffix: str = "", expected_size: Optional[int] = None, in_memory: bool = True) -> SpoolWriter:
+        """开始接收一个上传；已知大小且超过内存阈值时直接落盘，并先确认配额装得下"""
+        if expected_size is not None and expected_size > self.memory_threshold:
+            self._check_disk(expected_size)
+            in_memory = False
+        return SpoolWriter(self, suffix, in_memory)
+
+    def allocate(self, suffix: str, size: int) -> SpooledUpload:
+        """为即将写入的 size 字节文件预留配额并返回其路径（由调用方写入，可在线程中调用）"""
+        self._take_disk(size)
+        return SpooledUpload(self, size, path=self._new_path(suffix))
+
+    async def start(self):
+        """清理上次运行遗留的文件并启动后台清理任务"""
+        await asyncio.to_thread(self.sweep)
+        if self.sweep_interval > 0 and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    def sweep(self) -> int:
+        """删除暂存目录中超过 max_age 秒且不在使用中的文件，返回删除的数量（阻塞调用）"""
+        cutoff = time.time() - self.max_age
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        for entry in entries:
+            with self._lock:
+                if entry.path in self._files:
+                    continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except OSError:
+                # 可能已被其他worker删除
+                continue
+        if removed:
+            self.swept += removed
+            logger.info("已清理遗留的暂存文件", extra={"directory": self.directory, "files": removed})
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            disk_files = len(self._files)
+        return {
+            "directory": self.directory,
+            "filesystem": self.filesystem,
+            "memory": {
+                "files": self.memory_files,
+                "bytes": self.memory_bytes,
+                "limit": self.memory_limit,
+                "threshold": self.memory_threshold
+            },
+            "disk": {"files": disk_files, "bytes": self.disk_bytes, "quota": self.disk_quota},
+            "received": self.received,
+            "spilled": self.spilled,
+            "rejected": self.rejected,
+            "swept": self.swept
+        }
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.warning("清理暂存目录失败", extra={"directory": self.directory, "error": str(e)})
+
+    def _new_path(self, suffix: str) -> str:
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+        with self._lock:
+            self._files.add(path)
+        return path
+
+    def _take_memory(self, size: int) -> bool:
+        with self._lock:
+            if self.memory_bytes + size > self.memory_limit:
+                return False
+            self.memory_bytes += size
+        SPOOL_BYTES.inc(size, storage="memory")
+        return True
+
+    def _check_disk(self, size: int):
+        if self.disk_bytes + size > self.disk_quota:
+            self.rejected += 1
+            REJECTED.inc(reason="spool")
+            logger.warning("上传暂存区配额已满", extra={"disk_bytes": self.disk_bytes, "requested": size})
+            raise SpoolFullError(self.retry_after)
+
+    def _take_disk(self, size: int):
+        with self._lock:
+            self._check_disk(size)
+            self.disk_bytes += size
+        SPOOL_BYTES.inc(size, storage="disk")
+
+    def _give_back(self, memory: int = 0, disk: int = 0):
+        with self._lock:
+            self.memory_bytes -= memory
+            self.disk_bytes -= disk
+        if memory:
+            SPOOL_BYTES.dec(memory, storage="memory")
+        if disk:
+            SPOOL_BYTES.dec(disk, storage="disk")
+
+    def _discard(self, path: Optional[str], memory: int, disk: int):
+        """释放一个上传占用的额度，并删除其文件"""
+        if path is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # 留给后台清理任务
+                logger.warning("删除暂存文件失败", extra={"path": path, "error": str(e)})
+        with self._lock:
+            if path is not None:
+                self._files.discard(path)
+            else:
+                self.memory_files -= 1
+        self._give_back(memory, disk)
@@ -0,0 +1,148 @@
+import os
+import io
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Union, Callable
+
+from app.core.audio_buffer import NormalizedAudio, normalize_samples
+from app.core.decoding import is_wav, decode_wav, decode_with_ffmpeg, ffmpeg_available
+from app.core.admission import OverloadedError
+from app.core.metrics import IN_FLIGHT
+
+
+class TranscoderBusyError(OverloadedError):
+    """转码队列已满，调用方应返回503并带上Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("transcode", retry_after, f"转码队列已满，请{retry_after}秒后重试")
+
+
+def decode_audio(audio_data: Union[bytes, str], max_duration_ms: int = 600 * 1000) -> NormalizedAudio:
+    """解码一次并直接得到16kHz单声道PCM（在子进程中运行，必须保持可pickle）
+
+    WAV（录音端最常见的格式）直接解析文件头并映射样本，不启动任何子进程；其他格式
+    通过ffmpeg管道直接解码成16kHz单声道，不写临时文件。两者都失败时（少见的WAV编码、
+    管道输入无法解析的封装等）再交给pydub。
+    子进程中无法直接更新指标，各阶段耗时放在返回值的 timings 中由调用方记录。
+    """
+    max_seconds = max_duration_ms / 1000
+    started = time.perf_counter()
+    errors = []
+    if _looks_like_wav(audio_data):
+        try:
+            samples, original, truncated = decode_wav(audio_data, max_seconds)
+            original["decoder"] = "native"
+            timings = {"decode": time.perf_counter() - started}
+            return NormalizedAudio(samples, original=original, truncated=truncated, timings=timings)
+        except ValueError as e:
+            errors.append(str(e))
+
+    if ffmpeg_available():
+        try:
+            samples, original, truncated = decode_with_ffmpeg(audio_data, max_seconds)
+            original["decoder"] = "ffmpeg"
+            timings = {"decode": time.perf_counter() - started}
+            return NormalizedAudio(samples, original=original, truncated=truncated, timings=timings)
+        except (OSError, ValueError) as e:
+            errors.append(str(e))
+
+    try:
+        return decode_audio_pydub(audio_data, max_duration_ms)
+    except Exception as e:
+        raise ValueError("; ".join(errors + [str(e)])) from e
+
+
+def decode_audio_pydub(audio_data: Union[bytes, str], max_duration_ms: int = 600 * 1000) -> NormalizedAudio:
+    """经pydub解码（旧路径，作为兜底；也供解码基准做对比）"""
+    from pydub import AudioSegment
+
+    started = time.perf_counter()
+    source = audio_data if isinstance(audio_data, str) else io.BytesIO(audio_data)
+    audio = AudioSegment.from_file(source)
+    original_info = {
+        "duration": len(audio) / 1000,
+        "channels": audio.channels,
+        "frame_rate": audio.frame_rate,
+        "decoder": "pydub",
+    }
+
+    # 24位等少见位宽先统一成16位
+    if audio.sample_width not in (1, 2, 4):
+        audio = audio.set_sample_width(2)
+
+    # 超过解码上限时只取前 max_duration_ms（在样本视图上截取，不复制）
+    max_frames = int(audio.frame_rate * max_duration_ms / 1000)
+    truncated = audio.frame_count() > max_frames
+
+    decoded = time.perf_counter()
+    samples = normalize_samples(
+        audio.raw_data, audio.sample_width, audio.channels, audio.frame_rate, max_frames
+    )
+    timings = {"decode": decoded - started, "resample": time.perf_counter() - decoded}
+    return NormalizedAudio(samples, original=original_info, truncated=truncated, timings=timings)
+
+
+def _looks_like_wav(audio_data: Union[bytes, str]) -> bool:
+    if isinstance(audio_data, str):
+        try:
+            with open(audio_data, "rb") as f:
+                return is_wav(f.read(12))
+        except OSError:
+            return False
+    return is_wav(audio_data[:12])
+
+
+class TranscodePool:
+    """有界进程池转码引擎
+
+    最多 max_workers 个任务并行执行，另外最多 max_queue 个任务排队；
+    超出时立即抛出 TranscoderBusyError，而不是无限堆积请求。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 8, retry_after: int = 5):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """在进程池中执行 func(*args)，不阻塞事件循环"""
+        if self._pending >= self.capacity:
+            raise TranscoderBusyError(self.retry_after)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with IN_FLIGHT.track(stage="transcode"):
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+        except BrokenProcessPool:
+            # 子进程异常退出（如被OOM杀掉），下次调用时重建进程池
+            self._executor = None
+            raise
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "queued": max(0, self._pending - self.max_workers),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -1,46 +1,514 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, Query, HTTPException, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
+from typing import Optional, Dict, Any, List, Tuple
+import io
+import os
+import json
+import time
+import asyncio
 
 from app.services.analysis_service import AnalysisService
+from app.services.job_service import JobService, JobQueueFullError, MemoryJobStore, SQLiteJobStore
+from app.services.batch_service import BatchService
+from app.services.history_service import HistoryStore, TREND_METRICS
+from app.services.melody_compare import ReferenceLibrary
+from app.services.melody_index import MelodyIndex
+from app.services.live_analysis import LiveSession
 from app.core.cloud_services import CloudServiceManager
+from app.core.admission import RateLimiter, RateLimitedError, OverloadedError
+from app.core.result_cache import ResultCache
+from app.core.spool import UploadSpool, SpooledUpload
+from app.core.codecs import mime_type_for
+from app.core.serialization import OUTPUT_FORMATS, negotiate_format, render
 from app.core.config import settings
+from app.core.log import configure_logging, get_logger, new_request_id
+from app.core.metrics import REGISTRY, FALLBACKS, HTTP_REQUEST_SECONDS, PAYLOAD_BYTES
+from app.utils.upload import receive_upload, extract_zip_audio, AUDIO_EXTENSIONS
+
+configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+logger = get_logger(__name__)
 
 router = APIRouter()
 
 # 初始化服务
 cloud_manager = CloudServiceManager(settings)
-analysis_service = AnalysisService(cloud_manager)
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl=settings.RESULT_CACHE_TTL,
+    db_path=settings.RESULT_CACHE_DB_PATH or None
+)
+history_store = HistoryStore(
+    settings.HISTORY_DB_PATH,
+    batch_size=settings.HISTORY_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_pending=settings.HISTORY_MAX_PENDING
+) if settings.HISTORY_DB_PATH else None
+reference_library = ReferenceLibrary.load(
+    settings.REFERENCE_MELODIES_PATH, settings.REFERENCE_DTW_BAND_SECONDS
+) if settings.REFERENCE_MELODIES_PATH else None
+
+def load_song_index() -> Optional[MelodyIndex]:
+    """打开识曲索引（内存映射），文件缺失或格式不对时只记录警告，识曲功能关闭"""
+    if not settings.SONG_INDEX_PATH:
+        return None
+    try:
+        return MelodyIndex(settings.SONG_INDEX_PATH)
+    except (OSError, ValueError) as e:
+        logger.warning("识曲索引不可用，已关闭识曲功能", extra={"path": settings.SONG_INDEX_PATH, "error": str(e)})
+        return None
+
+song_index = load_song_index()
+analysis_service = AnalysisService(cloud_manager, result_cache, history_store, reference_library, song_index)
+job_service = JobService(
+    analysis_service,
+    store=SQLiteJobStore(settings.JOB_STORE_PATH) if settings.JOB_STORE_PATH else MemoryJobStore(),
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_MAX_QUEUE,
+    retry_after=settings.JOB_RETRY_AFTER
+)
+batch_service = BatchService(analysis_service, max_concurrency=settings.BATCH_MAX_CONCURRENCY)
+rate_limiter = RateLimiter(
+    per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    burst=settings.RATE_LIMIT_BURST,
+    max_clients=settings.RATE_LIMIT_MAX_CLIENTS
+)
+upload_spool = UploadSpool(
+    settings.UPLOAD_SPOOL_DIR,
+    memory_threshold=settings.UPLOAD_SPOOL_MEMORY_THRESHOLD,
+    memory_limit=settings.UPLOAD_SPOOL_MEMORY_LIMIT,
+    disk_quota=settings.UPLOAD_SPOOL_DISK_QUOTA,
+    max_age=settings.UPLOAD_SPOOL_MAX_AGE,
+    sweep_interval=settings.UPLOAD_SPOOL_SWEEP_INTERVAL,
+    retry_after=settings.UPLOAD_SPOOL_RETRY_AFTER
+)
+live_stats = {"active": 0, "total": 0}
+
+@router.on_event("startup")
+async def startup_services():
+    await cloud_manager.start()
+    await upload_spool.start()
+    if history_store is not None:
+        await history_store.start()
+    await job_service.start()
+
+@router.on_event("shutdown")
+async def shutdown_services():
+    await job_service.stop()
+    await upload_spool.stop()
+    if history_store is not None:
+        await history_store.stop()
+    await cloud_manager.close()
+    result_cache.close()
+
+def service_stats() -> Dict[str, Any]:
+    """各服务组件的运行状态（供 /api/health 使用）"""
+    stats = {
+        "readiness": cloud_manager.readiness(),
+        "result_cache": result_cache.stats(),
+        "single_flight": analysis_service.single_flight.stats(),
+        "jobs": job_service.stats(),
+        "history": history_store.stats() if history_store is not None else {"enabled": False},
+        "song_index": song_index.stats() if song_index is not None else {"enabled": False},
+        "admission": {"rate_limit": rate_limiter.stats(), **cloud_manager.admission_stats()},
+        "spool": upload_spool.stats(),
+        "live_sessions": dict(live_stats)
+    }
+    asr_service = getattr(cloud_manager, "asr_service", None)
+    if asr_service is not None:
+        stats["asr_endpoints"] = asr_service.endpoint_selector.stats()
+    return stats
+
+async def observe_request(request: Request, call_next):
+    """HTTP中间件（由 main.py 注册）：绑定请求ID并记录请求耗时
+
+    客户端传入 X-Request-ID 时沿用，否则生成新的；响应头中返回该ID。
+    """
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        # 按路由模板统计，避免 /api/jobs/{job_id} 之类的路径产生大量标签
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=status
+        )
+
+def client_address(request: Request) -> str:
+    """限流使用的客户端标识（部署在反向代理后时按 X-Forwarded-For 识别）"""
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def admit_request(request: Request, cost: int = 1):
+    """按客户端令牌桶限流（也供 main.py 的 /api/upload-audio 使用），超限时返回429"""
+    client = client_address(request)
+    try:
+        rate_limiter.check(client, cost)
+    except RateLimitedError as e:
+        logger.warning("请求被限流", extra={"client": client, "retry_after": e.retry_after})
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def overloaded_response(e: OverloadedError) -> HTTPException:
+    """阶段满载时的503响应"""
+    logger.warning("服务繁忙，拒绝请求", extra={"stage": e.stage, "retry_after": e.retry_after})
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def spool_upload(upload: UploadFile) -> SpooledUpload:
+    """把上传接收到暂存区（也供 main.py 使用），暂存区已满时返回503；调用方负责 release"""
+    ext = os.path.splitext((upload.filename or "").lower())[1]
+    try:
+        return await receive_upload(upload, upload_spool, ext)
+    except OverloadedError as e:
+        raise overloaded_response(e)
+
+async def spool_zip_audio(archive: SpooledUpload, max_files: int) -> List[Tuple[str, SpooledUpload]]:
+    """把暂存区中zip里的音频解压到暂存区，每个文件解压前预留配额"""
+    allocated: List[SpooledUpload] = []
+
+    def target_path(size: int, ext: str) -> str:
+        entry = upload_spool.allocate(ext, size)
+        allocated.append(entry)
+        return entry.path
+
+    source = io.BytesIO(archive.data) if archive.in_memory else archive.path
+    try:
+        extracted = await asyncio.to_thread(extract_zip_audio, source, target_path, max_files)
+    except BaseException as e:
+        for entry in allocated:
+            entry.release()
+        if isinstance(e, OverloadedError):
+            raise overloaded_response(e)
+        raise
+    return [(filename, entry) for (filename, _), entry in zip(extracted, allocated)]
+
+def check_song_id(song_id: Optional[str]):
+    """请求指定了参考歌曲时，确认曲库中有这首歌"""
+    if not song_id:
+        return
+    if reference_library is None or song_id not in reference_library.melodies:
+        raise HTTPException(status_code=400, detail=f"未知的参考歌曲: {song_id}")
+
+def check_output_format(output_format: str):
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {output_format}")
+
+def record_fallback(path: str):
+    """记录一次回退（供 main.py 中的模拟分析使用）"""
+    FALLBACKS.inc(path=path)
+
+@router.get("/metrics")
+@router.get("/api/metrics")
+async def metrics():
+    """
+    Prometheus 格式的运行指标
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/api/delivery/{token}")
+async def delivered_audio(token: str):
+    """
+    本地文件交付方式下，供ASR下载处理后的音频（分析结束后即删除）
+    """
+    delivery = cloud_manager.deliveries.get("local")
+    path = delivery.path_for(token) if delivery is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="音频不存在或已过期")
+    return FileResponse(path, media_type=mime_type_for(os.path.splitext(token)[1]))
 
 @router.post("/analyze")
 async def analyze_singing(
+    request: Request,
     audio_file: UploadFile = File(..., description="音频文件 (支持 wav, mp3)"),
-    user_level: str = Form("beginner", description="用户水平: beginner, intermediate, advanced")
+    user_level: str = Form("beginner", description="用户水平: beginner, intermediate, advanced"),
+    user_id: Optional[str] = Form(None, description="用户ID（可选，提供时记录分析历史并参考历史表现）"),
+    song_id: Optional[str] = Form(None, description="参考歌曲ID（可选，提供时与参考旋律逐音符比对）"),
+    include_frames: bool = Form(False, description="是否返回逐帧基频和能量曲线（10ms一帧）"),
+    output_format: str = Form("json", description=f"输出格式: {', '.join(OUTPUT_FORMATS)}；"
+                                                  "Accept 为 application/msgpack 时返回MessagePack")
 ):
     """
     分析唱歌音频，返回详细报告
     """
+    admit_request(request)
+    check_song_id(song_id)
+    check_output_format(output_format)
     try:
         # 验证文件类型
         if not audio_file.content_type.startswith('audio/'):
             raise HTTPException(status_code=400, detail="请上传音频文件")
         
-        # 读取文件
-        audio_data = await audio_file.read()
-        print(f"收到音频文件: {audio_file.filename}, 大小: {len(audio_data)} 字节")
-        
-        # 分析
-        result = await analysis_service.comprehensive_analysis(audio_data, user_level)
+        # 分块接收到暂存区（小文件留在内存中），请求结束时释放
+        with await spool_upload(audio_file) as upload:
+            PAYLOAD_BYTES.observe(upload.size, kind="upload")
+            logger.info("收到音频文件", extra={
+                "upload_name": audio_file.filename, "bytes": upload.size, "in_memory": upload.in_memory
+            })
+            
+            # 分析
+            result = await analysis_service.comprehensive_analysis(
+                upload.source, user_level, user_id=user_id, song_id=song_id, include_frames=include_frames
+            )
         
-        return {
+        return render({
             "success": True,
             "data": result,
             "message": "分析完成"
-        }
+        }, negotiate_format(request.headers.get("accept"), output_format))
         
+    except HTTPException:
+        raise
+    except OverloadedError as e:
+        raise overloaded_response(e)
     except Exception as e:
-        print(f"分析错误: {str(e)}")
+        logger.exception("分析失败")
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
+@router.post("/api/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    audio_file: UploadFile = File(..., description="音频文件 (支持 wav, mp3)"),
+    user_level: str = Form("beginner", description="用户水平: beginner, intermediate, advanced"),
+    user_id: Optional[str] = Form(None, description="用户ID（可选，提供时记录分析历史并参考历史表现）"),
+    song_id: Optional[str] = Form(None, description="参考歌曲ID（可选，提供时与参考旋律逐音符比对）")
+):
+    """
+    提交异步分析任务，立即返回任务ID
+    """
+    admit_request(request)
+    check_song_id(song_id)
+    if not audio_file.content_type.startswith('audio/'):
+        raise HTTPException(status_code=400, detail="请上传音频文件")
+    
+    upload = await spool_upload(audio_file)
+    try:
+        job = await job_service.submit(upload, user_level, audio_file.filename or "", user_id, song_id)
+    except JobQueueFullError as e:
+        upload.release()
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    return {
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events"
+    }
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    查询任务状态和结果
+    """
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    以SSE推送任务进度，任务结束后关闭连接
+    """
+    if await job_service.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    async def event_stream():
+        async for job in job_service.events(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {job['status']}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/batch-analyze")
+async def batch_analyze(
+    request: Request,
+    files: List[UploadFile] = File(..., description="多个音频文件，或一个包含音频的zip"),
+    user_level: str = Form("beginner", description="用户水平: beginner, intermediate, advanced"),
+    user_id: Optional[str] = Form(None, description="用户ID（可选，提供时记录分析历史并参考历史表现）"),
+    song_id: Optional[str] = Form(None, description="参考歌曲ID（可选，提供时与参考旋律逐音符比对）")
+):
+    """
+    批量分析，按完成顺序以NDJSON逐行返回每个文件的结果，最后一行为汇总（含吞吐量）
+    """
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"文件数量过多，最多{settings.BATCH_MAX_FILES}个")
+    # 批量请求按文件数消耗令牌
+    admit_request(request, cost=len(files))
+    check_song_id(song_id)
+    
+    items: List[Tuple[str, SpooledUpload]] = []
+    try:
+        for upload in files:
+            ext = os.path.splitext((upload.filename or "").lower())[1]
+            if ext == ".zip":
+                with await spool_upload(upload) as archive:
+                    items.extend(await spool_zip_audio(archive, settings.BATCH_MAX_FILES - len(items)))
+            elif ext in AUDIO_EXTENSIONS:
+                items.append((upload.filename, await spool_upload(upload)))
+            else:
+                raise HTTPException(status_code=400, detail=f"不支持的文件格式 {ext}: {upload.filename}")
+        
+        if not items:
+            raise HTTPException(status_code=400, detail="没有找到可分析的音频文件")
+    except BaseException:
+        for _, item in items:
+            item.release()
+        raise
+    
+    async def ndjson_stream():
+        try:
+            async for record in batch_service.run(items, user_level, user_id, song_id):
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端中途断开时，还没开始分析的文件在这里释放
+            for _, item in items:
+                item.release()
+    
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+@router.post("/api/identify-song")
+async def identify_song(
+    request: Request,
+    audio_file: UploadFile = File(..., description="音频文件 (支持 wav, mp3)"),
+    top_k: int = Form(5, ge=1, le=50, description="返回的候选数量")
+):
+    """
+    哼唱识曲：只做本地基频提取和指纹查找，不调用云服务
+    """
+    if song_index is None:
+        raise HTTPException(status_code=503, detail="识曲功能未启用")
+    admit_request(request)
+    if not audio_file.content_type.startswith('audio/'):
+        raise HTTPException(status_code=400, detail="请上传音频文件")
+    
+    with await spool_upload(audio_file) as upload:
+        try:
+            result = await analysis_service.identify_song(upload.source, top_k)
+        except OverloadedError as e:
+            raise overloaded_response(e)
+    if result is None:
+        raise HTTPException(status_code=400, detail="无法解码音频或提取音高")
+    return {"success": True, "data": result}
+
+@router.get("/api/reference-songs")
+async def reference_songs():
+    """
+    可用于逐音符比对的参考歌曲
+    """
+    return {"songs": reference_library.songs() if reference_library is not None else []}
+
+@router.get("/api/history")
+async def analysis_history(
+    request: Request,
+    user_id: str,
+    limit: int = Query(20, ge=1, le=200, description="返回最近的分析次数"),
+    days: int = Query(30, ge=1, le=366, description="趋势统计的天数"),
+    metric: str = Query("pitch_accuracy", description=f"趋势指标: {', '.join(TREND_METRICS)}"),
+    tz_offset: int = Query(480, description="划分日期使用的时区偏移（分钟），默认东八区"),
+    include_contour: bool = Query(False, description="是否返回逐帧基频曲线（数据较大）"),
+    output_format: str = Query("json", alias="format", description=f"输出格式: {', '.join(OUTPUT_FORMATS)}")
+):
+    """
+    用户的分析历史：最近几次分析的分数，以及某项分数按天的变化趋势
+    """
+    if history_store is None or not history_store.enabled:
+        raise HTTPException(status_code=503, detail="历史记录功能未启用")
+    if metric not in TREND_METRICS:
+        raise HTTPException(status_code=400, detail=f"不支持的指标: {metric}")
+    check_output_format(output_format)
+    
+    sessions, trend = await asyncio.gather(
+        history_store.recent(user_id, limit, include_contour),
+        history_store.trend(user_id, metric, days, tz_offset)
+    )
+    return render({
+        "user_id": user_id,
+        "sessions": sessions,
+        "trend": {"metric": metric, "days": days, "points": trend}
+    }, negotiate_format(request.headers.get("accept"), output_format))
+
+@router.websocket("/api/ws/live")
+async def live_analysis(websocket: WebSocket):
+    """
+    实时演唱分析
+    
+    连接后可先发送JSON配置 {"sample_rate": 48000, "format": "pcm_s16le" 或 "pcm_f32le"}
+    （采样率 8000-192000Hz），之后逐块发送单声道PCM二进制数据（每条不超过
+    LIVE_MAX_CHUNK_BYTES），每块返回一条包含新帧音高、起音点和运行评分的JSON；
+    发送 {"type": "stop"} 结束并返回最终评分。
+    """
+    if live_stats["active"] >= settings.LIVE_MAX_SESSIONS:
+        await websocket.close(code=1013, reason="实时分析会话已满，请稍后重试")
+        return
+    
+    await websocket.accept()
+    live_stats["active"] += 1
+    live_stats["total"] += 1
+    session = LiveSession()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            chunk = message.get("bytes")
+            if chunk is not None:
+                if len(chunk) > settings.LIVE_MAX_CHUNK_BYTES:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": f"音频块过大（{len(chunk)}字节），每条不超过{settings.LIVE_MAX_CHUNK_BYTES}字节"
+                    })
+                elif len(chunk) > settings.LIVE_THREAD_CHUNK_BYTES:
+                    await websocket.send_json(await asyncio.to_thread(session.process_chunk, chunk))
+                else:
+                    await websocket.send_json(session.process_chunk(chunk))
+                continue
+            
+            try:
+                control = json.loads(message.get("text") or "{}")
+                if not isinstance(control, dict):
+                    raise ValueError("必须是JSON对象")
+                if control.get("type") == "stop":
+                    await websocket.send_json({"type": "final", "running": session.running_scores()})
+                    await websocket.close()
+                    break
+                session = LiveSession(
+                    sample_rate=int(control.get("sample_rate", 16000)),
+                    sample_format=control.get("format", "pcm_s16le")
+                )
+                await websocket.send_json({"type": "ready", "sample_rate": session.sample_rate})
+            except (ValueError, TypeError) as e:
+                # json.JSONDecodeError 是 ValueError 的子类；int() 收到列表等类型时为 TypeError
+                await websocket.send_json({"type": "error", "message": f"无效的控制消息: {e}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_stats["active"] -= 1
+
 @router.get("/")
 async def root():
     return {"message": "AI唱歌分析API服务运行中"}
@@ -1,12 +1,17 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-import aiofiles
 import os
 import uuid
+import logging
 from typing import Optional
 import tempfile
 
+from utils.upload import save_upload_file, UploadSizeLimitMiddleware
+
+# 日志格式和请求ID由 endpoints 中的 configure_logging / observe_request 统一配置
+logger = logging.getLogger(__name__)
+
 # 导入您现有的服务
 try:
     from services.audio_service import process_audio
@@ -14,12 +19,28 @@ try:
     from core.cloud_services import upload_to_oss, call_funasr_api
     HAS_SERVICES = True
 except ImportError as e:
-    print(f"导入服务模块失败: {e}")
+    logger.warning("导入服务模块失败: %s", e)
     HAS_SERVICES = False
 
+# 导入分析路由（/analyze，基于 AnalysisService）
+try:
+    from endpoints import (
+        router as analysis_router, service_stats, observe_request, record_fallback, admit_request, spool_upload
+    )
+    HAS_ANALYSIS_ROUTER = True
+except ImportError as e:
+    logger.warning("导入分析路由失败: %s", e)
+    HAS_ANALYSIS_ROUTER = False
+
 # 创建FastAPI应用
 app = FastAPI(title="AI唱歌分析API")
 
+# 单文件上传接口在解析表单之前检查请求大小（批量接口按每个文件分别限制）
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=("/api/upload-audio", "/analyze", "/api/jobs", "/api/identify-song"),
+)
+
 # 重要：CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -29,18 +50,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if HAS_ANALYSIS_ROUTER:
+    app.include_router(analysis_router)
+    app.middleware("http")(observe_request)
+
 @app.get("/")
 async def root():
     return {"message": "AI唱歌分析API服务运行中"}
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "AI唱歌分析API", "has_services": HAS_SERVICES}
+    health = {"status": "healthy", "service": "AI唱歌分析API", "has_services": HAS_SERVICES}
+    if HAS_ANALYSIS_ROUTER:
+        health.update(service_stats())
+    return health
 
 @app.post("/api/upload-audio")
-async def upload_audio(file: UploadFile = File(...)):
+async def upload_audio(request: Request, file: UploadFile = File(...)):
+    if HAS_ANALYSIS_ROUTER:
+        admit_request(request)
+    upload = None
+    temp_file_path = None
     try:
-        print(f"开始处理文件: {file.filename}")
+        logger.info("开始处理文件", extra={"upload_name": file.filename})
         
         # 检查文件类型
         allowed_extensions = ['.mp3', '.wav', '.m4a', '.ogg', '.mpeg']
@@ -51,33 +83,25 @@ async def upload_audio(file: UploadFile = File(...)):
                 detail=f"不支持的文件格式 {file_ext}，请上传MP3、WAV、M4A格式"
             )
         
-        # 读取文件内容并检查大小
-        content = await file.read()
-        file_size = len(content)
-        print(f"文件大小: {file_size} bytes")
-        
-        # 50MB限制
-        if file_size > 50 * 1024 * 1024:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"文件太大 ({file_size/1024/1024:.1f}MB)，请选择小于50MB的文件"
-            )
-        
         # 生成唯一文件名
         unique_filename = f"{uuid.uuid4()}{file_ext}"
-        temp_file_path = os.path.join(tempfile.gettempdir(), unique_filename)
-        
-        # 保存文件到临时目录
-        async with aiofiles.open(temp_file_path, 'wb') as temp_file:
-            await temp_file.write(content)
         
-        print(f"文件已保存到: {temp_file_path}")
+        # 分块接收到上传暂存区（小文件留在内存中），超过50MB时返回413（请求体过大时中间件已在
+        # 接收前拒绝），暂存区满时返回503；没有分析路由时退回到临时文件。两者都在响应前释放
+        if HAS_ANALYSIS_ROUTER:
+            upload = await spool_upload(file)
+            audio_source, file_size = upload.source, upload.size
+        else:
+            temp_file_path = os.path.join(tempfile.gettempdir(), unique_filename)
+            file_size = await save_upload_file(file, temp_file_path)
+            audio_source = temp_file_path
+        logger.info("文件已接收", extra={"bytes": file_size, "in_memory": upload is not None and upload.in_memory})
         
         # 使用您现有的服务处理音频
         if HAS_SERVICES:
             try:
                 # 音频预处理
-                processed_audio = process_audio(temp_file_path)
+                processed_audio = process_audio(audio_source)
                 
                 # 上传到OSS
                 oss_url = upload_to_oss(processed_audio, unique_filename)
@@ -97,7 +121,7 @@ async def upload_audio(file: UploadFile = File(...)):
                 })
                 
             except Exception as service_error:
-                print(f"服务处理错误: {service_error}")
+                logger.error("服务处理错误，返回模拟结果", extra={"error": str(service_error)})
                 # 如果服务出错，返回模拟结果
                 return get_fallback_analysis(file.filename, file_size)
         else:
@@ -107,7 +131,7 @@ async def upload_audio(file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"上传错误: {str(e)}")
+        logger.exception("上传错误")
         return JSONResponse(
             status_code=500,
             content={
@@ -115,9 +139,16 @@ async def upload_audio(file: UploadFile = File(...)):
                 "message": f"文件处理失败: {str(e)}"
             }
         )
+    finally:
+        if upload is not None:
+            upload.release()
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
 
 def get_fallback_analysis(filename, file_size):
     """返回模拟分析结果"""
+    if HAS_ANALYSIS_ROUTER:
+        record_fallback("get_fallback_analysis")
     return JSONResponse({
         "status": "success",
         "message": "文件上传成功（模拟分析模式）",
@@ -1,41 +1,369 @@
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Union, Optional, Callable, Tuple
+
+import numpy as np
+
 from app.core.cloud_services import CloudServiceManager
+from app.core.result_cache import ResultCache, hash_audio
+from app.core.single_flight import SingleFlight
+from app.core.audio_buffer import NormalizedAudio
+from app.core.segmenter import find_segments
+from app.core.log import get_logger
+from app.core.metrics import STAGE_SECONDS, IN_FLIGHT
+from app.core.serialization import FrameSeries
+from app.services.local_analysis import analyze_pcm, merge_results, HOP_LENGTH, SAMPLE_RATE
+from app.services.history_service import HistoryStore
+from app.services.melody_compare import ReferenceLibrary
+from app.services.melody_index import MelodyIndex
+
+logger = get_logger(__name__)
+
+# 各水平的推荐歌曲（按难度从低到高）
+USER_LEVELS = ["beginner", "intermediate", "advanced"]
+RECOMMENDED_SONGS = {
+    "beginner": ["小星星", "欢乐颂", "童年"],
+    "intermediate": ["月亮代表我的心", "成都", "青花瓷"],
+    "advanced": ["泡沫", "不为谁而作的歌"],
+}
 
 class AnalysisService:
-    def __init__(self, cloud_manager: CloudServiceManager):
+    def __init__(self, cloud_manager: CloudServiceManager, result_cache: Optional[ResultCache] = None,
+                 history: Optional[HistoryStore] = None, references: Optional[ReferenceLibrary] = None,
+                 song_index: Optional[MelodyIndex] = None):
         self.cloud_manager = cloud_manager
+        self.result_cache = result_cache or ResultCache()
+        self.single_flight = SingleFlight("analysis")
+        self.history = history
+        self.references = references
+        self.song_index = song_index
     
-    async def comprehensive_analysis(self, audio_data: bytes, user_level: str = "beginner") -> Dict[str, Any]:
-        """综合音频分析"""
-        print(f"开始分析音频，用户水平: {user_level}")
+    @IN_FLIGHT.track(stage="analysis")
+    async def comprehensive_analysis(self, audio_data: Union[bytes, str], user_level: str = "beginner",
+                                     progress: Optional[Callable[[str], None]] = None,
+                                     user_id: Optional[str] = None,
+                                     song_id: Optional[str] = None,
+                                     include_frames: bool = False) -> Dict[str, Any]:
+        """综合音频分析（audio_data 可以是音频字节或临时文件路径）
+
+        progress 为可选的阶段回调，依次收到 preprocessing / analyzing / reporting。
+        user_id 不为空时按该用户最近的表现调整改进计划，并把本次结果写入历史记录。
+        song_id 不为空时与该参考旋律对齐，附带逐音符的音高偏差和时间偏移；未指定时
+        若识曲结果足够可信且在参考曲库中，自动与识别出的歌曲比对。
+        include_frames=True 时附带逐帧基频和能量（"frames"，值为 FrameSeries，需经
+        app.core.serialization 输出）。
+        """
+        logger.info("开始分析音频", extra={"user_level": user_level})
+        report_stage = progress or (lambda stage: None)
+        report, frames = await self._analyze(audio_data, user_level, report_stage)
+        
+        identified = False
+        if not song_id and self.references is not None:
+            song_id = self._identified_song(report)
+            identified = song_id is not None
+        if frames is None and (include_frames or (song_id and self.references is not None)):
+            frames = await self._frames(audio_data)
+        contour = frames["f0"] if frames is not None else None
+        if song_id and self.references is not None:
+            report = dict(report)
+            report["reference_comparison"] = await self._compare_reference(song_id, contour)
+            if identified:
+                report["reference_comparison"]["identified"] = True
         
-        # 上传音频
-        audio_url = await self.cloud_manager.upload_audio(audio_data)
+        if user_id and self.history is not None and self.history.enabled:
+            summary = await self.history.summary(user_id)
+            report = self._apply_history(report, user_level, summary)
+            self.history.record(user_id, user_level, report, contour, HOP_LENGTH / SAMPLE_RATE)
+        if include_frames:
+            report = dict(report)
+            report["frames"] = self._frame_output(frames)
+        return report
+    
+    async def _analyze(self, audio_data: Union[bytes, str], user_level: str,
+                       report_stage: Callable[[str], None]) -> Tuple[Dict[str, Any], Optional[Dict[str, np.ndarray]]]:
+        """返回 (报告, 逐帧数据 {"f0", "rms"})；命中缓存时没有逐帧数据"""
+        # 冷启动时云服务在后台连接，先等它完成（有超时）
+        await self.cloud_manager.wait_until_ready(self.cloud_manager.settings.CLOUD_READY_TIMEOUT)
+        
+        # 模拟模式下云端结果是随机的，不走缓存；音准/节奏仍由本地分析得出
+        if self.cloud_manager.fallback_mode:
+            report_stage("preprocessing")
+            processed_data = await self.cloud_manager.preprocess_audio(audio_data)
+            report_stage("analyzing")
+            local_result, cloud_result, segments, frames = await self._run_analysis(processed_data)
+            report = await self._generate_report(cloud_result, user_level, local_result, segments)
+            return await self._add_identification(report, frames), frames
+        
+        # 1. 原始文件完全相同（重复上传同一个文件）时，无需转码直接命中
+        raw_key = await asyncio.to_thread(hash_audio, audio_data, user_level)
+        cached = await self.result_cache.get(raw_key, record_miss=False)
+        if cached is not None:
+            logger.info("命中分析缓存", extra={"cache_key": "raw"})
+            return cached, None
+        
+        # 2. 相同内容的请求正在分析中（客户端重试、重复点击上传）时，等待并共享它的结果
+        if self.single_flight.in_flight(raw_key):
+            report_stage("analyzing")
+        return await self.single_flight.do(
+            raw_key, lambda: self._analyze_uncached(audio_data, user_level, raw_key, report_stage)
+        )
+    
+    async def _analyze_uncached(self, audio_data: Union[bytes, str], user_level: str, raw_key: str,
+                                report_stage: Callable[[str], None]) -> Tuple[Dict[str, Any], Optional[Dict[str, np.ndarray]]]:
+        """原始内容未命中缓存时的完整流程（同一 raw_key 同一时刻只执行一次）"""
+        # 3. 按标准化后的16kHz单声道音频查找（同一段录音的不同编码）
+        report_stage("preprocessing")
+        processed_data = await self.cloud_manager.preprocess_audio(audio_data)
+        cache_key = hash_audio(processed_data, user_level)
+        cached = await self.result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("命中分析缓存", extra={"cache_key": "normalized"})
+            await self.result_cache.set(raw_key, cached)
+            return cached, None
         
-        # 调用云服务分析
-        cloud_result = await self.cloud_manager.analyze_singing(audio_url)
+        report_stage("analyzing")
+        local_result, cloud_result, segments, frames = await self._run_analysis(processed_data)
         
         # 生成报告
-        return await self._generate_report(cloud_result, user_level)
+        report_stage("reporting")
+        report = await self._generate_report(cloud_result, user_level, local_result, segments)
+        report = await self._add_identification(report, frames)
+        
+        # 只缓存真实API的结果，回退结果下次仍然重试
+        if cloud_result.get("source") == "real_api":
+            await self.result_cache.set(cache_key, report)
+            await self.result_cache.set(raw_key, report)
+        
+        return report, frames
+    
+    async def _run_analysis(self, processed_data: Union[NormalizedAudio, bytes]
+                            ) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], Optional[List[Dict[str, Any]]], Optional[Dict[str, np.ndarray]]]:
+        """本地音准/节奏分析与上传+ASR同时进行，返回 (本地结果, 云端结果, 分段明细, 逐帧数据)
+
+        超过 SEGMENT_MAX_SECONDS 的音频在乐句停顿处切段，每段的本地分析和上传+ASR
+        同时进行，各段之间最多 SEGMENT_MAX_PARALLEL 段并行（不超过上传/ASR闸门的
+        名额），全部完成后再合并。
+        """
+        settings = self.cloud_manager.settings
+        if not isinstance(processed_data, NormalizedAudio) or processed_data.duration <= settings.SEGMENT_MAX_SECONDS:
+            local_result, cloud_result = await asyncio.gather(
+                self._local_analysis(processed_data),
+                self._cloud_analysis(processed_data)
+            )
+            return local_result, cloud_result, None, _pop_frames(local_result)
+        
+        bounds = find_segments(
+            processed_data.samples, processed_data.sample_rate,
+            settings.SEGMENT_TARGET_SECONDS, settings.SEGMENT_MAX_SECONDS
+        )
+        logger.info("长音频按乐句切段并行分析", extra={
+            "duration": round(processed_data.duration, 2), "segments": len(bounds)
+        })
+        limit = asyncio.Semaphore(self._segment_parallelism())
+        
+        async def analyze_piece(start: int, end: int) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+            async with limit:
+                piece = processed_data.segment(start, end)
+                return await asyncio.gather(self._local_analysis(piece), self._cloud_analysis(piece))
+        
+        results = await asyncio.gather(*[analyze_piece(start, end) for start, end in bounds])
+        local_results = [local for local, _ in results]
+        cloud_results = [cloud for _, cloud in results]
+        
+        # 各分段的逐帧数据按起点放回整段的帧位置
+        total_frames = len(processed_data.samples) // HOP_LENGTH + 1
+        frames = {key: np.zeros(total_frames, dtype=np.float32) for key in ("f0", "rms")}
+        segments = []
+        for index, ((start, end), local, cloud) in enumerate(zip(bounds, local_results, cloud_results)):
+            piece_frames = _pop_frames(local)
+            if piece_frames:
+                offset = start // HOP_LENGTH
+                for key, values in piece_frames.items():
+                    frames[key][offset:offset + len(values)] = values[:total_frames - offset]
+            segment = {
+                "index": index,
+                "start": round(start / processed_data.sample_rate, 2),
+                "end": round(end / processed_data.sample_rate, 2),
+                "transcript": self._segment_text(cloud),
+                "cloud_score": cloud.get("analysis", {}).get("score", 0),
+                "source": cloud.get("source")
+            }
+            if local:
+                segment.update({key: local[key] for key in ("pitch_accuracy", "pitch_stability", "rhythm_stability", "vocal_range")})
+            segments.append(segment)
+        
+        local_valid = [local for local in local_results if local]
+        local_result = merge_results(local_valid) if local_valid else None
+        durations = [(end - start) / processed_data.sample_rate for start, end in bounds]
+        return local_result, self._merge_cloud_results(cloud_results, durations), segments, frames
+    
+    def _segment_parallelism(self) -> int:
+        """单个请求同时分析的分段数：SEGMENT_MAX_PARALLEL，且不超过上传/ASR闸门的名额
+
+        一个请求的分段若多于闸门名额，多出的分段只能排队等自己的前几段，
+        等满 ADMISSION_WAIT_TIMEOUT 后会被当成过载返回503。
+        """
+        settings = self.cloud_manager.settings
+        limits = [settings.SEGMENT_MAX_PARALLEL] + [
+            gate.limit for stage, gate in self.cloud_manager.gates.items()
+            if stage in ("upload", "asr") and gate.limit > 0
+        ]
+        return max(1, min(limits))
     
-    async def _generate_report(self, cloud_data: Dict, user_level: str) -> Dict[str, Any]:
-        """生成分析报告"""
+    def _segment_text(self, cloud_result: Dict[str, Any]) -> str:
+        """取出分段的转写文本（真实API在 analysis 中，回退结果在 transcription 中）"""
+        analysis = cloud_result.get("analysis", {})
+        if analysis.get("transcribed_text"):
+            return analysis["transcribed_text"]
+        return cloud_result.get("transcription", {}).get("text", "")
+    
+    def _merge_cloud_results(self, results: List[Dict[str, Any]], durations: List[float]) -> Dict[str, Any]:
+        """合并各分段的云端结果：文本按顺序拼接，分数按时长加权"""
+        total = sum(durations) or 1.0
+        analyses = [result.get("analysis", {}) for result in results]
+        
+        # 任一分段走了回退，整体就不算真实API结果（不会被缓存）
+        sources = [result.get("source") for result in results]
+        source = next((s for s in sources if s != "real_api"), "real_api")
+        
+        aspects: Dict[str, List[float]] = {}
+        for analysis, duration in zip(analyses, durations):
+            for detail in analysis.get("details", []):
+                aspects.setdefault(detail["aspect"], [0.0, 0.0])
+                aspects[detail["aspect"]][0] += detail["score"] * duration
+                aspects[detail["aspect"]][1] += duration
+        
+        improvements = []
+        for analysis in analyses:
+            for item in analysis.get("improvements", []):
+                if item not in improvements:
+                    improvements.append(item)
+        
+        texts = [self._segment_text(result) for result in results]
+        score = sum(analysis.get("score", 0) * duration for analysis, duration in zip(analyses, durations)) / total
+        return {
+            "transcription": {
+                "text": " ".join(text for text in texts if text),
+                "segments": texts,
+                "source": source
+            },
+            "analysis": {
+                "score": round(score),
+                "feedback": f"共 {len(results)} 段，" + "；".join(a.get("feedback", "") for a in analyses[:3]),
+                "details": [
+                    {"aspect": aspect, "score": round(weighted / weight), "comment": f"{len(results)}段加权平均"}
+                    for aspect, (weighted, weight) in aspects.items() if weight > 0
+                ],
+                "improvements": improvements,
+                "transcribed_text": " ".join(text for text in texts if text),
+                "source": source
+            },
+            "source": source
+        }
+    
+    async def identify_song(self, audio_data: Union[bytes, str], top_k: int = 5) -> Optional[Dict[str, Any]]:
+        """只识曲：本地提取基频后查指纹索引，不调用云服务；无法提取基频时返回None"""
+        frames = await self._frames(audio_data)
+        if frames is None:
+            return None
+        return await asyncio.to_thread(self.song_index.identify, frames["f0"], HOP_LENGTH / SAMPLE_RATE, top_k)
+    
+    async def _add_identification(self, report: Dict[str, Any],
+                                  frames: Optional[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+        """用旋律指纹索引识别演唱的歌曲，候选列表随报告一起缓存"""
+        if self.song_index is None or frames is None:
+            return report
+        with STAGE_SECONDS.time(stage="song_identification"):
+            report["song_identification"] = await asyncio.to_thread(
+                self.song_index.identify, frames["f0"], HOP_LENGTH / SAMPLE_RATE,
+                self.cloud_manager.settings.SONG_INDEX_TOP_K
+            )
+        return report
+    
+    def _identified_song(self, report: Dict[str, Any]) -> Optional[str]:
+        """识曲首位候选足够可信、且参考曲库中有这首歌时返回它的ID"""
+        candidates = (report.get("song_identification") or {}).get("candidates") or []
+        if not candidates:
+            return None
+        top = candidates[0]
+        if top["confidence"] < self.cloud_manager.settings.SONG_ID_MIN_CONFIDENCE:
+            return None
+        return top["song_id"] if top["song_id"] in self.references.melodies else None
+    
+    async def _frames(self, audio_data: Union[bytes, str]) -> Optional[Dict[str, np.ndarray]]:
+        """命中缓存时没有逐帧数据，参考旋律比对或输出逐帧数据时再单独提取"""
+        processed_data = await self.cloud_manager.preprocess_audio(audio_data)
+        return _pop_frames(await self._local_analysis(processed_data))
+    
+    def _frame_output(self, frames: Optional[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+        """逐帧输出：基频（Hz，无声为0，精度0.1Hz）和能量（dBFS，精度0.1dB）"""
+        if frames is None:
+            return {"hop_seconds": HOP_LENGTH / SAMPLE_RATE, "f0_hz": None, "energy_db": None}
+        energy_db = 20 * np.log10(np.maximum(frames["rms"], 1e-5))
+        return {
+            "hop_seconds": HOP_LENGTH / SAMPLE_RATE,
+            "f0_hz": FrameSeries(frames["f0"], 0.1),
+            "energy_db": FrameSeries(energy_db, 0.1)
+        }
+    
+    async def _compare_reference(self, song_id: str, contour: Optional[np.ndarray]) -> Dict[str, Any]:
+        """与参考旋律做DTW对齐（在线程中计算，长录音也只需几十毫秒）"""
+        if contour is None:
+            return {"song_id": song_id, "error": "没有可用的基频曲线，无法与参考旋律比对"}
+        with STAGE_SECONDS.time(stage="reference_compare"):
+            return await asyncio.to_thread(self.references.compare, song_id, contour, HOP_LENGTH / SAMPLE_RATE)
+    
+    async def _cloud_analysis(self, processed_data: Union[NormalizedAudio, bytes]) -> Dict[str, Any]:
+        """交付音频并调用云服务分析，分析结束后清理交付的音频"""
+        async with self.cloud_manager.deliver_audio(processed_data) as audio_url:
+            return await self.cloud_manager.analyze_singing(audio_url)
+    
+    async def _local_analysis(self, processed_data: Union[NormalizedAudio, bytes]) -> Optional[Dict[str, Any]]:
+        """本地音准/节奏分析，失败时返回None
+
+        在线程中直接读取 NormalizedAudio 的样本数组（NumPy运算会释放GIL），
+        避免再把PCM序列化到子进程。
+        """
+        if not isinstance(processed_data, NormalizedAudio):
+            return None
+        try:
+            with STAGE_SECONDS.time(stage="local_analysis"):
+                return await asyncio.to_thread(
+                    analyze_pcm, processed_data.as_float(), processed_data.sample_rate, True
+                )
+        except Exception as e:
+            logger.warning("本地分析失败", extra={"error": str(e)})
+            return None
+    
+    @STAGE_SECONDS.time(stage="report")
+    async def _generate_report(self, cloud_data: Dict, user_level: str,
+                               local_result: Optional[Dict[str, Any]] = None,
+                               segments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """生成分析报告（有本地分析结果时，音准和节奏分数以本地结果为准；长音频附带分段明细）"""
         scores = {
             "pitch_accuracy": cloud_data.get("pronunciation", {}).get("score", 0) * 100,
             "rhythm_accuracy": cloud_data.get("rhythm", {}).get("score", 0) * 100,
             "completeness": cloud_data.get("completeness", 0) * 100,
             "fluency": cloud_data.get("fluency", 0) * 100
         }
+        if local_result:
+            scores["pitch_accuracy"] = local_result["pitch_accuracy"]
+            scores["rhythm_accuracy"] = local_result["rhythm_stability"]
         
         # 生成反馈
         feedback = self._generate_feedback(scores, user_level)
         
-        return {
+        report = {
             "technical_scores": scores,
             "personalized_feedback": feedback,
             "improvement_plan": self._create_plan(scores, user_level),
-            "overall_score": sum(scores.values()) / len(scores)
+            "overall_score": sum(scores.values()) / len(scores),
+            "source": cloud_data.get("source")
         }
+        if local_result:
+            report["local_analysis"] = local_result
+        if segments:
+            report["segments"] = segments
+        return report
     
     def _generate_feedback(self, scores: Dict, user_level: str) -> List[str]:
         """生成反馈建议"""
@@ -52,29 +380,55 @@ class AnalysisService:
         
         return feedback
     
-    def _create_plan(self, scores: Dict, user_level: str) -> Dict[str, Any]:
-        """创建改进计划"""
+    def _apply_history(self, report: Dict[str, Any], user_level: str,
+                       history: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """结合用户最近的表现调整报告（返回副本，缓存中的报告不受影响）"""
+        report = dict(report)
+        scores = report["technical_scores"]
+        report["improvement_plan"] = self._create_plan(scores, user_level, history)
+        if history:
+            progress = {"previous_sessions": history["sessions"]}
+            for key, current in (("overall_score", report["overall_score"]),
+                                 ("pitch_accuracy", scores["pitch_accuracy"]),
+                                 ("rhythm_accuracy", scores["rhythm_accuracy"])):
+                if history[key] is not None:
+                    progress[f"{key}_change"] = round(current - history[key], 1) + 0.0
+            report["progress"] = progress
+        return report
+    
+    def _create_plan(self, scores: Dict, user_level: str,
+                     history: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """创建改进计划（有历史记录时，对连续几次都偏弱的方面加强练习）"""
         exercises = []
         
         if scores["pitch_accuracy"] < 70:
             exercises.append("基础音阶练习 - 每天10分钟")
+            if history and history["sessions"] >= 3 and (history["pitch_accuracy"] or 100) < 70:
+                exercises.append("音准专项：对着调音器慢速唱长音 - 每天15分钟")
         
         if scores["rhythm_accuracy"] < 75:
             exercises.append("节拍器跟拍练习 - 每天8分钟")
+            if history and history["sessions"] >= 3 and (history["rhythm_accuracy"] or 100) < 75:
+                exercises.append("节奏专项：放慢节拍器打拍唱 - 每天10分钟")
         
         return {
             "daily_exercises": exercises,
-            "recommended_songs": self._get_recommended_songs(user_level)
+            "recommended_songs": self._get_recommended_songs(user_level, history)
         }
     
-    def _get_recommended_songs(self, user_level: str) -> List[str]:
-        """推荐歌曲"""
-        if user_level == "beginner":
-            return ["小星星", "欢乐颂", "童年"]
-        elif user_level == "intermediate":
-            return ["月亮代表我的心", "成都", "青花瓷"]
-        else:
-            return ["泡沫", "不为谁而作的歌"]
-
+    def _get_recommended_songs(self, user_level: str, history: Optional[Dict[str, Any]] = None) -> List[str]:
+        """推荐歌曲（最近几次整体表现稳定偏高或偏低时，推荐高一级或低一级的歌曲）"""
+        level = USER_LEVELS.index(user_level) if user_level in USER_LEVELS else len(USER_LEVELS) - 1
+        if history and history["sessions"] >= 3 and history["overall_score"] is not None:
+            if history["overall_score"] >= 85:
+                level = min(level + 1, len(USER_LEVELS) - 1)
+            elif history["overall_score"] < 60:
+                level = max(level - 1, 0)
+        return list(RECOMMENDED_SONGS[USER_LEVELS[level]])
 
 
+def _pop_frames(local_result: Optional[Dict[str, Any]]) -> Optional[Dict[str, np.ndarray]]:
+    """从本地分析结果中取出逐帧数组（结果本身随报告缓存，不能带着数组）"""
+    if not local_result or "f0_contour" not in local_result:
+        return None
+    return {"f0": local_result.pop("f0_contour"), "rms": local_result.pop("rms_contour")}
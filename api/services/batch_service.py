@@ -0,0 +1,71 @@
+import time
+import asyncio
+from typing import Dict, Any, List, Tuple, AsyncIterator, Optional
+
+from app.services.analysis_service import AnalysisService
+from app.core.admission import OverloadedError
+from app.core.spool import SpooledUpload
+from app.core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchService:
+    """批量分析：多个文件并发执行 comprehensive_analysis，按完成顺序产出结果
+
+    每个文件内部的解码（进程池）、上传（OSS线程池）和ASR（HTTP连接池）使用
+    不同的资源，多个文件同时进行时这些阶段自然地交错重叠。
+    """
+
+    def __init__(self, analysis_service: AnalysisService, max_concurrency: int = 4):
+        self.analysis_service = analysis_service
+        self.max_concurrency = max_concurrency
+
+    async def run(self, files: List[Tuple[str, SpooledUpload]], user_level: str,
+                  user_id: Optional[str] = None, song_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """files 为 [(原文件名, 暂存的上传)]，每个上传在分析完成后释放；最后产出一条汇总记录"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.monotonic()
+
+        async def analyze_one(index: int, filename: str, upload: SpooledUpload) -> Dict[str, Any]:
+            async with semaphore:
+                file_started = time.monotonic()
+                try:
+                    result = await self.analysis_service.comprehensive_analysis(
+                        upload.source, user_level, user_id=user_id, song_id=song_id
+                    )
+                    record = {"type": "result", "index": index, "filename": filename, "success": True, "data": result}
+                except Exception as e:
+                    logger.error("批量分析单个文件失败", extra={"upload_name": filename, "error": str(e)})
+                    record = {"type": "result", "index": index, "filename": filename, "success": False, "error": str(e)}
+                    if isinstance(e, OverloadedError):
+                        record["retry_after"] = e.retry_after
+                finally:
+                    upload.release()
+                record["elapsed_seconds"] = round(time.monotonic() - file_started, 3)
+                return record
+
+        tasks = [
+            asyncio.create_task(analyze_one(index, filename, upload))
+            for index, (filename, upload) in enumerate(files)
+        ]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                succeeded += record["success"]
+                yield record
+        finally:
+            # 客户端断开时取消剩余的分析
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.monotonic() - started
+        yield {
+            "type": "summary",
+            "total": len(files),
+            "succeeded": succeeded,
+            "failed": len(files) - succeeded,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(len(files) / elapsed, 3) if elapsed > 0 else 0.0
+        }
@@ -0,0 +1,296 @@
+import time
+import zlib
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+from app.core.log import get_logger
+from app.core.serialization import FrameSeries
+
+logger = get_logger(__name__)
+
+# 可用于趋势查询的分数列（列名直接拼进SQL，必须来自这个白名单）
+TREND_METRICS = ("overall_score", "pitch_accuracy", "rhythm_accuracy", "pitch_stability", "completeness", "fluency")
+
+# 无声帧在音分序列中的取值
+_UNVOICED = 0
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS analysis_history ("
+    "id INTEGER PRIMARY KEY, "
+    "user_id TEXT NOT NULL, "
+    "created_at REAL NOT NULL, "
+    "user_level TEXT NOT NULL, "
+    "source TEXT, "
+    "overall_score REAL, "
+    "pitch_accuracy REAL, "
+    "rhythm_accuracy REAL, "
+    "pitch_stability REAL, "
+    "completeness REAL, "
+    "fluency REAL, "
+    "duration REAL, "
+    "tempo_bpm REAL, "
+    "range_low REAL, "
+    "range_high REAL, "
+    "contour_hop REAL, "
+    "contour BLOB)",
+    # "最近N次" 和 "最近30天趋势" 都是按用户、时间范围扫描
+    "CREATE INDEX IF NOT EXISTS idx_history_user_time ON analysis_history (user_id, created_at)",
+)
+
+_COLUMNS = (
+    "user_id", "created_at", "user_level", "source", "overall_score", "pitch_accuracy", "rhythm_accuracy",
+    "pitch_stability", "completeness", "fluency", "duration", "tempo_bpm", "range_low", "range_high",
+    "contour_hop", "contour"
+)
+_SUMMARY_COLUMNS = ("id",) + _COLUMNS[1:-2]
+
+
+def encode_contour(f0: np.ndarray) -> bytes:
+    """压缩基频曲线：Hz -> 整数音分（MIDI×100，无声帧为0）-> 差分 -> zlib
+
+    1音分的精度远小于音准评分关心的偏差，4分钟（2.4万帧）的曲线通常只有十几KB。
+    """
+    f0 = np.asarray(f0, dtype=np.float64)
+    cents = np.zeros(len(f0), dtype=np.int16)
+    voiced = f0 > 0
+    cents[voiced] = np.round(6900 + 1200 * np.log2(f0[voiced] / 440.0)).astype(np.int16)
+    deltas = np.diff(cents, prepend=np.int16(0)).astype("<i2")
+    return zlib.compress(deltas.tobytes(), 6)
+
+
+def decode_contour(blob: bytes) -> np.ndarray:
+    """encode_contour 的逆过程，返回 float32 的Hz数组（无声帧为0）"""
+    deltas = np.frombuffer(zlib.decompress(blob), dtype="<i2")
+    cents = np.cumsum(deltas, dtype=np.int16)
+    f0 = np.zeros(len(cents), dtype=np.float32)
+    voiced = cents != _UNVOICED
+    f0[voiced] = 440.0 * 2 ** ((cents[voiced].astype(np.float32) - 6900) / 1200)
+    return f0
+
+
+class HistoryStore:
+    """用户分析历史（SQLite）
+
+    每次分析的分数写入固定列，逐帧基频曲线压缩后存为BLOB。record 只把记录放入
+    内存队列，由后台任务按批（batch_size 条或 flush_interval 秒）在线程中写入，
+    不占用请求路径；队列超过 max_pending 时丢弃新记录并计数。
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval: float = 1.0,
+                 max_pending: int = 10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # 写入任务正在收集的一批，以及已交给线程写入的一批（停止时由 stop 接着写完）
+        self._batch: List[Tuple] = []
+        self._flushing: Optional[asyncio.Future] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    async def start(self):
+        """打开数据库并启动后台写入任务（数据库不可用时只记录警告，历史功能关闭）"""
+        try:
+            self._db = await asyncio.to_thread(self._open)
+        except sqlite3.Error as e:
+            logger.warning("历史记录数据库不可用，已关闭历史功能", extra={"db_path": self.db_path, "error": str(e)})
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        """写完收集中的一批和队列中剩余的记录后关闭数据库"""
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        if self._flushing is not None:
+            # 已在线程中写入的一批无法中途取消，等它完成，避免重复写入
+            await asyncio.gather(self._flushing, return_exceptions=True)
+            self._flushing = None
+        pending, self._batch = self._batch, []
+        if self._queue is not None:
+            pending += self._drain(self._queue.qsize())
+        if pending and self._db is not None:
+            await self._flush(pending)
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def record(self, user_id: str, user_level: str, report: Dict[str, Any],
+               contour: Optional[np.ndarray] = None, hop_seconds: float = 0.01):
+        """登记一次分析（不阻塞，实际写入由后台任务完成）"""
+        if self._queue is None:
+            return
+        scores = report.get("technical_scores", {})
+        local = report.get("local_analysis") or {}
+        range_hz = local.get("range_hz") or [None, None]
+        row = (
+            user_id, time.time(), user_level, report.get("source"),
+            report.get("overall_score"), scores.get("pitch_accuracy"), scores.get("rhythm_accuracy"),
+            local.get("pitch_stability"), scores.get("completeness"), scores.get("fluency"),
+            local.get("duration"), local.get("tempo_bpm"), range_hz[0], range_hz[1],
+            hop_seconds if contour is not None else None,
+            # 曲线在写入线程中压缩
+            contour if contour is not None and len(contour) else None
+        )
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("历史记录队列已满，丢弃记录", extra={"user_id": user_id})
+
+    async def recent(self, user_id: str, limit: int = 20, include_contour: bool = False) -> List[Dict[str, Any]]:
+        """最近 limit 次分析（新的在前）"""
+        if not self.enabled:
+            return []
+        return await asyncio.to_thread(self._recent, user_id, limit, include_contour)
+
+    async def trend(self, user_id: str, metric: str = "pitch_accuracy", days: int = 30,
+                    tz_offset_minutes: int = 0) -> List[Dict[str, Any]]:
+        """最近 days 天内某项分数的每日均值/最值/次数（按 tz_offset_minutes 所在时区划分日期）"""
+        if metric not in TREND_METRICS:
+            raise ValueError(f"不支持的指标: {metric}")
+        if not self.enabled:
+            return []
+        return await asyncio.to_thread(self._trend, user_id, metric, days, tz_offset_minutes * 60)
+
+    async def summary(self, user_id: str, limit: int = 5) -> Optional[Dict[str, Any]]:
+        """最近几次分析的平均表现（供生成改进计划和推荐歌曲使用），没有历史时返回None"""
+        sessions = await self.recent(user_id, limit)
+        if not sessions:
+            return None
+
+        def mean(key: str) -> Optional[float]:
+            values = [session[key] for session in sessions if session[key] is not None]
+            return round(sum(values) / len(values), 1) if values else None
+
+        return {
+            "sessions": len(sessions),
+            "overall_score": mean("overall_score"),
+            "pitch_accuracy": mean("pitch_accuracy"),
+            "rhythm_accuracy": mean("rhythm_accuracy"),
+            "last_at": sessions[0]["created_at"]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped
+        }
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL + NORMAL 同步级别，每批提交只需一次顺序写
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            db.execute(statement)
+        db.commit()
+        return db
+
+    async def _write_loop(self):
+        # 收集中的记录放在 self._batch，写入放在 self._flushing：任务在任何一步被取消，
+        # 记录都还在 stop 能找到的地方
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or not await self._collect(timeout):
+                    break
+            batch, self._batch = self._batch, []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _collect(self, timeout: float) -> bool:
+        """等待下一条记录放入 self._batch，超时返回 False
+
+        不用 wait_for：它在取到记录的同时被取消时会吞掉取消，stop 就等不到写入任务结束。
+        """
+        getter = asyncio.ensure_future(self._queue.get())
+        try:
+            await asyncio.wait({getter}, timeout=timeout)
+        finally:
+            if getter.done() and not getter.cancelled():
+                self._batch.append(getter.result())
+            else:
+                getter.cancel()
+        return getter.done() and not getter.cancelled()
+
+    def _drain(self, count: int) -> List[Tuple]:
+        return [self._queue.get_nowait() for _ in range(count)]
+
+    async def _flush(self, rows: List[Tuple]):
+        try:
+            await asyncio.to_thread(self._insert, rows)
+        except sqlite3.Error as e:
+            self.dropped += len(rows)
+            logger.error("写入历史记录失败", extra={"rows": len(rows), "error": str(e)})
+            return
+        self.written += len(rows)
+        self.batches += 1
+
+    def _insert(self, rows: List[Tuple]):
+        placeholders = ", ".join("?" * len(_COLUMNS))
+        rows = [row[:-1] + (encode_contour(row[-1]) if row[-1] is not None else None,) for row in rows]
+        with self._lock:
+            self._db.executemany(
+                f"INSERT INTO analysis_history ({', '.join(_COLUMNS)}) VALUES ({placeholders})", rows
+            )
+            self._db.commit()
+
+    def _recent(self, user_id: str, limit: int, include_contour: bool) -> List[Dict[str, Any]]:
+        columns = _SUMMARY_COLUMNS + (("contour_hop", "contour") if include_contour else ())
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(columns)} FROM analysis_history "
+                "WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        sessions = []
+        for row in rows:
+            session = dict(zip(columns, row))
+            if include_contour:
+                blob = session.pop("contour")
+                session["f0_contour"] = FrameSeries(decode_contour(blob), 0.1) if blob is not None else None
+            sessions.append(session)
+        return sessions
+
+    def _trend(self, user_id: str, metric: str, days: int, tz_offset: int) -> List[Dict[str, Any]]:
+        since = time.time() - days * 86400
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT CAST((created_at + ?) / 86400 AS INTEGER) AS day, "
+                f"AVG({metric}), MIN({metric}), MAX({metric}), COUNT(*) FROM analysis_history "
+                "WHERE user_id = ? AND created_at >= ? GROUP BY day ORDER BY day",
+                (tz_offset, user_id, since)
+            ).fetchall()
+        return [
+            {
+                "date": time.strftime("%Y-%m-%d", time.gmtime(day * 86400)),
+                "mean": round(mean, 1) if mean is not None else None,
+                "min": low,
+                "max": high,
+                "sessions": count
+            }
+            for day, mean, low, high, count in rows
+        ]
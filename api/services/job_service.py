@@ -0,0 +1,239 @@
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, AsyncIterator
+
+from app.services.analysis_service import AnalysisService
+from app.core.spool import SpooledUpload
+from app.core.log import get_logger, new_request_id
+
+logger = get_logger(__name__)
+
+# 任务的终止状态
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满，调用方应返回503并带上Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"分析任务队列已满，请{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+class MemoryJobStore:
+    """内存任务存储（默认），只保留最近 max_jobs 个任务"""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    async def save(self, job: Dict[str, Any]):
+        self._jobs[job["id"]] = dict(job)
+        self._jobs.move_to_end(job["id"])
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def unfinished(self) -> List[Dict[str, Any]]:
+        return [dict(job) for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES]
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore:
+    """SQLite任务存储，服务重启后仍可查询任务结果"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self._db.commit()
+
+    async def save(self, job: Dict[str, Any]):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def unfinished(self) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._unfinished)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _save(self, job: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, data, updated_at) VALUES (?, ?, ?, ?)",
+                (job["id"], job["status"], json.dumps(job, ensure_ascii=False), job["updated_at"])
+            )
+            self._db.commit()
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM jobs WHERE status NOT IN (?, ?)", FINISHED_STATUSES
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class JobService:
+    """异步分析任务：提交后立即返回任务ID，由固定数量的后台worker依次执行"""
+
+    def __init__(self, analysis_service: AnalysisService, store=None,
+                 workers: int = 2, max_queue: int = 32, retry_after: int = 10):
+        self.analysis_service = analysis_service
+        self.store = store or MemoryJobStore()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # 正在执行的任务，阶段进度只在内存中更新，状态变化时才写入存储
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self):
+        """启动后台worker；上次进程退出时未完成的任务标记为失败"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        for job in await self.store.unfinished():
+            await self._update(job, status="failed", stage="interrupted", error="服务重启，任务已中断，请重新提交")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 释放还在排队的任务的上传
+        while self._queue is not None and not self._queue.empty():
+            job, upload = self._queue.get_nowait()
+            upload.release()
+        self.store.close()
+
+    async def submit(self, upload: SpooledUpload, user_level: str, filename: str = "",
+                     user_id: Optional[str] = None, song_id: Optional[str] = None) -> Dict[str, Any]:
+        """提交任务（upload 由任务接管，完成后释放；抛出 JobQueueFullError 时仍由调用方释放）"""
+        if self._queue is None or self._queue.full():
+            raise JobQueueFullError(self.retry_after)
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "stage": "queued",
+            "filename": filename,
+            "user_level": user_level,
+            "user_id": user_id,
+            "song_id": song_id,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None,
+        }
+        await self.store.save(job)
+        try:
+            self._queue.put_nowait((job, upload))
+        except asyncio.QueueFull:
+            await self._update(job, status="failed", stage="rejected", error="任务队列已满")
+            raise JobQueueFullError(self.retry_after)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if job_id in self._active:
+            return dict(self._active[job_id])
+        return await self.store.get(job_id)
+
+    async def events(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """订阅任务状态变化，直到任务结束；超过 heartbeat 秒无变化时产出 None（心跳）"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            job = await self.get(job_id)
+            while job is not None:
+                yield job
+                if job["status"] in FINISHED_STATUSES:
+                    break
+                try:
+                    job = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def _update(self, job: Dict[str, Any], **fields):
+        self._progress(job, **fields)
+        await self.store.save(job)
+
+    def _progress(self, job: Dict[str, Any], **fields):
+        job.update(fields, updated_at=time.time())
+        for queue in self._subscribers.get(job["id"], []):
+            queue.put_nowait(dict(job))
+
+    async def _worker(self):
+        while True:
+            job, upload = await self._queue.get()
+            # worker中的日志以任务ID作为请求ID
+            new_request_id(job["id"])
+            self.running += 1
+            self._active[job["id"]] = job
+            try:
+                await self._update(job, status="running", stage="started")
+
+                def progress(stage: str):
+                    self._progress(job, stage=stage)
+
+                result = await self.analysis_service.comprehensive_analysis(
+                    upload.source, job["user_level"], progress=progress,
+                    user_id=job.get("user_id"), song_id=job.get("song_id")
+                )
+                self.completed += 1
+                await self._update(job, status="completed", stage="done", result=result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("分析任务失败", extra={"job_id": job["id"], "error": str(e)})
+                self.failed += 1
+                await self._update(job, status="failed", stage="error", error=str(e))
+            finally:
+                self.running -= 1
+                self._active.pop(job["id"], None)
+                upload.release()
+                self._queue.task_done()
@@ -0,0 +1,216 @@
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from app.core.audio_buffer import TARGET_SAMPLE_RATE, StreamResampler
+from app.services.local_analysis import (
+    FRAME_LENGTH, HOP_LENGTH, yin_f0, frame_rms, hz_to_note, silent_frames, onset_peaks
+)
+
+# 环形缓冲区保留的音频时长（秒）
+RING_SECONDS = 4
+# 用于节奏评分的最近起音点个数
+MAX_ONSETS = 32
+# 接受的输入采样率；过低的采样率上采样到16kHz时数据量成倍膨胀
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+
+
+class RingBuffer:
+    """固定容量的float32环形缓冲区，按绝对样本位置读取"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self.total_written = 0
+
+    def write(self, samples: np.ndarray):
+        if len(samples) > self.capacity:
+            samples = samples[-self.capacity:]
+        start = self.total_written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.total_written += len(samples)
+
+    def read(self, position: int, length: int) -> np.ndarray:
+        """读取绝对位置 [position, position+length) 的样本（必须仍在缓冲区内）"""
+        if position < self.total_written - self.capacity or position + length > self.total_written:
+            raise ValueError("请求的样本已不在缓冲区中")
+        start = position % self.capacity
+        if start + length <= self.capacity:
+            return self._data[start:start + length]
+        return np.concatenate([self._data[start:], self._data[:start + length - self.capacity]])
+
+
+class LiveSession:
+    """实时演唱分析会话
+
+    每收到一块音频，只对新产生的分析帧做基频/能量计算，并增量更新
+    运行中的音准、稳定性和节奏统计，不会重新分析整个缓冲区。
+    """
+
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE, sample_format: str = "pcm_s16le"):
+        if sample_format not in ("pcm_s16le", "pcm_f32le"):
+            raise ValueError(f"不支持的音频格式: {sample_format}")
+        if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+            raise ValueError(f"采样率须在 {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE}Hz 之间: {sample_rate}")
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        self.ring = RingBuffer(RING_SECONDS * TARGET_SAMPLE_RATE)
+        # 重采样的滤波状态和不足一个样本的尾部字节都要跨块保留
+        self.resampler = StreamResampler(sample_rate) if sample_rate != TARGET_SAMPLE_RATE else None
+        self._partial = b""
+        self.next_frame = 0           # 下一帧的起始样本位置（绝对位置）
+        self.frames_seen = 0
+
+        # 运行统计
+        self.voiced_frames = 0
+        self.deviation_sum = 0.0
+        self.jitter_sum = 0.0
+        self.jitter_count = 0
+        self.last_cents: Optional[float] = None
+        self.peak_rms = 0.0
+        self.prev_log_energy: Optional[float] = None
+        self.novelty_history = deque(maxlen=2)   # 最近两帧的 (能量上升, 是否静音)
+        self.novelty_count = 0
+        self.novelty_mean = 0.0
+        self.novelty_m2 = 0.0
+        self.onsets = deque(maxlen=MAX_ONSETS)
+
+    def _decode(self, chunk: bytes) -> np.ndarray:
+        data = self._partial + chunk
+        width = 4 if self.sample_format == "pcm_f32le" else 2
+        usable = len(data) - len(data) % width
+        self._partial = data[usable:]
+        if self.sample_format == "pcm_f32le":
+            samples = np.clip(np.frombuffer(data[:usable], dtype="<f4"), -1, 1).astype(np.float32)
+        else:
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        if self.resampler is None:
+            return samples
+        return self.resampler.process(samples)
+
+    def process_chunk(self, chunk: bytes) -> Dict[str, Any]:
+        """处理一块音频，返回新帧的分析结果和运行中的评分"""
+        started = time.perf_counter()
+        samples = self._decode(chunk)
+        # 单块过大时分段写入，保证未分析的样本不会被覆盖
+        step = self.ring.capacity - FRAME_LENGTH
+        frame_f0 = []
+        new_onsets = []
+        for offset in range(0, max(len(samples), 1), step):
+            self.ring.write(samples[offset:offset + step])
+            f0, onsets = self._analyze_new_frames()
+            frame_f0.append(f0)
+            new_onsets.extend(onsets)
+        f0 = np.concatenate(frame_f0) if frame_f0 else np.zeros(0, dtype=np.float32)
+
+        voiced = f0[f0 > 0]
+        current = None
+        if len(voiced):
+            freq = float(np.median(voiced))
+            cents = 1200 * np.log2(freq / 440.0)
+            current = {
+                "f0": round(freq, 1),
+                "note": hz_to_note(freq),
+                "cents_off": round(float(cents - 100 * np.round(cents / 100)), 1)
+            }
+
+        return {
+            "type": "frames",
+            "time": round(self.frames_seen * HOP_LENGTH / TARGET_SAMPLE_RATE, 2),
+            "hop_seconds": HOP_LENGTH / TARGET_SAMPLE_RATE,
+            "f0": [round(float(value), 1) for value in f0],
+            "current": current,
+            "onsets": new_onsets,
+            "running": self.running_scores(),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _analyze_new_frames(self):
+        available = (self.ring.total_written - self.next_frame - FRAME_LENGTH) // HOP_LENGTH + 1
+        if available <= 0:
+            return np.zeros(0, dtype=np.float32), []
+
+        span = self.ring.read(self.next_frame, (available - 1) * HOP_LENGTH + FRAME_LENGTH)
+        frames = np.lib.stride_tricks.sliding_window_view(span, FRAME_LENGTH)[::HOP_LENGTH]
+        f0, _ = yin_f0(frames, TARGET_SAMPLE_RATE)
+        rms = frame_rms(frames)
+
+        # 近期峰值缓慢衰减，作为相对静音阈值
+        self.peak_rms = max(float(rms.max()), self.peak_rms * 0.995 ** len(rms))
+        silence = silent_frames(rms, self.peak_rms)
+        f0[silence] = 0.0
+
+        self._update_pitch_stats(f0)
+        onsets = self._update_onsets(rms, silence)
+
+        self.next_frame += available * HOP_LENGTH
+        self.frames_seen += available
+        return f0, onsets
+
+    def _update_pitch_stats(self, f0: np.ndarray):
+        voiced = f0 > 0
+        if not voiced.any():
+            self.last_cents = None
+            return
+        cents = 1200 * np.log2(np.where(voiced, f0, 440.0) / 440.0)
+        deviation = np.abs(cents - 100 * np.round(cents / 100))
+        self.deviation_sum += float(deviation[voiced].sum())
+        self.voiced_frames += int(voiced.sum())
+
+        # 相邻有声帧之间的抖动（跨块时接上一块的最后一帧）
+        previous = np.concatenate([[self.last_cents if self.last_cents is not None else np.nan], cents[:-1]])
+        previous_voiced = np.concatenate([[self.last_cents is not None], voiced[:-1]])
+        jitter = np.abs(cents - previous)[voiced & previous_voiced]
+        jitter = jitter[jitter < 100]
+        self.jitter_sum += float(jitter.sum())
+        self.jitter_count += len(jitter)
+        self.last_cents = float(cents[-1]) if voiced[-1] else None
+
+    def _update_onsets(self, rms: np.ndarray, silence: np.ndarray) -> list:
+        """能量上升沿检测；峰值需要下一帧确认，所以起音点会延迟一帧报告
+
+        峰值判定与离线的 detect_onsets 相同（onset_peaks），阈值为增量统计的均值+标准差。
+        """
+        log_energy = np.log10(rms + 1e-6)
+        previous = self.prev_log_energy if self.prev_log_energy is not None else float(log_energy[0])
+        novelty = np.maximum(np.diff(log_energy, prepend=previous), 0.0)
+        self.prev_log_energy = float(log_energy[-1])
+
+        onsets = []
+        first_frame = self.frames_seen
+        for i, value in enumerate(novelty):
+            # Welford 增量均值/方差，作为自适应阈值
+            self.novelty_count += 1
+            delta = value - self.novelty_mean
+            self.novelty_mean += delta / self.novelty_count
+            self.novelty_m2 += delta * (value - self.novelty_mean)
+            std = (self.novelty_m2 / self.novelty_count) ** 0.5
+
+            if len(self.novelty_history) == 2:
+                (before, _), (peak, peak_silent) = self.novelty_history
+                if onset_peaks(before, peak, value, peak_silent, self.novelty_mean + std):
+                    onset_time = (first_frame + i - 1) * HOP_LENGTH / TARGET_SAMPLE_RATE
+                    if not self.onsets or onset_time - self.onsets[-1] >= 0.1:
+                        self.onsets.append(onset_time)
+                        onsets.append(round(onset_time, 2))
+            self.novelty_history.append((float(value), bool(silence[i])))
+        return onsets
+
+    def running_scores(self) -> Dict[str, Any]:
+        pitch_accuracy = 100 - 2 * self.deviation_sum / self.voiced_frames if self.voiced_frames else 0.0
+        pitch_stability = 100 - 2 * self.jitter_sum / self.jitter_count if self.jitter_count else 0.0
+        rhythm_stability = 0.0
+        if len(self.onsets) >= 3:
+            intervals = np.diff(np.asarray(self.onsets))
+            rhythm_stability = 100 * float(np.exp(-intervals.std() / intervals.mean()))
+        return {
+            "pitch_accuracy": round(float(np.clip(pitch_accuracy, 0, 100)), 1),
+            "pitch_stability": round(float(np.clip(pitch_stability, 0, 100)), 1),
+            "rhythm_stability": round(rhythm_stability, 1),
+            "voiced_seconds": round(self.voiced_frames * HOP_LENGTH / TARGET_SAMPLE_RATE, 2)
+        }
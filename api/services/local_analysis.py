@@ -0,0 +1,248 @@
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+# 分析参数（16kHz 输入下：帧长64ms，帧移10ms）
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 1024
+HOP_LENGTH = 160
+F0_MIN = 70.0
+F0_MAX = 1000.0
+YIN_THRESHOLD = 0.15
+# 每次向量化处理的帧数，限制中间矩阵的内存
+BLOCK_FRAMES = 512
+# 静音判断：低于绝对阈值，或低于参考能量（离线为95分位，实时为近期峰值）的比例
+SILENCE_RMS = 1e-3
+SILENCE_RATIO = 0.05
+# 起音点要求的最小对数能量上升（log10(rms)，0.1 约为2dB），持续音、颤音和底噪的帧间起伏远小于此
+MIN_ONSET_RISE = 0.1
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def frame_signal(samples: np.ndarray, frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """按帧切分信号，返回 (帧数, 帧长) 的只读视图，不复制数据"""
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    return np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop_length]
+
+
+def yin_f0(frames: np.ndarray, sample_rate: int = SAMPLE_RATE,
+           f0_min: float = F0_MIN, f0_max: float = F0_MAX,
+           threshold: float = YIN_THRESHOLD) -> Tuple[np.ndarray, np.ndarray]:
+    """YIN基频估计（对所有帧同时计算），返回 (f0, 周期性置信度)，无声帧 f0 为 0"""
+    n_frames, frame_length = frames.shape
+    tau_min = max(2, int(sample_rate / f0_max))
+    tau_max = min(frame_length // 2, int(sample_rate / f0_min) + 1)
+    f0 = np.zeros(n_frames, dtype=np.float32)
+    confidence = np.zeros(n_frames, dtype=np.float32)
+    taus = np.arange(tau_max + 1)
+    fft_size = 1 << int(np.ceil(np.log2(2 * frame_length)))
+
+    for start in range(0, n_frames, BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES].astype(np.float32)
+        window = block[:, :frame_length - tau_max]
+
+        # 差分函数 d(τ) = Σ(x_j - x_{j+τ})²，用FFT互相关求交叉项
+        spectrum_a = np.fft.rfft(window, fft_size)
+        spectrum_b = np.fft.rfft(block, fft_size)
+        cross = np.fft.irfft(np.conj(spectrum_a) * spectrum_b, fft_size)[:, :tau_max + 1]
+        energy_window = np.sum(window ** 2, axis=1, keepdims=True)
+        squares = np.concatenate([np.zeros((len(block), 1), dtype=np.float32), np.cumsum(block ** 2, axis=1)], axis=1)
+        width = window.shape[1]
+        energy_shifted = squares[:, taus + width] - squares[:, taus]
+        diff = np.maximum(energy_window + energy_shifted - 2 * cross, 0.0)
+
+        # 累积均值归一化差分函数 d'(τ)
+        cumulative = np.cumsum(diff[:, 1:], axis=1)
+        cmnd = np.ones_like(diff)
+        cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(cumulative, 1e-12)
+
+        # 取第一个低于阈值的τ所在的谷底；都不低于阈值时视为无声
+        search = cmnd[:, tau_min:tau_max]
+        below = search < threshold
+        voiced = below.any(axis=1)
+        first = np.argmax(below, axis=1)
+        # 从第一个低于阈值的点往后找到谷底（第一个不再下降的位置）
+        cols = np.arange(search.shape[1] - 1)
+        rising = (search[:, 1:] >= search[:, :-1]) & (cols >= first[:, None])
+        idx = np.where(rising.any(axis=1), np.argmax(rising, axis=1), search.shape[1] - 1)
+        rows = np.arange(len(block))
+
+        # 抛物线插值得到亚采样精度的周期
+        left = search[rows, np.maximum(idx - 1, 0)]
+        center = search[rows, idx]
+        right = search[rows, np.minimum(idx + 1, search.shape[1] - 1)]
+        denom = left - 2 * center + right
+        offset = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / np.where(denom == 0, 1, denom), 0.0)
+        period = idx + tau_min + np.clip(offset, -1, 1)
+
+        f0[start:start + len(block)] = np.where(voiced, sample_rate / period, 0.0)
+        confidence[start:start + len(block)] = np.where(voiced, 1.0 - center, 0.0)
+
+    return f0, confidence
+
+
+def frame_rms(frames: np.ndarray) -> np.ndarray:
+    """每帧的均方根能量"""
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def silent_frames(rms: np.ndarray, reference: float) -> np.ndarray:
+    """能量低于 max(SILENCE_RMS, SILENCE_RATIO * reference) 的帧视为静音"""
+    return rms < max(SILENCE_RMS, SILENCE_RATIO * reference)
+
+
+def onset_peaks(before, peak, after, peak_silent, threshold):
+    """起音峰值判定（离线检测和实时分析共用），参数可以是标量或等长数组
+
+    peak 为能量上升的局部峰值，且超过自适应阈值和 MIN_ONSET_RISE 中较大的一个，
+    所在帧不是静音。
+    """
+    return (np.greater(peak, before) & np.greater_equal(peak, after)
+            & np.greater(peak, np.maximum(threshold, MIN_ONSET_RISE)) & np.logical_not(peak_silent))
+
+
+def detect_onsets(rms: np.ndarray, hop_seconds: float, min_gap: float = 0.1) -> np.ndarray:
+    """基于对数能量上升沿检测起音点，返回起音时间（秒）"""
+    if len(rms) < 3:
+        return np.zeros(0, dtype=np.float32)
+    log_energy = np.log10(rms + 1e-6)
+    novelty = np.maximum(np.diff(log_energy, prepend=log_energy[0]), 0.0)
+    threshold = novelty.mean() + novelty.std()
+    silence = silent_frames(rms, float(np.percentile(rms, 95)))
+    is_peak = onset_peaks(novelty[:-2], novelty[1:-1], novelty[2:], silence[1:-1], threshold)
+    peaks = np.flatnonzero(is_peak) + 1
+    # 去掉间隔过近的起音点
+    if len(peaks) > 1:
+        min_frames = int(min_gap / hop_seconds)
+        keep = np.concatenate([[True], np.diff(peaks) >= min_frames])
+        peaks = peaks[keep]
+    return peaks.astype(np.float32) * hop_seconds
+
+
+def hz_to_note(freq: float) -> str:
+    """频率转音名，如 440 -> A4"""
+    midi = int(round(69 + 12 * np.log2(freq / 440.0)))
+    return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+def pitch_contour(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Tuple[np.ndarray, np.ndarray]:
+    """逐帧基频曲线（帧移10ms），返回 (f0, rms)"""
+    frames = frame_signal(samples)
+    f0, confidence = yin_f0(frames, sample_rate)
+    rms = frame_rms(frames)
+    # 能量过低的帧即使有周期性也视为静音
+    f0[silent_frames(rms, float(np.percentile(rms, 95)))] = 0.0
+    return f0, rms
+
+
+def analyze_pcm(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, with_contour: bool = False) -> Dict[str, Any]:
+    """对单声道PCM做音准、节奏和音域分析（结果确定，不依赖云服务）
+
+    with_contour=True 时结果中附带逐帧基频 "f0_contour" 和逐帧能量 "rms_contour"
+    （NumPy数组，不可直接JSON序列化）。
+    """
+    hop_seconds = HOP_LENGTH / sample_rate
+    f0, rms = pitch_contour(samples, sample_rate)
+    voiced_f0 = f0[f0 > 0]
+    duration = len(samples) / sample_rate
+
+    result: Dict[str, Any] = {
+        "duration": round(duration, 2),
+        "voiced_ratio": round(len(voiced_f0) / max(len(f0), 1), 3),
+        "source": "local_dsp"
+    }
+    if with_contour:
+        result["f0_contour"] = f0
+        result["rms_contour"] = rms
+
+    if len(voiced_f0) < 10:
+        result.update({
+            "pitch_accuracy": 0.0,
+            "pitch_stability": 0.0,
+            "rhythm_stability": 0.0,
+            "tempo_bpm": 0.0,
+            "vocal_range": "未检测到歌声"
+        })
+        return result
+
+    # 音准：与最近的十二平均律音高的偏差（音分）
+    cents = 1200 * np.log2(voiced_f0 / 440.0)
+    deviation = np.abs(cents - 100 * np.round(cents / 100))
+    pitch_accuracy = float(np.clip(100 - 2 * deviation.mean(), 0, 100))
+
+    # 音高稳定性：相邻有声帧之间的抖动
+    jitter = np.abs(np.diff(cents))
+    jitter = jitter[jitter < 100]  # 排除换音
+    pitch_stability = float(np.clip(100 - 2 * jitter.mean(), 0, 100)) if len(jitter) else 0.0
+
+    # 节奏：起音间隔的变异系数越小越稳定
+    onsets = detect_onsets(rms, hop_seconds)
+    intervals = np.diff(onsets)
+    if len(intervals) >= 2:
+        cv = float(intervals.std() / intervals.mean())
+        rhythm_stability = float(np.clip(100 * np.exp(-cv), 0, 100))
+        tempo_bpm = float(60.0 / np.median(intervals))
+    else:
+        rhythm_stability = 0.0
+        tempo_bpm = 0.0
+
+    low, high = np.percentile(voiced_f0, [5, 95])
+
+    result.update({
+        "pitch_accuracy": round(pitch_accuracy, 1),
+        "pitch_stability": round(pitch_stability, 1),
+        "rhythm_stability": round(rhythm_stability, 1),
+        "tempo_bpm": round(tempo_bpm, 1),
+        "vocal_range": f"{hz_to_note(low)}-{hz_to_note(high)}",
+        "range_hz": [round(float(low), 1), round(float(high), 1)],
+        "median_f0": round(float(np.median(voiced_f0)), 1),
+        "onset_count": int(len(onsets))
+    })
+    return result
+
+
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并各分段的 analyze_pcm 结果：分数按有声时长加权，节奏按起音数加权，音域取并集"""
+    duration = sum(r["duration"] for r in results)
+    voiced = [r for r in results if "range_hz" in r]
+    voiced_weights = np.array([r["duration"] * r["voiced_ratio"] for r in voiced])
+
+    merged: Dict[str, Any] = {
+        "duration": round(duration, 2),
+        "voiced_ratio": round(sum(r["duration"] * r["voiced_ratio"] for r in results) / max(duration, 1e-9), 3),
+        "source": "local_dsp"
+    }
+    if not voiced or voiced_weights.sum() <= 0:
+        merged.update({
+            "pitch_accuracy": 0.0,
+            "pitch_stability": 0.0,
+            "rhythm_stability": 0.0,
+            "tempo_bpm": 0.0,
+            "vocal_range": "未检测到歌声"
+        })
+        return merged
+
+    def weighted(key: str, weights: np.ndarray, items: List[Dict[str, Any]]) -> float:
+        if weights.sum() <= 0:
+            return 0.0
+        return round(float(np.average([r[key] for r in items], weights=weights)), 1)
+
+    rhythmic = [r for r in voiced if r["tempo_bpm"] > 0]
+    onset_weights = np.array([r["onset_count"] for r in rhythmic], dtype=np.float64)
+    low = min(r["range_hz"][0] for r in voiced)
+    high = max(r["range_hz"][1] for r in voiced)
+
+    merged.update({
+        "pitch_accuracy": weighted("pitch_accuracy", voiced_weights, voiced),
+        "pitch_stability": weighted("pitch_stability", voiced_weights, voiced),
+        "rhythm_stability": weighted("rhythm_stability", onset_weights, rhythmic),
+        "tempo_bpm": weighted("tempo_bpm", onset_weights, rhythmic),
+        "vocal_range": f"{hz_to_note(low)}-{hz_to_note(high)}",
+        "range_hz": [low, high],
+        "median_f0": weighted("median_f0", voiced_weights, voiced),
+        "onset_count": int(sum(r["onset_count"] for r in voiced))
+    })
+    return merged
@@ -0,0 +1,235 @@
+import json
+import time
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple
+
+import numpy as np
+
+from app.services.local_analysis import NOTE_NAMES
+
+# 对齐使用的帧移（秒）：用户基频曲线按5帧（10ms帧移）合并，参考旋律直接按该帧移生成
+ALIGN_HOP = 0.05
+# 单帧代价上限（音分），避免八度误判等离群帧主导对齐
+MAX_FRAME_COST = 300.0
+# 音高偏差在该范围内（音分）视为唱准
+IN_TUNE_CENTS = 50.0
+
+
+def note_to_midi(name: str) -> int:
+    """音名转MIDI编号，如 A4 -> 69、C#5 -> 73"""
+    pitch, octave = name[:-1], int(name[-1])
+    return NOTE_NAMES.index(pitch) + 12 * (octave + 1)
+
+
+class ReferenceMelody(NamedTuple):
+    song_id: str
+    title: str
+    cents: np.ndarray         # 有声帧的音高（MIDI×100），帧移 ALIGN_HOP
+    times: np.ndarray         # 各帧在原曲中的时间（秒）
+    note_index: np.ndarray    # 各帧所属的音符序号
+    notes: List[Dict[str, Any]]
+
+
+def render_melody(song_id: str, spec: Dict[str, Any]) -> ReferenceMelody:
+    """把音符序列（音名 + 拍数）渲染成按 ALIGN_HOP 采样的参考音高曲线，休止符（R）不产生帧"""
+    seconds_per_beat = 60.0 / spec["bpm"]
+    cents, times, note_index, notes = [], [], [], []
+    start = 0.0
+    for name, beats in spec["notes"]:
+        duration = beats * seconds_per_beat
+        if name != "R":
+            frame_times = np.arange(start, start + duration - 1e-9, ALIGN_HOP)
+            index = len(notes)
+            notes.append({"index": index, "note": name, "start": round(start, 3), "duration": round(duration, 3)})
+            cents.append(np.full(len(frame_times), note_to_midi(name) * 100.0))
+            times.append(frame_times)
+            note_index.append(np.full(len(frame_times), index))
+        start += duration
+    return ReferenceMelody(
+        song_id, spec.get("title", song_id),
+        np.concatenate(cents), np.concatenate(times), np.concatenate(note_index), notes
+    )
+
+
+def contour_to_cents(f0: np.ndarray, hop_seconds: float,
+                     pool_seconds: float = ALIGN_HOP) -> Tuple[np.ndarray, np.ndarray]:
+    """把逐帧基频（Hz，无声为0）合并到 pool_seconds 帧移，返回有声帧的 (音分, 时间)
+
+    每组帧中有声帧不少于一半才算有声，音高取组内有声帧的平均音分。
+    """
+    factor = max(1, int(round(pool_seconds / hop_seconds)))
+    usable = len(f0) // factor * factor
+    groups = np.asarray(f0[:usable], dtype=np.float64).reshape(-1, factor)
+    voiced = groups > 0
+    cents = np.where(voiced, 6900 + 1200 * np.log2(np.where(voiced, groups, 440.0) / 440.0), 0.0)
+    counts = voiced.sum(axis=1)
+    keep = counts * 2 >= factor
+    mean_cents = cents.sum(axis=1)[keep] / counts[keep]
+    times = np.flatnonzero(keep) * factor * hop_seconds
+    return mean_cents, times
+
+
+def banded_dtw(x: np.ndarray, y: np.ndarray, radius: int = 100,
+               max_cost: float = MAX_FRAME_COST) -> Tuple[float, np.ndarray]:
+    """Sakoe-Chiba 带约束的DTW，返回 (累计代价, 对齐路径[(i, j), ...])
+
+    只计算（按长度比缩放后的）对角线两侧 radius 帧以内的格子，复杂度 O(n·radius)。
+    带内的代价矩阵和每行的前缀和一次性向量化算出；每行内 D[j] = min(A[j], D[j-1] + c[j])
+    的水平依赖用前缀最小值一次算完：D = C + minimum.accumulate(A - C)（C 为本行代价的
+    前缀和），因此只有按行的循环，没有逐格循环。
+    """
+    n, m = len(x), len(y)
+    # 半径至少要覆盖两条序列长度比带来的斜率，保证相邻行的带相互连通
+    radius = max(int(radius), int(np.ceil(m / n)) + 1, 2)
+    width = 2 * radius + 1
+    centers = np.round(np.arange(n) * ((m - 1) / max(n - 1, 1))).astype(np.int64)
+    lo = np.clip(centers - radius, 0, m - width + 1 if m >= width else 0)
+    cols = np.minimum(width, m - lo)
+
+    # 带内代价：第 i 行第 k 列对应 (i, lo[i] + k)，超出序列的位置代价为 inf
+    y_padded = np.concatenate([y, np.full(width, np.inf)])
+    costs = np.minimum(np.abs(x[:, None] - y_padded[lo[:, None] + np.arange(width)]), max_cost)
+    prefix = np.cumsum(costs, axis=1)
+    # A - C = min(上, 左上) + (c - C)，后一项与递推无关，预先算好
+    offsets = costs - prefix
+
+    # D 的第 i 行第 k+1 列对应 (i, lo[i] + k)；左侧一列、右侧 max_shift+1 列为 inf 边界，
+    # 这样上一行的 (i-1, j) 与 (i-1, j-1) 都可以直接切片得到，循环内不分配内存
+    shifts = np.diff(lo, prepend=lo[0]).tolist()
+    D = np.full((n, width + 2 + max(shifts)), np.inf)
+    D[0, 1:1 + width] = prefix[0]
+    best = np.empty(width)
+    minimum, add, accumulate = np.minimum, np.add, np.minimum.accumulate
+    for i in range(1, n):
+        shift = shifts[i]
+        prev = D[i - 1]
+        minimum(prev[shift + 1:shift + 1 + width], prev[shift:shift + width], out=best)
+        add(best, offsets[i], out=best)
+        accumulate(best, out=best)
+        add(best, prefix[i], out=D[i, 1:1 + width])
+
+    end = int(cols[-1])
+    path = _backtrack(D, lo.tolist(), cols.tolist())
+    return float(D[n - 1, end]), path
+
+
+def _backtrack(D: np.ndarray, lo: List[int], cols: List[int]) -> np.ndarray:
+    # 路径只经过约 n+m 个格子，逐格用 item 读取比把整行转成列表快得多
+    item = D.item
+    inf = float("inf")
+    i = len(lo) - 1
+    j = lo[i] + cols[i] - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        left = item(i, j - lo[i]) if j > lo[i] else inf
+        if i > 0:
+            k = j - lo[i - 1] + 1
+            up = item(i - 1, k) if 0 < k <= cols[i - 1] else inf
+            diagonal = item(i - 1, k - 1) if 1 < k <= cols[i - 1] + 1 else inf
+        else:
+            up = diagonal = inf
+        if diagonal <= up and diagonal <= left:
+            i, j = i - 1, j - 1
+        elif up <= left:
+            i -= 1
+        else:
+            j -= 1
+        path.append((i, j))
+    return np.array(path[::-1], dtype=np.int64)
+
+
+class ReferenceLibrary:
+    """参考旋律库：启动时加载一次，所有参考曲线预先渲染好，比对时只做对齐"""
+
+    def __init__(self, melodies: Dict[str, ReferenceMelody], band_seconds: float = 5.0):
+        self.melodies = melodies
+        # 带宽只需覆盖局部的抢拍/拖拍，整体快慢已由按长度比缩放的对角线吸收
+        self.radius = max(1, int(round(band_seconds / ALIGN_HOP)))
+
+    @classmethod
+    def load(cls, path: str, band_seconds: float = 5.0) -> "ReferenceLibrary":
+        with open(path, encoding="utf-8") as f:
+            specs = json.load(f)
+        return cls({song_id: render_melody(song_id, spec) for song_id, spec in specs.items()}, band_seconds)
+
+    def songs(self) -> List[Dict[str, Any]]:
+        return [
+            {"song_id": melody.song_id, "title": melody.title, "notes": len(melody.notes),
+             "duration": round(melody.notes[-1]["start"] + melody.notes[-1]["duration"], 2)}
+            for melody in self.melodies.values()
+        ]
+
+    def compare(self, song_id: str, f0: np.ndarray, hop_seconds: float) -> Dict[str, Any]:
+        """把用户的基频曲线与参考旋律对齐，给出逐音符的音高偏差和时间偏移
+
+        对齐前先估计移调（用户可以用任意调演唱）：在音高中位数差附近±2个半音内，
+        选使两者半音直方图最吻合的移调量；直方图与速度无关，不必为修正移调再对齐一次。
+        音高偏差是扣除移调后的剩余偏差。
+        """
+        melody = self.melodies[song_id]
+        started = time.perf_counter()
+        user_cents, user_times = contour_to_cents(f0, hop_seconds)
+        if len(user_cents) < 10:
+            return {"song_id": song_id, "title": melody.title, "error": "有声片段太短，无法与参考旋律比对"}
+
+        offset = _estimate_key_offset(user_cents, melody.cents)
+        _, path = banded_dtw(user_cents - offset, melody.cents, self.radius)
+
+        user_idx, ref_idx = path[:, 0], path[:, 1]
+        deviations = user_cents[user_idx] - offset - melody.cents[ref_idx]
+        note_of_step = melody.note_index[ref_idx]
+
+        # 速度比：用户从第一个到最后一个对齐帧的时长 / 参考旋律对应的时长
+        ref_span = melody.times[ref_idx[-1]] - melody.times[ref_idx[0]]
+        user_span = user_times[user_idx[-1]] - user_times[user_idx[0]]
+        tempo_ratio = user_span / ref_span if ref_span > 0 else 1.0
+        user_start, ref_start = user_times[user_idx[0]], melody.times[ref_idx[0]]
+
+        notes = []
+        for note in melody.notes:
+            steps = np.flatnonzero(note_of_step == note["index"])
+            if len(steps) == 0:
+                continue
+            deviation = float(np.median(deviations[steps]))
+            sung_start = float(user_times[user_idx[steps[0]]])
+            expected = user_start + (note["start"] - ref_start) * tempo_ratio
+            notes.append({
+                "index": note["index"],
+                "note": note["note"],
+                "expected_start": round(float(expected), 2),
+                "sung_start": round(sung_start, 2),
+                "timing_offset_ms": int(round((sung_start - expected) * 1000)),
+                "pitch_deviation_cents": round(deviation, 1)
+            })
+
+        abs_deviation = np.array([abs(note["pitch_deviation_cents"]) for note in notes])
+        timing = np.array([abs(note["timing_offset_ms"]) for note in notes])
+        return {
+            "song_id": song_id,
+            "title": melody.title,
+            "key_offset_semitones": int(round(offset / 100)),
+            "tempo_ratio": round(float(tempo_ratio), 3),
+            "notes_matched": len(notes),
+            "notes_total": len(melody.notes),
+            "mean_abs_deviation_cents": round(float(abs_deviation.mean()), 1) if len(notes) else None,
+            "in_tune_ratio": round(float((abs_deviation <= IN_TUNE_CENTS).mean()), 3) if len(notes) else 0.0,
+            "timing_mae_ms": int(timing.mean()) if len(notes) else None,
+            "alignment_ms": round((time.perf_counter() - started) * 1000, 1),
+            "notes": notes
+        }
+
+
+def _estimate_key_offset(user_cents: np.ndarray, ref_cents: np.ndarray, search: int = 2) -> float:
+    """估计用户相对参考旋律的移调（音分，取整到半音）"""
+    user_semis = np.round(user_cents / 100.0).astype(np.int64)
+    ref_semis = np.round(ref_cents / 100.0).astype(np.int64)
+    center = int(np.round((np.median(user_cents) - np.median(ref_cents)) / 100.0))
+    low = min(user_semis.min(), ref_semis.min() + center - search)
+    size = max(user_semis.max(), ref_semis.max() + center + search) - low + 1
+    user_hist = np.bincount(user_semis - low, minlength=size) / len(user_semis)
+    best, best_score = center, -1.0
+    for shift in range(center - search, center + search + 1):
+        ref_hist = np.bincount(ref_semis + shift - low, minlength=size) / len(ref_semis)
+        score = float(np.minimum(user_hist, ref_hist).sum())
+        if score > best_score:
+            best, best_score = shift, score
+    return best * 100.0
@@ -0,0 +1,302 @@
+import os
+import json
+import mmap
+import time
+import struct
+from typing import Dict, Any, List, Tuple, Iterable
+
+import numpy as np
+
+from app.services.melody_compare import contour_to_cents, note_to_midi
+
+# 每个指纹覆盖的相邻音程数（对应 GRAM+1 个音符）
+GRAM = 4
+# 音程截断到 ±MAX_INTERVAL 个半音，每个音程占5位
+MAX_INTERVAL = 12
+_INTERVAL_BITS = 5
+# 相邻音符时值（起音间隔）之比的分类：短了/差不多/长了，每个占2位
+_RATIO_BITS = 2
+_RATIO_BOUNDS = (0.7, 1.45)
+
+# 演唱中的音符：音高偏离当前音符均值超过该值（音分）时切分为新音符（要能切开半音级进）
+NOTE_SPLIT_CENTS = 45.0
+# 切分音符时基频曲线的合并帧移（秒）
+NOTE_POOL_SECONDS = 0.03
+# 短于该时长（秒）的片段视为滑音/噪声，不算音符
+MIN_NOTE_SECONDS = 0.1
+
+_MAGIC = b"MLIX"
+_VERSION = 1
+# magic, version, gram, 键数, 倒排项数, 元数据长度
+_HEADER = struct.Struct("<4sIIIII")
+
+
+class MelodyNotes:
+    """旋律的音符序列：音高（音分，可以是小数）和起音时间（秒）"""
+
+    def __init__(self, cents: np.ndarray, onsets: np.ndarray, end: float):
+        self.cents = cents
+        self.onsets = onsets
+        self.end = end
+
+    def __len__(self) -> int:
+        return len(self.cents)
+
+
+def notes_from_spec(spec: Dict[str, Any]) -> MelodyNotes:
+    """把曲库中的音符序列（音名 + 拍数，R 为休止）转成音符序列，时间按拍计"""
+    cents, onsets = [], []
+    position = 0.0
+    for name, beats in spec["notes"]:
+        if name != "R":
+            cents.append(note_to_midi(name) * 100.0)
+            onsets.append(position)
+        position += beats
+    return MelodyNotes(np.array(cents), np.array(onsets), position)
+
+
+def notes_from_contour(f0: np.ndarray, hop_seconds: float) -> MelodyNotes:
+    """从逐帧基频曲线切分出演唱的音符
+
+    先合并到 NOTE_POOL_SECONDS 帧移，再按音高跳变和停顿切分；过短的片段（滑音、换气）丢弃。
+    阈值偏低时颤音会把一个音切成几段，但同一半音的相邻音符在计算指纹时会合并，
+    漏切半音级进的代价更大。
+    """
+    cents, times = contour_to_cents(f0, hop_seconds, NOTE_POOL_SECONDS)
+    note_cents, note_onsets = [], []
+    start, total, count, last_time = None, 0.0, 0, None
+    min_frames = max(1, int(round(MIN_NOTE_SECONDS / NOTE_POOL_SECONDS)))
+
+    def close():
+        if start is not None and count >= min_frames:
+            note_cents.append(total / count)
+            note_onsets.append(start)
+
+    for value, t in zip(cents.tolist(), times.tolist()):
+        gap = last_time is not None and t - last_time > NOTE_POOL_SECONDS * 1.5
+        if start is None or gap or abs(value - total / count) > NOTE_SPLIT_CENTS:
+            close()
+            start, total, count = t, 0.0, 0
+        total += value
+        count += 1
+        last_time = t
+    close()
+    end = (last_time + NOTE_POOL_SECONDS) if last_time is not None else 0.0
+    return MelodyNotes(np.array(note_cents), np.array(note_onsets), end)
+
+
+def quantize_semitones(cents: np.ndarray, window: int = 6) -> np.ndarray:
+    """把音符音高取整到半音，以附近音符的整体音准为基准
+
+    业余演唱每个音常有二三十音分的偏差，而且整体可能偏离标准音高、逐渐跑低。
+    以前后 window 个音符相对半音格的圆周平均偏移为基准再取整，比逐个音程取整
+    稳定得多：只有明显偏离周围音准的那个音才会被取错。
+    """
+    phase = np.exp(2j * np.pi * (cents % 100.0) / 100.0)
+    padded = np.concatenate([[0], np.cumsum(phase)])
+    index = np.arange(len(cents))
+    low, high = np.maximum(index - window, 0), np.minimum(index + window + 1, len(cents))
+    offset = np.angle(padded[high] - padded[low]) / (2 * np.pi) * 100.0
+    return np.round((cents - offset) / 100.0).astype(np.int64)
+
+
+def fingerprints(notes: MelodyNotes) -> Tuple[np.ndarray, np.ndarray]:
+    """音符序列的指纹，返回 (指纹, 起始音符序号)
+
+    指纹由 GRAM 个相邻音程（半音）和 GRAM-1 个相邻起音间隔之比的分类组成，与调和
+    速度无关。同音高的连续音符先合并：演唱时同音重复常常连成一个长音，
+    合并后参考旋律和演唱的音符才能一一对应。
+    """
+    if len(notes) < 2:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+    intervals = np.diff(quantize_semitones(notes.cents))
+    keep = np.concatenate([[True], intervals != 0])
+    onsets = notes.onsets[keep]
+    intervals = np.clip(intervals[intervals != 0], -MAX_INTERVAL, MAX_INTERVAL)
+    if len(intervals) < GRAM:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+
+    ioi = np.diff(np.append(onsets, notes.end))
+    ratios = ioi[1:] / np.maximum(ioi[:-1], 1e-6)
+    ratio_class = np.searchsorted(_RATIO_BOUNDS, ratios)
+
+    count = len(intervals) - GRAM + 1
+    keys = np.zeros(count, dtype=np.int64)
+    for k in range(GRAM):
+        keys = (keys << _INTERVAL_BITS) | (intervals[k:k + count] + MAX_INTERVAL)
+    for k in range(GRAM - 1):
+        keys = (keys << _RATIO_BITS) | ratio_class[k:k + count]
+    return keys.astype(np.uint32), np.arange(count)
+
+
+def _interval_variants(keys: np.ndarray) -> np.ndarray:
+    """每个指纹的容错变体，覆盖单个音唱偏一个半音的情况
+
+    首尾音唱偏只影响一个音程（±1）；中间的音唱偏会让相邻两个音程一个+1、一个-1。
+    不合法的变体（出现0音程或超出范围）记为-1。
+    """
+    base = keys.astype(np.int64)
+    mask = (1 << _INTERVAL_BITS) - 1
+    shifts = [_RATIO_BITS * (GRAM - 1) + _INTERVAL_BITS * (GRAM - 1 - k) for k in range(GRAM)]
+    fields = [(base >> shift) & mask for shift in shifts]
+
+    def valid(field):
+        return (field >= 0) & (field <= 2 * MAX_INTERVAL) & (field != MAX_INTERVAL)
+
+    variants = [base]
+    for k in range(GRAM):
+        for delta in (-1, 1):
+            variants.append(np.where(valid(fields[k] + delta), base + (delta << shifts[k]), -1))
+    for k in range(GRAM - 1):
+        for delta in (-1, 1):
+            ok = valid(fields[k] + delta) & valid(fields[k + 1] - delta)
+            variants.append(np.where(ok, base + (delta << shifts[k]) - (delta << shifts[k + 1]), -1))
+    return np.stack(variants)
+
+
+def build_index(path: str, songs: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """离线构建旋律指纹倒排索引并写入 path（先写临时文件再替换）
+
+    songs 为 (song_id, 曲谱) 序列，曲谱格式与 reference_melodies.json 相同。
+    文件布局：头部 | 键(uint32，有序) | 偏移(uint32，键数+1) | 歌曲序号(uint32) | 音符位置(uint32) | 元数据JSON
+    """
+    meta, all_keys, all_songs, all_positions = [], [], [], []
+    for song_id, spec in songs:
+        keys, positions = fingerprints(notes_from_spec(spec))
+        all_keys.append(keys)
+        all_songs.append(np.full(len(keys), len(meta), dtype=np.uint32))
+        all_positions.append(positions.astype(np.uint32))
+        meta.append({"song_id": song_id, "title": spec.get("title", song_id)})
+
+    keys = np.concatenate(all_keys) if all_keys else np.empty(0, dtype=np.uint32)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    post_songs = np.concatenate(all_songs)[order] if all_songs else np.empty(0, dtype=np.uint32)
+    post_positions = np.concatenate(all_positions)[order] if all_positions else np.empty(0, dtype=np.uint32)
+    unique_keys, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.uint32)
+    meta_bytes = json.dumps({"songs": meta}, ensure_ascii=False).encode("utf-8")
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, GRAM, len(unique_keys), len(keys), len(meta_bytes)))
+        for array in (unique_keys, offsets, post_songs, post_positions):
+            f.write(np.ascontiguousarray(array, dtype="<u4").tobytes())
+        f.write(meta_bytes)
+    os.replace(temp_path, path)
+    return {"songs": len(meta), "keys": int(len(unique_keys)), "postings": int(len(keys)),
+            "bytes": os.path.getsize(path)}
+
+
+class MelodyIndex:
+    """只读的旋律指纹索引（内存映射，多个进程共享同一份页缓存）
+
+    查询时对每个指纹及其容错变体二分查找倒排表，按 (歌曲, 参考位置-查询位置)
+    投票：同一首歌里位置差一致的命中越多，越可能是这首歌。
+    """
+
+    def __init__(self, path: str, max_postings: int = 2000):
+        self.path = path
+        self.max_postings = max_postings
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, gram, n_keys, n_postings, meta_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION or gram != GRAM:
+            self._mmap.close()
+            raise ValueError(f"不是兼容的旋律索引文件: {path}")
+        offset = _HEADER.size
+        arrays = []
+        for count in (n_keys, n_keys + 1, n_postings, n_postings):
+            arrays.append(np.frombuffer(self._mmap, dtype="<u4", count=count, offset=offset))
+            offset += count * 4
+        self.keys, self.offsets, self.post_songs, self.post_positions = arrays
+        self.songs: List[Dict[str, str]] = json.loads(self._mmap[offset:offset + meta_len].decode("utf-8"))["songs"]
+        self.queries = 0
+
+    def close(self):
+        # frombuffer 的数组仍引用映射时不能关闭，交给垃圾回收
+        self.keys = self.offsets = self.post_songs = self.post_positions = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def identify(self, f0: np.ndarray, hop_seconds: float, top_k: int = 5) -> Dict[str, Any]:
+        """从逐帧基频曲线识别歌曲，返回候选列表（按得分从高到低）"""
+        started = time.perf_counter()
+        notes = notes_from_contour(f0, hop_seconds)
+        candidates, grams = self.lookup(notes, top_k)
+        return {
+            "candidates": candidates,
+            "notes": len(notes),
+            "fingerprints": grams,
+            "lookup_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def lookup(self, notes: MelodyNotes, top_k: int = 5) -> Tuple[List[Dict[str, Any]], int]:
+        """按音符序列查询，返回 (候选列表, 查询指纹数)"""
+        self.queries += 1
+        query_keys, query_positions = fingerprints(notes)
+        if len(query_keys) == 0 or len(self.keys) == 0:
+            return [], int(len(query_keys))
+
+        variants = _interval_variants(query_keys)
+        flat = variants.ravel()
+        flat_positions = np.tile(query_positions, len(variants))
+        valid = flat >= 0
+        flat, flat_positions = flat[valid].astype(np.uint32), flat_positions[valid]
+
+        slots = np.searchsorted(self.keys, flat)
+        slots = np.minimum(slots, len(self.keys) - 1)
+        found = self.keys[slots] == flat
+        slots, flat_positions = slots[found], flat_positions[found]
+        starts = self.offsets[slots].astype(np.int64)
+        lengths = self.offsets[slots + 1].astype(np.int64) - starts
+        # 出现在大量歌曲中的指纹（音阶式的常见走向）几乎没有区分度，跳过
+        common = lengths <= self.max_postings
+        starts, lengths, flat_positions = starts[common], lengths[common], flat_positions[common]
+        total = int(lengths.sum())
+        if total == 0:
+            return [], int(len(query_keys))
+
+        # 展开所有命中的倒排区间
+        first = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        postings = first + np.arange(total)
+        songs = self.post_songs[postings].astype(np.int64)
+        deltas = self.post_positions[postings].astype(np.int64) - np.repeat(flat_positions, lengths)
+
+        # 同一个查询指纹的多个变体命中同一位置只算一票：(歌曲, 位置差, 查询指纹) 去重后
+        # 再按 (歌曲, 位置差) 计数，三者打包成一个int64排序比按列去重快得多
+        query_index = np.repeat(flat_positions, lengths)
+        votes = np.unique((songs << 40) | ((deltas + (1 << 23)) << 16) | query_index)
+        pairs, counts = np.unique(votes >> 16, return_counts=True)
+        best = np.zeros(len(self.songs), dtype=np.int64)
+        np.maximum.at(best, pairs >> 24, counts)
+        ranked = np.argsort(-best, kind="stable")[:top_k]
+        candidates = [
+            {
+                "song_id": self.songs[song]["song_id"],
+                "title": self.songs[song]["title"],
+                "score": int(best[song]),
+                "confidence": round(float(best[song]) / len(query_keys), 3)
+            }
+            for song in ranked.tolist() if best[song] > 0
+        ]
+        return candidates, int(len(query_keys))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "songs": len(self.songs),
+            "keys": int(len(self.keys)) if self.keys is not None else 0,
+            "postings": int(len(self.post_songs)) if self.post_songs is not None else 0,
+            "queries": self.queries
+        }
+
+
+def load_song_specs(paths: Iterable[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """读取一个或多个曲谱JSON文件（格式同 reference_melodies.json），后出现的同名歌曲覆盖前面的"""
+    specs: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            specs.update(json.load(f))
+    return list(specs.items())
@@ -0,0 +1,188 @@
+import os
+import shutil
+import zipfile
+from typing import Optional, List, Tuple, Union, Callable, BinaryIO, Iterable
+
+import aiofiles
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+
+# 上传限制（50MB）与每次读取的块大小（1MB）
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 请求体中表单字段和multipart分隔的余量
+FORM_OVERHEAD = 64 * 1024
+
+# 支持的音频格式
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.ogg', '.mpeg')
+# MP4封装的 moov 块常在文件末尾，ffmpeg无法从管道解码，这类上传总是写入暂存目录
+SEEKABLE_ONLY_EXTENSIONS = ('.m4a',)
+
+
+def _too_large(size: int, max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"文件太大 ({size/1024/1024:.1f}MB)，请选择小于{max_size//1024//1024}MB的文件"
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI中间件：在解析表单之前限制上传请求的大小
+
+    Starlette 在调用处理函数之前就会接收并缓存整个multipart请求体，处理函数中再检查
+    文件大小时上传已经全部收完。这里先看 Content-Length，超限直接返回413，不读取
+    请求体；没有 Content-Length（分块传输）或声明的长度不实时，边接收边计数，超限时
+    中止接收（抛出的 HTTPException 由 FastAPI 转成413）。只作用于 paths 中的路径。
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_size: int = MAX_UPLOAD_SIZE + FORM_OVERHEAD):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_size:
+            error = _too_large(int(declared), self.max_size)
+            await JSONResponse({"detail": error.detail}, status_code=error.status_code)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise _too_large(received, self.max_size)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def save_upload_file(
+    upload_file: UploadFile,
+    destination: str,
+    max_size: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> int:
+    """分块把上传文件写入磁盘，边写边检查大小，超限时中止并返回413
+
+    内存中最多只保留一个块，返回写入的总字节数。处理函数拿到 UploadFile 时整个
+    请求体已经被接收，提前拒绝由 UploadSizeLimitMiddleware 负责，这里只是兜底。
+    """
+    # UploadFile.size 是Starlette接收完这个文件后统计的大小，超限时不必再复制
+    declared_size: Optional[int] = getattr(upload_file, "size", None)
+    if declared_size is not None and declared_size > max_size:
+        raise _too_large(declared_size, max_size)
+
+    total = 0
+    try:
+        async with aiofiles.open(destination, 'wb') as out_file:
+            while True:
+                chunk = await upload_file.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_size:
+                    raise _too_large(total, max_size)
+                await out_file.write(chunk)
+    except BaseException:
+        # 中止或出错时删除不完整的文件
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+
+    return total
+
+
+async def receive_upload(
+    upload_file: UploadFile,
+    spool,
+    suffix: str = "",
+    max_size: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+):
+    """分块把上传接收到暂存区（spool 为 app.core.spool.UploadSpool），返回 SpooledUpload
+
+    小文件留在内存中，大文件写入暂存目录；超过 max_size 时返回413，暂存区已满时
+    抛出 SpoolFullError。出错时已接收的内容立即释放。与 save_upload_file 相同，
+    提前拒绝由 UploadSizeLimitMiddleware 负责。
+    """
+    # UploadFile.size 是Starlette接收完这个文件后统计的大小，超限时不必再复制
+    declared_size: Optional[int] = getattr(upload_file, "size", None)
+    if declared_size is not None and declared_size > max_size:
+        raise _too_large(declared_size, max_size)
+
+    writer = spool.writer(suffix, declared_size, in_memory=suffix not in SEEKABLE_ONLY_EXTENSIONS)
+    total = 0
+    try:
+        while True:
+            chunk = await upload_file.read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_size:
+                raise _too_large(total, max_size)
+            await writer.write(chunk)
+        return await writer.finish()
+    except BaseException:
+        await writer.abort()
+        raise
+
+
+def extract_zip_audio(
+    zip_source: Union[str, BinaryIO],
+    target_path: Callable[[int, str], str],
+    max_files: int,
+    max_size: int = MAX_UPLOAD_SIZE
+) -> List[Tuple[str, str]]:
+    """解压zip中的音频文件（阻塞调用，应在线程中执行），返回 [(原文件名, 解压路径)]
+
+    zip_source 为文件路径或可随机访问的文件对象；每个文件写入前调用
+    target_path(解压后大小, 扩展名) 取得目标路径（调用方可借此预留空间）。
+    只解压支持的音频格式；单个文件超过 max_size 或文件数超过 max_files 时返回413/400。
+    """
+    extracted = []
+    try:
+        with zipfile.ZipFile(zip_source) as archive:
+            entries = [
+                info for info in archive.infolist()
+                if not info.is_dir() and os.path.splitext(info.filename.lower())[1] in AUDIO_EXTENSIONS
+            ]
+            if len(entries) > max_files:
+                raise HTTPException(status_code=400, detail=f"文件数量过多，最多{max_files}个")
+            
+            for info in entries:
+                if info.file_size > max_size:
+                    raise _too_large(info.file_size, max_size)
+                ext = os.path.splitext(info.filename.lower())[1]
+                target = target_path(info.file_size, ext)
+                with archive.open(info) as source, open(target, 'wb') as out_file:
+                    # 不信任zip头中声明的大小，复制时再限制一次
+                    shutil.copyfileobj(_LimitedReader(source, max_size), out_file, UPLOAD_CHUNK_SIZE)
+                extracted.append((os.path.basename(info.filename), target))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="无效的zip文件")
+    return extracted
+
+
+class _LimitedReader:
+    """读取超过上限时抛出413"""
+
+    def __init__(self, source, max_size: int):
+        self.source = source
+        self.max_size = max_size
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.source.read(size)
+        self.total += len(chunk)
+        if self.total > self.max_size:
+            raise _too_large(self.total, self.max_size)
+        return chunk
@@ -0,0 +1,78 @@
+"""基准测试用的应用入口：加载 api/main.py，并把OSS替换为本地替身
+
+由 benchmarks/pipeline.py 通过 uvicorn 启动，不要在生产环境使用。
+替身的行为由环境变量控制：
+    BENCH_OSS_LATENCY     每次OSS调用的模拟延迟（秒）
+    BENCH_OSS_ERROR_RATE  put_object / upload_part 失败的概率
+ASR 通过 ALIYUN_ASR_BASE_URL 指向 pipeline.py 启动的本地 dashscope 替身。
+"""
+import os
+import sys
+import time
+import random
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+import endpoints  # noqa: E402
+from main import app  # noqa: E402
+from app.core.cloud_services import CloudServiceManager  # noqa: E402
+
+
+class FakeBucket:
+    """与 oss2.Bucket 接口兼容的内存替身，带可配置的延迟和错误率"""
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.objects = {}
+        self.parts = {}
+        self._lock = threading.Lock()
+
+    def _call(self, may_fail: bool = True):
+        time.sleep(self.latency)
+        if may_fail and random.random() < self.error_rate:
+            raise IOError("模拟OSS错误")
+
+    def put_object(self, key, data):
+        self._call()
+        # 只记录大小，避免基准过程中内存持续增长
+        self.objects[key] = len(data)
+        return SimpleNamespace(status=200)
+
+    def delete_object(self, key):
+        self._call(may_fail=False)
+        self.objects.pop(key, None)
+
+    def sign_url(self, method, key, expires):
+        return f"http://fake-oss.local/{key}?expires={expires}"
+
+    def init_multipart_upload(self, key):
+        self._call(may_fail=False)
+        return SimpleNamespace(upload_id=f"upload-{key}")
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self._call()
+        with self._lock:
+            self.parts.setdefault(upload_id, {})[part_number] = len(data)
+        return SimpleNamespace(etag=f"etag-{part_number}")
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self._call(may_fail=False)
+        with self._lock:
+            self.objects[key] = sum(self.parts.pop(upload_id, {}).values())
+        return SimpleNamespace(status=200)
+
+    def abort_multipart_upload(self, key, upload_id):
+        with self._lock:
+            self.parts.pop(upload_id, None)
+
+
+bucket = FakeBucket(
+    latency=float(os.getenv("BENCH_OSS_LATENCY", "0.05")),
+    error_rate=float(os.getenv("BENCH_OSS_ERROR_RATE", "0"))
+)
+manager = CloudServiceManager(endpoints.settings, oss_bucket=bucket)
+endpoints.cloud_manager = manager
+endpoints.analysis_service.cloud_manager = manager
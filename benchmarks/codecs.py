@@ -0,0 +1,113 @@
+"""上传编码基准：比较 WAV / FLAC / Opus 的体积、编码耗时、传输字节数和端到端耗时
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包和 ffmpeg）:
+    python benchmarks/codecs.py
+    python benchmarks/codecs.py --durations 10,45 --opus-bitrates 16000,24000,32000 --uplink-mbps 20
+
+端到端耗时按模型估算：编码耗时 + 按上行带宽计算的传输时间；OSS方式还要加上ASR
+从OSS读取的时间（--oss-fetch-mbps）。有损编码会解码回PCM，对比本地音准分析的结果
+衡量失真（感知编码不保留波形，信噪比没有参考意义），确认在ASR可接受的范围内。结果以JSON输出。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import SYNTHS  # noqa: E402
+from app.core.audio_buffer import NormalizedAudio, normalize_samples  # noqa: E402
+from app.core.codecs import encode_audio, available_codecs  # noqa: E402
+from app.services.local_analysis import analyze_pcm  # noqa: E402
+
+
+def make_audio(kind: str, duration: float) -> NormalizedAudio:
+    samples = (np.clip(SYNTHS[kind](duration), -1, 1) * 32767).astype("<i2")
+    return NormalizedAudio(normalize_samples(samples.tobytes(), 2, 1, 44100))
+
+
+def decode_to_pcm(data: bytes) -> np.ndarray:
+    """用ffmpeg把编码结果解回16kHz单声道PCM"""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ar", "16000", "-ac", "1", "pipe:1"],
+        input=data, capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def bench_codec(audio: NormalizedAudio, codec: str, bitrate: int, runs: int, args) -> dict:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        encoded = encode_audio(audio, codec, opus_bitrate=bitrate)
+        timings.append(time.perf_counter() - started)
+    encode_seconds = statistics.median(timings)
+    size = len(encoded.data)
+    uplink = args.uplink_mbps * 1e6 / 8
+    oss_fetch = args.oss_fetch_mbps * 1e6 / 8
+
+    result = {
+        "codec": encoded.codec,
+        "bitrate": bitrate if encoded.codec == "opus" else None,
+        "bytes": size,
+        "ratio_vs_wav": round(size / (audio.nbytes + 44), 4),
+        "encode_seconds": round(encode_seconds, 4),
+        "inline": {
+            "bytes_moved": int(size * 4 / 3),
+            "est_seconds": round(encode_seconds + size * 4 / 3 / uplink, 4)
+        },
+        "oss": {
+            "bytes_moved": size * 2,
+            "est_seconds": round(encode_seconds + size / uplink + size / oss_fetch, 4)
+        }
+    }
+    if encoded.codec == "opus":
+        decoded = decode_to_pcm(encoded.data)
+        reference = analyze_pcm(audio.as_float())
+        lossy = analyze_pcm(decoded.astype(np.float32) / 32768.0)
+        result["fidelity"] = {
+            "pitch_accuracy_delta": round(lossy["pitch_accuracy"] - reference["pitch_accuracy"], 2),
+            "median_f0_delta_hz": round(lossy.get("median_f0", 0) - reference.get("median_f0", 0), 2)
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传编码基准")
+    parser.add_argument("--durations", default="10,45")
+    parser.add_argument("--kinds", default="vibrato,noisy")
+    parser.add_argument("--opus-bitrates", default="16000,24000,32000")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="服务器到OSS/ASR的上行带宽")
+    parser.add_argument("--oss-fetch-mbps", type=float, default=200.0, help="ASR从OSS读取的带宽（同地域内网）")
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    results = []
+    for kind in args.kinds.split(","):
+        for duration in (float(value) for value in args.durations.split(",")):
+            audio = make_audio(kind, duration)
+            entries = [bench_codec(audio, "wav", 0, args.runs, args)]
+            if "flac" in codecs:
+                entries.append(bench_codec(audio, "flac", 0, args.runs, args))
+            if "opus" in codecs:
+                for bitrate in (int(value) for value in args.opus_bitrates.split(",")):
+                    entries.append(bench_codec(audio, "opus", bitrate, args.runs, args))
+            results.append({"audio": f"{kind}-{duration:g}s", "duration": duration, "codecs": entries})
+
+    print(json.dumps({
+        "available_codecs": codecs,
+        "uplink_mbps": args.uplink_mbps,
+        "oss_fetch_mbps": args.oss_fetch_mbps,
+        "results": results
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""冷启动基准：测量应用模块的导入耗时和首字节时间（TTFB）
+
+用法（在仓库根目录运行）:
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --app main:app --app-dir api --path /api/health
+
+每一轮都启动全新的Python进程，结果以JSON输出。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+IMPORT_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+import importlib
+module = importlib.import_module({module!r})
+elapsed = time.perf_counter() - started
+heavy = [name for name in ("oss2", "aiohttp", "pydub") if name in sys.modules]
+print(json.dumps({{"import_seconds": elapsed, "heavy_modules_loaded": heavy}}))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(module: str, app_dir: str, env: dict) -> dict:
+    code = IMPORT_SNIPPET.format(app_dir=app_dir, module=module)
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_ttfb(app: str, app_dir: str, path: str, env: dict, timeout: float = 60.0) -> float:
+    """从启动uvicorn进程到收到第一个响应字节的时间"""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", app_dir, "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    response.read(1)
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"{timeout}秒内未收到响应")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--app-dir", default="api")
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offline", action="store_true",
+                        help="把OSS/ASR指向不可达地址，验证网络不可用时启动不会被阻塞")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offline:
+        env.update({
+            "ALIYUN_ACCESS_KEY_ID": "bench-key-id",
+            "ALIYUN_ACCESS_KEY_SECRET": "bench-key-secret",
+            "ALIYUN_OSS_ENDPOINT": "http://10.255.255.1",
+            "ALIYUN_ASR_BASE_URL": "http://10.255.255.1",
+        })
+
+    module = args.app.split(":")[0]
+    imports = [measure_import(module, args.app_dir, env) for _ in range(args.runs)]
+    ttfbs = [measure_ttfb(args.app, args.app_dir, args.path, env) for _ in range(args.runs)]
+    import_times = [run["import_seconds"] for run in imports]
+
+    print(json.dumps({
+        "app": args.app,
+        "runs": args.runs,
+        "offline": args.offline,
+        "import_seconds": {"median": statistics.median(import_times), "max": max(import_times)},
+        "ttfb_seconds": {"median": statistics.median(ttfbs), "max": max(ttfbs)},
+        "heavy_modules_loaded_at_import": imports[-1]["heavy_modules_loaded"],
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""上传解码基准：比较原来的 pydub 解码路径和新的解码路径（WAV原生解析 / ffmpeg管道）
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包和 ffmpeg）:
+    python benchmarks/decode.py
+    python benchmarks/decode.py --duration 45 --runs 5 --formats wav16k,wav44k,mp3
+
+每种格式从同一段合成演唱生成（WAV 直接用 wave 写出，压缩格式用ffmpeg编码），
+分别以文件路径（线上上传走的方式）和字节两种输入，计时 decode_audio_pydub（改动前）
+和 decode_audio（改动后）的中位耗时，并记录新路径实际使用的解码器。改动前的路径
+依赖 ffprobe，缺少时记录报错而不是耗时。结果以JSON输出。
+"""
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import SYNTHS, SAMPLE_RATE  # noqa: E402
+from app.core.transcoder import decode_audio, decode_audio_pydub  # noqa: E402
+
+# 名称 -> (扩展名, 采样率, 声道数, 位宽 / ffmpeg编码参数)
+FORMATS = {
+    "wav16k": ("wav", 16000, 1, 2),
+    "wav44k": ("wav", 44100, 2, 2),
+    "wav48k24": ("wav", 48000, 2, 3),
+    "flac": ("flac", 44100, 2, ["-c:a", "flac"]),
+    "mp3": ("mp3", 44100, 2, ["-c:a", "libmp3lame", "-b:a", "128k"]),
+    "m4a": ("m4a", 44100, 2, ["-c:a", "aac", "-b:a", "128k"]),
+    "ogg": ("ogg", 44100, 2, ["-c:a", "libvorbis", "-q:a", "4"]),
+    "opus": ("opus", 48000, 1, ["-c:a", "libopus", "-b:a", "32k"]),
+}
+
+
+def write_wav(path: str, signal: np.ndarray, rate: int, channels: int, width: int):
+    pcm = np.clip(signal, -1, 1)
+    if width == 3:
+        ints = (pcm * 8388607).astype("<i4")
+        frames = ints.view(np.uint8).reshape(-1, 4)[:, :3]
+    else:
+        frames = (pcm * 32767).astype("<i2")
+    interleaved = np.repeat(frames[:, None], channels, axis=1)
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(width)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(interleaved.tobytes())
+
+
+def make_file(directory: str, name: str, signal: np.ndarray) -> str:
+    extension, rate, channels, params = FORMATS[name]
+    path = os.path.join(directory, f"{name}.{extension}")
+    if extension == "wav":
+        write_wav(path, signal, rate, channels, params)
+        return path
+    source = os.path.join(directory, f"{name}-source.wav")
+    write_wav(source, signal, rate, channels, 2)
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", source, *params, path], check=True)
+    os.remove(source)
+    return path
+
+
+def time_decoder(decoder, source, runs: int) -> dict:
+    timings = []
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            audio = decoder(source)
+            timings.append(time.perf_counter() - started)
+    except Exception as e:
+        return {"error": str(e).splitlines()[0][:200]}
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "decoder": audio.original.get("decoder", "pydub"),
+        "samples": len(audio.samples)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传解码基准")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--kind", default="vibrato", choices=sorted(SYNTHS))
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    signal = SYNTHS[args.kind](args.duration)
+    # 合成信号按 SAMPLE_RATE 生成，其他采样率的文件按时间轴插值得到
+    base_times = np.arange(len(signal)) / SAMPLE_RATE
+    directory = tempfile.mkdtemp(prefix="decode-bench-")
+    results = []
+    try:
+        for name in args.formats.split(","):
+            rate = FORMATS[name][1]
+            resampled = np.interp(np.arange(int(args.duration * rate)) / rate, base_times, signal)
+            try:
+                path = make_file(directory, name, resampled)
+            except (OSError, subprocess.CalledProcessError) as e:
+                results.append({"format": name, "error": f"无法生成测试文件: {e}"})
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            entry = {"format": name, "file_bytes": len(data)}
+            for input_kind, source in (("path", path), ("bytes", data)):
+                before = time_decoder(decode_audio_pydub, source, args.runs)
+                after = time_decoder(decode_audio, source, args.runs)
+                if "median_ms" in before and "median_ms" in after and after["median_ms"] > 0:
+                    after["speedup"] = round(before["median_ms"] / after["median_ms"], 1)
+                entry[input_kind] = {"before": before, "after": after}
+            results.append(entry)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps({
+        "duration": args.duration,
+        "runs": args.runs,
+        "ffmpeg": shutil.which("ffmpeg"),
+        "ffprobe": shutil.which("ffprobe"),
+        "results": results
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""旋律指纹索引基准：合成曲库 + 模拟演唱的查询，报告召回率和查询延迟
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包）:
+    python benchmarks/melody_index.py
+    python benchmarks/melody_index.py --songs 5000 --queries 500 --excerpt-notes 12 --pitch-error 0.05
+
+曲库为随机生成的调式旋律（以级进为主，夹带跳进和同音重复）。每个查询从随机一首
+歌里截取一段，按随机的调（±6半音）和速度（0.8~1.25倍）渲染成10ms帧移的基频曲线，
+加上音高抖动、颤音、时值误差、音符间的停顿，并以 --pitch-error 的概率把某个音唱偏
+一个半音。查询走与线上相同的路径（切分音符 -> 指纹 -> 倒排查找），报告 recall@k、
+查询延迟和首位候选的置信度分布，结果以JSON输出。
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+from app.services.local_analysis import NOTE_NAMES
+from app.services.melody_index import build_index, MelodyIndex
+
+HOP = 0.01
+# C大调音阶内的MIDI音高（C3-C6）
+SCALE = [midi for midi in range(48, 85) if midi % 12 in (0, 2, 4, 5, 7, 9, 11)]
+
+
+def random_song(rng: random.Random, length: int) -> dict:
+    position = rng.randrange(7, 14)
+    notes = []
+    for _ in range(length):
+        step = rng.choices([0, 1, -1, 2, -2, 3, -3, 4, -4, 7], [2, 6, 6, 3, 3, 1, 1, 1, 1, 0.5])[0]
+        position = min(max(position + step, 0), len(SCALE) - 1)
+        midi = SCALE[position]
+        beats = rng.choices([0.5, 1, 1.5, 2], [3, 5, 1, 1])[0]
+        notes.append([f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}", beats])
+        if rng.random() < 0.05:
+            notes.append(["R", rng.choice([0.5, 1])])
+    return {"title": f"song-{rng.random():.6f}", "bpm": rng.randrange(70, 140), "notes": notes}
+
+
+def render_query(rng: random.Random, spec: dict, start: int, count: int, pitch_error: float) -> np.ndarray:
+    """把曲谱的一段渲染成模拟演唱的逐帧基频（Hz，无声为0）"""
+    transpose = rng.randint(-6, 6)
+    seconds_per_beat = 60.0 / spec["bpm"] * rng.uniform(0.8, 1.25)
+    frames = [np.zeros(rng.randrange(10, 50))]
+    for name, beats in spec["notes"][start:start + count]:
+        length = max(3, int(beats * seconds_per_beat * rng.uniform(0.85, 1.15) / HOP))
+        if name == "R":
+            frames.append(np.zeros(length))
+            continue
+        midi = NOTE_NAMES.index(name[:-1]) + 12 * (int(name[-1]) + 1) + transpose
+        if rng.random() < pitch_error:
+            midi += rng.choice([-1, 1])
+        cents = midi * 100 + rng.gauss(0, 20)
+        t = np.arange(length) * HOP
+        contour = cents + 30 * np.sin(2 * np.pi * 5.5 * t) * np.minimum(1, t * 3)
+        f0 = 440.0 * 2 ** ((contour - 6900) / 1200)
+        # 音符之间的换气/咬字
+        gap = rng.randrange(0, 6)
+        f0[length - gap:] = 0
+        frames.append(f0)
+    frames.append(np.zeros(rng.randrange(10, 50)))
+    return np.concatenate(frames)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="旋律指纹索引基准")
+    parser.add_argument("--songs", type=int, default=5000)
+    parser.add_argument("--song-notes", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--excerpt-notes", type=int, default=12)
+    parser.add_argument("--pitch-error", type=float, default=0.05, help="每个音唱偏一个半音的概率")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    songs = [(f"s{i:05d}", random_song(rng, args.song_notes)) for i in range(args.songs)]
+    index_path = os.path.join(tempfile.mkdtemp(prefix="melody-index-"), "melody_index.bin")
+
+    started = time.perf_counter()
+    build = build_index(index_path, songs)
+    build["seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    index = MelodyIndex(index_path)
+    open_ms = (time.perf_counter() - started) * 1000
+
+    ranks, latencies, confidences = [], [], {"correct": [], "wrong": []}
+    for _ in range(args.queries):
+        target = rng.randrange(len(songs))
+        song_id, spec = songs[target]
+        start = rng.randrange(0, max(1, len(spec["notes"]) - args.excerpt_notes))
+        f0 = render_query(rng, spec, start, args.excerpt_notes, args.pitch_error)
+        t = time.perf_counter()
+        result = index.identify(f0, HOP, args.top_k)
+        latencies.append((time.perf_counter() - t) * 1000)
+        ids = [candidate["song_id"] for candidate in result["candidates"]]
+        ranks.append(ids.index(song_id) + 1 if song_id in ids else None)
+        if ids:
+            top = result["candidates"][0]["confidence"]
+            confidences["correct" if ids[0] == song_id else "wrong"].append(top)
+
+    def recall(k):
+        return round(sum(1 for rank in ranks if rank is not None and rank <= k) / len(ranks), 3)
+
+    print(json.dumps({
+        "index": {**build, "open_ms": round(open_ms, 3)},
+        "queries": args.queries,
+        "excerpt_notes": args.excerpt_notes,
+        "pitch_error": args.pitch_error,
+        "recall": {"at_1": recall(1), "at_5": recall(5), f"at_{args.top_k}": recall(args.top_k)},
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(statistics.mean(latencies), 3)
+        },
+        # 首位候选的置信度分布，用于选择 SONG_ID_MIN_CONFIDENCE
+        "top1_confidence": {
+            outcome: {"count": len(values), "p10": percentile(values, 10), "p50": percentile(values, 50),
+                      "p90": percentile(values, 90)} if values else {"count": 0}
+            for outcome, values in confidences.items()
+        }
+    }, indent=2, ensure_ascii=False))
+    index.close()
+    os.remove(index_path)
+
+
+if __name__ == "__main__":
+    main()
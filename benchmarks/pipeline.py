@@ -0,0 +1,395 @@
+"""端到端分析流水线基准：合成演唱音频 + 本地OSS/dashscope替身 + 固定并发压测
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包）:
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --concurrency 1,4,16 --requests 32 --durations 10,60 \\
+        --asr-latency 0.3 --asr-error-rate 0.05 --output bench.json
+
+每个并发级别报告延迟 p50/p95/p99、每秒请求数、状态码分布、服务进程（含转码子进程）
+的CPU时间和峰值RSS，以及从 /metrics 得到的各阶段平均耗时。结果以JSON输出，
+便于在版本之间比较。
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from typing import Dict, Any, List, Tuple, Optional
+
+import numpy as np
+import httpx
+from aiohttp import web
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_RATE = 44100
+
+
+# ---------- 合成音频 ----------
+
+def synth_sweep(duration: float, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """从G3滑到G5再回来的正弦扫频"""
+    t = np.arange(int(duration * sr)) / sr
+    freq = 196 * 4 ** (0.5 - 0.5 * np.cos(2 * np.pi * t / max(duration, 1e-3)))
+    return 0.4 * np.sin(2 * np.pi * np.cumsum(freq) / sr)
+
+
+def synth_vibrato(duration: float, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """带5.5Hz颤音和乐句停顿的旋律（C大调音阶）"""
+    notes = [261.6, 293.7, 329.6, 349.2, 392.0, 440.0, 493.9, 523.3]
+    out = np.zeros(int(duration * sr))
+    position, index = 0, 0
+    while position < len(out):
+        length = min(int(0.6 * sr), len(out) - position)
+        t = np.arange(length) / sr
+        freq = notes[index % len(notes)] * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+        envelope = np.minimum(1, np.minimum(t, t[-1] - t) * 20)
+        out[position:position + length] = 0.4 * envelope * np.sin(2 * np.pi * np.cumsum(freq) / sr)
+        position += length + int(0.15 * sr)
+        index += 1
+    return out
+
+
+def synth_noisy(duration: float, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """颤音旋律叠加背景噪声（信噪比约10dB）"""
+    rng = np.random.default_rng(0)
+    return synth_vibrato(duration, sr) + 0.09 * rng.standard_normal(int(duration * sr))
+
+
+SYNTHS = {"sweep": synth_sweep, "vibrato": synth_vibrato, "noisy": synth_noisy}
+
+
+def encode_wav(samples: np.ndarray, sr: int = SAMPLE_RATE) -> bytes:
+    """编码为44.1kHz双声道16位WAV（与手机录音常见格式一致）"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    stereo = np.repeat(pcm[:, None], 2, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sr)
+        wav_file.writeframes(stereo.tobytes())
+    return buffer.getvalue()
+
+
+def build_corpus(durations: List[float], formats: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """生成 (类型 × 时长 × 格式) 的音频集合；没有ffmpeg时跳过压缩格式"""
+    corpus, skipped = [], []
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+    for fmt in formats:
+        if fmt != "wav" and not has_ffmpeg:
+            skipped.append(fmt)
+    for kind, synth in SYNTHS.items():
+        for duration in durations:
+            wav_bytes = encode_wav(synth(duration))
+            for fmt in formats:
+                if fmt in skipped:
+                    continue
+                data = wav_bytes
+                if fmt != "wav":
+                    from pydub import AudioSegment
+                    out = io.BytesIO()
+                    AudioSegment.from_wav(io.BytesIO(wav_bytes)).export(out, format=fmt)
+                    data = out.getvalue()
+                corpus.append({
+                    "name": f"{kind}-{duration:g}s.{fmt}",
+                    "format": fmt,
+                    "mime": "audio/wav" if fmt == "wav" else f"audio/{'mpeg' if fmt == 'mp3' else fmt}",
+                    "data": data
+                })
+    return corpus, skipped
+
+
+# ---------- 本地dashscope替身 ----------
+
+class FakeDashscope:
+    """模拟转写接口，带可配置的延迟和错误率"""
+
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await request.read()
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"code": "Throttling", "message": "模拟限流"}, status=429)
+        return web.json_response({"output": {"text": "小星星一闪一闪亮晶晶满天都是小星星"}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/{tail:.*}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+# ---------- 服务进程资源统计（Linux /proc） ----------
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def sample_resources(pid: int) -> Optional[Dict[str, float]]:
+    """服务进程及其子进程（转码进程池）的CPU秒数和RSS；非Linux返回None"""
+    if not os.path.exists(f"/proc/{pid}"):
+        return None
+    cpu, rss = 0.0, 0
+    for child in _process_tree(pid):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            continue
+    return {"cpu_seconds": cpu, "rss_bytes": rss}
+
+
+# ---------- /metrics 解析 ----------
+
+def parse_stage_metrics(text: str) -> Dict[str, Tuple[float, float]]:
+    """从 Prometheus 文本中取出各阶段耗时的 (sum, count)"""
+    stages: Dict[str, List[float]] = {}
+    for line in text.splitlines():
+        for suffix, index in (("_sum", 0), ("_count", 1)):
+            prefix = f"singing_stage_duration_seconds{suffix}{{stage=\""
+            if line.startswith(prefix):
+                stage = line[len(prefix):line.index('"', len(prefix))]
+                stages.setdefault(stage, [0.0, 0.0])[index] = float(line.rsplit(" ", 1)[1])
+    return {stage: (values[0], values[1]) for stage, values in stages.items()}
+
+
+def stage_deltas(before: Dict[str, Tuple[float, float]], after: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+    result = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        calls = count - prev_count
+        if calls > 0:
+            result[stage] = {"calls": int(calls), "mean_seconds": round((total - prev_total) / calls, 4)}
+    return result
+
+
+# ---------- 压测 ----------
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 4) if values else 0.0
+
+
+async def run_level(client: httpx.AsyncClient, corpus: List[Dict[str, Any]], path: str,
+                    concurrency: int, total_requests: int, server_pid: int) -> Dict[str, Any]:
+    """以固定并发（闭环）发送 total_requests 个请求"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    next_index = 0
+    peak_rss = 0
+    field = "file" if path == "/api/upload-audio" else "audio_file"
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total_requests:
+            item = corpus[next_index % len(corpus)]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, files={field: (item["name"], item["data"], item["mime"])})
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    async def sampler(stop: asyncio.Event):
+        nonlocal peak_rss
+        while not stop.is_set():
+            sample = sample_resources(server_pid)
+            if sample:
+                peak_rss = max(peak_rss, sample["rss_bytes"])
+            await asyncio.sleep(0.1)
+
+    metrics_before = parse_stage_metrics((await client.get("/metrics")).text)
+    resources_before = sample_resources(server_pid)
+    stop = asyncio.Event()
+    sampler_task = asyncio.create_task(sampler(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler_task
+    resources_after = sample_resources(server_pid)
+    metrics_after = parse_stage_metrics((await client.get("/metrics")).text)
+
+    level = {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "statuses": dict(statuses),
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 4) if latencies else 0.0
+        },
+        "stages": stage_deltas(metrics_before, metrics_after)
+    }
+    if resources_before and resources_after:
+        level["server_cpu_seconds"] = round(resources_after["cpu_seconds"] - resources_before["cpu_seconds"], 3)
+        level["server_peak_rss_mb"] = round(peak_rss / 1024 / 1024, 1)
+    return level
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(client: httpx.AsyncClient, timeout: float = 60.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            response = await client.get("/api/health")
+            if response.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"{timeout}秒内服务未就绪")
+
+
+async def main_async(args) -> Dict[str, Any]:
+    durations = [float(value) for value in args.durations.split(",")]
+    formats = args.formats.split(",")
+    levels = [int(value) for value in args.concurrency.split(",")]
+    corpus, skipped = build_corpus(durations, formats)
+    if not corpus:
+        raise SystemExit("没有可用的音频格式（压缩格式需要ffmpeg）")
+
+    dashscope = FakeDashscope(args.asr_latency, args.asr_error_rate)
+    await dashscope.start()
+
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "ALIYUN_ASR_BASE_URL": f"http://127.0.0.1:{dashscope.port}",
+        "BENCH_OSS_LATENCY": str(args.oss_latency),
+        "BENCH_OSS_ERROR_RATE": str(args.oss_error_rate),
+        "LOG_LEVEL": "WARNING",
+        # 所有请求来自同一个地址，关闭按客户端限流；各阶段并发上限保持默认
+        "RATE_LIMIT_PER_MINUTE": "0",
+    })
+    if not args.cache:
+        # 每个音频会重复发送，关闭结果缓存才能测到完整流水线
+        env["RESULT_CACHE_TTL"] = "0"
+    log_file = tempfile.TemporaryFile()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_app:app", "--app-dir", BENCH_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+            try:
+                await wait_for_server(client)
+            except TimeoutError:
+                log_file.seek(0)
+                sys.stderr.write(log_file.read().decode(errors="replace"))
+                raise
+            # 预热：进程池启动、连接建立
+            await run_level(client, corpus[:1], args.path, 1, 1, server.pid)
+            for concurrency in levels:
+                results.append(await run_level(
+                    client, corpus, args.path, concurrency, max(args.requests, concurrency), server.pid
+                ))
+    finally:
+        server.terminate()
+        server.wait()
+        log_file.close()
+        await dashscope.stop()
+
+    return {
+        "path": args.path,
+        "corpus": {
+            "files": len(corpus),
+            "durations": durations,
+            "formats": [fmt for fmt in formats if fmt not in skipped],
+            "skipped_formats": skipped,
+            "total_bytes": sum(len(item["data"]) for item in corpus)
+        },
+        "fakes": {
+            "asr_latency": args.asr_latency,
+            "asr_error_rate": args.asr_error_rate,
+            "oss_latency": args.oss_latency,
+            "oss_error_rate": args.oss_error_rate,
+            "asr_requests": dashscope.requests,
+            "asr_errors": dashscope.errors
+        },
+        "levels": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端分析流水线基准")
+    parser.add_argument("--path", default="/analyze", help="/analyze 或 /api/upload-audio")
+    parser.add_argument("--concurrency", default="1,4,8", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=16, help="每个并发级别的请求数")
+    parser.add_argument("--durations", default="10,30", help="合成音频时长（秒），逗号分隔")
+    parser.add_argument("--formats", default="wav,mp3,ogg", help="音频格式，压缩格式需要ffmpeg")
+    parser.add_argument("--asr-latency", type=float, default=0.3)
+    parser.add_argument("--asr-error-rate", type=float, default=0.0)
+    parser.add_argument("--oss-latency", type=float, default=0.05)
+    parser.add_argument("--oss-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="保留结果缓存（默认关闭）")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果另存为JSON文件")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
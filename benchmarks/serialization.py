@@ -0,0 +1,101 @@
+"""逐帧输出序列化基准：比较原来的 JSONResponse 数字列表和各输出格式的大小与序列化耗时
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包）:
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --duration 240 --runs 20 --kind sweep
+
+合成一段演唱，用本地分析得到真实的逐帧基频和能量（10ms一帧），组成与 /analyze
+相同结构的响应，分别计时：
+    baseline   标准库 json 序列化未取整的数字列表（改动前 JSONResponse 的做法）
+    json       按精度取整后的数字列表（orjson，未安装时为标准库 json）
+    compact    差分int16 + zlib + base64
+    msgpack    差分int16 + zlib，二进制直接放入MessagePack（需要安装 msgpack）
+序列化耗时包含编码逐帧数组的时间。同时给出gzip后的大小，供开启HTTP压缩时参考。
+结果以JSON输出。
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import SYNTHS, SAMPLE_RATE  # noqa: E402
+from app.core.serialization import FrameSeries, prepare, dumps, msgpack  # noqa: E402
+from app.services.local_analysis import analyze_pcm, SAMPLE_RATE as ANALYSIS_RATE, HOP_LENGTH  # noqa: E402
+
+
+def build_frames(duration: float, kind: str) -> dict:
+    signal = SYNTHS[kind](duration)
+    times = np.arange(int(duration * ANALYSIS_RATE)) / ANALYSIS_RATE
+    samples = np.interp(times, np.arange(len(signal)) / SAMPLE_RATE, signal).astype(np.float32)
+    result = analyze_pcm(samples, ANALYSIS_RATE, with_contour=True)
+    return {"f0": result.pop("f0_contour"), "energy": 20 * np.log10(np.maximum(result.pop("rms_contour"), 1e-5))}
+
+
+def response(frames: dict, series: bool) -> dict:
+    wrap = (lambda values: FrameSeries(values, 0.1)) if series else (lambda values: values.tolist())
+    return {
+        "success": True,
+        "data": {"frames": {
+            "hop_seconds": HOP_LENGTH / ANALYSIS_RATE,
+            "f0_hz": wrap(frames["f0"]),
+            "energy_db": wrap(frames["energy"])
+        }},
+        "message": "分析完成"
+    }
+
+
+def encoders(frames: dict) -> dict:
+    result = {
+        # 改动前：在响应中直接放 ndarray.tolist()，由标准库 json 序列化
+        "baseline": lambda: json.dumps(response(frames, False), ensure_ascii=False).encode("utf-8"),
+        "json": lambda: dumps(prepare(response(frames, True), "json")),
+        "compact": lambda: dumps(prepare(response(frames, True), "compact")),
+    }
+    if msgpack is not None:
+        result["msgpack"] = lambda: msgpack.packb(prepare(response(frames, True), "msgpack"), use_bin_type=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐帧输出序列化基准")
+    parser.add_argument("--duration", type=float, default=240.0)
+    parser.add_argument("--kind", default="vibrato", choices=sorted(SYNTHS))
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    frames = build_frames(args.duration, args.kind)
+    results = {}
+    for name, encode in encoders(frames).items():
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            body = encode()
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body)),
+            "median_ms": round(statistics.median(timings) * 1000, 2)
+        }
+    baseline = results["baseline"]
+    for entry in results.values():
+        entry["size_ratio"] = round(baseline["bytes"] / entry["bytes"], 1)
+        entry["speedup"] = round(baseline["median_ms"] / entry["median_ms"], 1) if entry["median_ms"] else None
+
+    print(json.dumps({
+        "duration": args.duration,
+        "frames": len(frames["f0"]),
+        "voiced_ratio": round(float(np.mean(frames["f0"] > 0)), 3),
+        "runs": args.runs,
+        "results": results
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
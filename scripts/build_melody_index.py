@@ -0,0 +1,34 @@
+"""离线构建哼唱识曲使用的旋律指纹索引
+
+用法（在仓库根目录运行，运行环境与部署时相同，需要能导入 app 包）:
+    python scripts/build_melody_index.py api/data/reference_melodies.json -o melody_index.bin
+    python scripts/build_melody_index.py songs/*.json -o /data/melody_index.bin
+
+输入为一个或多个曲谱JSON文件，格式与 api/data/reference_melodies.json 相同
+（{song_id: {"title", "bpm", "notes": [[音名, 拍数], ...]}}，R 为休止）。
+构建完成后把 SONG_INDEX_PATH 指向输出文件；索引先写临时文件再替换，
+可以在服务运行时重建，重启后生效。
+"""
+import json
+import time
+import argparse
+
+from app.services.melody_index import build_index, load_song_specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建旋律指纹索引")
+    parser.add_argument("inputs", nargs="+", help="曲谱JSON文件")
+    parser.add_argument("-o", "--output", default="melody_index.bin")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    songs = load_song_specs(args.inputs)
+    summary = build_index(args.output, songs)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    summary["output"] = args.output
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
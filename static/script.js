@@ -134,3 +134,165 @@ function retryUpload() {
     if (resultDiv) resultDiv.style.display = 'none';
     if (audioFile) audioFile.value = '';
 }
+
+// 实时演唱分析（WebSocket）
+const liveStartBtn = document.getElementById('liveStartBtn');
+const liveStopBtn = document.getElementById('liveStopBtn');
+const liveResultDiv = document.getElementById('liveResult');
+
+let liveSocket = null;
+let liveContext = null;
+let liveStream = null;
+let liveProcessor = null;
+
+async function startLiveAnalysis() {
+    try {
+        liveStream = await navigator.mediaDevices.getUserMedia({ audio: true });
+        liveContext = new AudioContext();
+        const source = liveContext.createMediaStreamSource(liveStream);
+        // 4096个样本一块，48kHz下约85ms
+        liveProcessor = liveContext.createScriptProcessor(4096, 1, 1);
+        
+        const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+        liveSocket = new WebSocket(`${protocol}://${location.host}${API_BASE_URL}/api/ws/live`);
+        liveSocket.binaryType = 'arraybuffer';
+        
+        liveSocket.onopen = () => {
+            liveSocket.send(JSON.stringify({ sample_rate: liveContext.sampleRate, format: 'pcm_f32le' }));
+            liveProcessor.onaudioprocess = (event) => {
+                if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+                    // 复制一份，避免浏览器复用底层缓冲区
+                    liveSocket.send(new Float32Array(event.inputBuffer.getChannelData(0)).buffer);
+                }
+            };
+            source.connect(liveProcessor);
+            liveProcessor.connect(liveContext.destination);
+            if (liveStartBtn) liveStartBtn.disabled = true;
+            if (liveStopBtn) liveStopBtn.disabled = false;
+        };
+        liveSocket.onmessage = (event) => showLiveResult(JSON.parse(event.data));
+        liveSocket.onclose = () => releaseLiveAudio();
+        liveSocket.onerror = () => showError('实时分析连接失败');
+    } catch (error) {
+        console.error('实时分析错误:', error);
+        showError(`无法开始实时分析: ${error.message}`);
+        releaseLiveAudio();
+    }
+}
+
+function stopLiveAnalysis() {
+    if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+        liveSocket.send(JSON.stringify({ type: 'stop' }));
+    } else {
+        releaseLiveAudio();
+    }
+}
+
+function releaseLiveAudio() {
+    if (liveProcessor) liveProcessor.disconnect();
+    if (liveStream) liveStream.getTracks().forEach(track => track.stop());
+    if (liveContext) liveContext.close();
+    liveProcessor = null;
+    liveStream = null;
+    liveContext = null;
+    liveSocket = null;
+    if (liveStartBtn) liveStartBtn.disabled = false;
+    if (liveStopBtn) liveStopBtn.disabled = true;
+}
+
+function showLiveResult(data) {
+    if (!liveResultDiv || !data.running) return;
+    const current = data.current
+        ? `${data.current.note} (${data.current.f0}Hz, ${data.current.cents_off > 0 ? '+' : ''}${data.current.cents_off}音分)`
+        : '—';
+    liveResultDiv.style.display = 'block';
+    liveResultDiv.innerHTML = `
+        <div class="analysis-result">
+            <h4>🎤 ${data.type === 'final' ? '最终评分' : '实时分析'}</h4>
+            <p><strong>当前音高:</strong> ${current}</p>
+            <ul>
+                <li>音准: ${data.running.pitch_accuracy}</li>
+                <li>音高稳定性: ${data.running.pitch_stability}</li>
+                <li>节奏稳定性: ${data.running.rhythm_stability}</li>
+                <li>有效演唱时长: ${data.running.voiced_seconds}秒</li>
+            </ul>
+        </div>
+    `;
+}
+
+if (liveStartBtn) liveStartBtn.addEventListener('click', startLiveAnalysis);
+if (liveStopBtn) liveStopBtn.addEventListener('click', stopLiveAnalysis);
+
+// 逐帧数据（基频曲线、能量包络）的紧凑编码解码
+// 服务端以 output_format=compact 返回 {"$frames": "i16-delta" | "f16", "scale", "length", "data": base64(zlib)}
+
+function base64ToBytes(text) {
+    const binary = atob(text);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+}
+
+async function inflate(bytes) {
+    // zlib 格式即 CompressionStream 的 'deflate'
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+function halfToFloat(bits) {
+    const sign = bits & 0x8000 ? -1 : 1;
+    const exponent = (bits >> 10) & 0x1f;
+    const fraction = bits & 0x3ff;
+    if (exponent === 0) return sign * fraction * 2 ** -24;
+    if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+    return sign * (1 + fraction / 1024) * 2 ** (exponent - 15);
+}
+
+async function decodeFrameArray(envelope) {
+    const raw = typeof envelope.data === 'string' ? base64ToBytes(envelope.data) : new Uint8Array(envelope.data);
+    const bytes = await inflate(raw);
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const values = new Float32Array(envelope.length);
+    if (envelope.$frames === 'i16-delta') {
+        // 差分累加在整数上进行，最后再乘以量化步长
+        let level = 0;
+        for (let i = 0; i < values.length; i++) {
+            level += view.getInt16(i * 2, true);
+            values[i] = level * envelope.scale;
+        }
+    } else if (envelope.$frames === 'f16') {
+        for (let i = 0; i < values.length; i++) values[i] = halfToFloat(view.getUint16(i * 2, true));
+    } else {
+        throw new Error(`未知的逐帧编码: ${envelope.$frames}`);
+    }
+    return values;
+}
+
+// 递归地把响应中所有紧凑编码的数组换成 Float32Array
+async function decodeFrameArrays(value) {
+    if (Array.isArray(value)) return Promise.all(value.map(decodeFrameArrays));
+    if (!value || typeof value !== 'object') return value;
+    if ('$frames' in value) return decodeFrameArray(value);
+    const entries = await Promise.all(
+        Object.entries(value).map(async ([key, item]) => [key, await decodeFrameArrays(item)])
+    );
+    return Object.fromEntries(entries);
+}
+
+// 完整分析并取回逐帧曲线（紧凑编码传输，比数字列表小很多）
+async function analyzeWithFrames(file, userLevel = 'beginner') {
+    const formData = new FormData();
+    formData.append('audio_file', file);
+    formData.append('user_level', userLevel);
+    formData.append('include_frames', 'true');
+    formData.append('output_format', 'compact');
+    const response = await fetch(`${API_BASE_URL}/analyze`, { method: 'POST', body: formData });
+    if (!response.ok) {
+        let detail = `服务器错误: ${response.status}`;
+        try {
+            detail = (await response.json()).detail || detail;
+        } catch (e) {}
+        throw new Error(detail);
+    }
+    return decodeFrameArrays(await response.json());
+}
@@ -0,0 +1,56 @@
+import asyncio
+from aiohttp import web
+
+from app.core.real_asr_service import RealASRService
+
+# 本地桩服务器：模拟dashscope转写接口，记录连接数和最大并发
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "peers": set()}
+
+
+async def fake_transcription(request):
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    stats["peers"].add(request.transport.get_extra_info("peername"))
+    try:
+        await asyncio.sleep(0.05)
+        return web.json_response({"output": {"text": "小星星一闪一闪亮晶晶"}})
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def main():
+    app = web.Application()
+    app.router.add_post("/api/v1/services/asr/transcription", fake_transcription)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    service = RealASRService(
+        api_key="sk-test-key",
+        base_url=f"http://127.0.0.1:{port}",
+        max_concurrency=4,
+        connection_limit_per_host=4
+    )
+    await service.start()
+    try:
+        for _ in range(3):
+            results = await asyncio.gather(*[
+                service.transcribe_audio("https://example.com/audio.wav") for _ in range(10)
+            ])
+            assert all("error" not in r for r in results), results
+    finally:
+        await service.close()
+        await runner.cleanup()
+
+    print(f"请求数: {stats['requests']}, 最大并发: {stats['max_in_flight']}, 使用的TCP连接: {len(stats['peers'])}")
+    if stats["max_in_flight"] <= 4 and len(stats["peers"]) <= 4:
+        print("✅ 连接复用和并发限制正常")
+    else:
+        print("❌ 连接未复用或并发超限")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
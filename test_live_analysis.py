@@ -0,0 +1,95 @@
+"""实时分析（LiveSession）测试
+
+用法（需要能导入 app 包，与 benchmarks 相同）:
+    python test_live_analysis.py
+"""
+import numpy as np
+
+from app.services.live_analysis import LiveSession
+from app.services.local_analysis import detect_onsets, frame_signal, frame_rms
+
+SR = 16000
+
+
+def tone(seconds: float, freq: float = 220.0, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(seconds * SR)) / SR
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def live_onsets(samples: np.ndarray, chunk: int = 1600):
+    """按 chunk 个样本一块送入，返回 (起音点个数, 最后的运行评分)"""
+    session = LiveSession(SR, "pcm_f32le")
+    count, result = 0, None
+    for start in range(0, len(samples), chunk):
+        result = session.process_chunk(samples[start:start + chunk].astype("<f4").tobytes())
+        count += len(result["onsets"])
+    return count, result["running"]
+
+
+def offline_onsets(samples: np.ndarray) -> int:
+    return len(detect_onsets(frame_rms(frame_signal(samples)), 0.01))
+
+
+def test_sustained_tone():
+    count, running = live_onsets(tone(6))
+    print(f"持续音: 起音点 {count}, 节奏稳定性 {running['rhythm_stability']}")
+    assert count <= 1
+    assert running["rhythm_stability"] == 0.0
+
+
+def test_silence_and_noise():
+    silence = np.zeros(6 * SR, dtype=np.float32)
+    noise = (0.002 * np.random.default_rng(0).standard_normal(6 * SR)).astype(np.float32)
+    for name, samples in (("静音", silence), ("底噪", noise)):
+        count, _ = live_onsets(samples)
+        print(f"{name}: 起音点 {count}")
+        assert count == 0
+
+
+def test_notes_match_offline():
+    gap = np.zeros(int(0.08 * SR), dtype=np.float32)
+    notes = np.concatenate([np.concatenate([tone(0.5, freq), gap]) for freq in (220, 247, 262, 294) * 3])
+    count, _ = live_onsets(notes)
+    expected = offline_onsets(notes)
+    print(f"断开的音符: 实时 {count}, 离线 {expected}")
+    assert abs(count - expected) <= 1
+
+
+def test_resampled_chunks_are_continuous():
+    """48kHz 输入按任意字节数分块送入，结果应与一次送入相同（无拼接毛刺、无时长漂移）"""
+    rate = 48000
+    t = np.arange(5 * rate) / rate
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t)).astype("<f4").tobytes()
+
+    whole = LiveSession(rate, "pcm_f32le")
+    expected = whole.process_chunk(samples)
+
+    chunked = LiveSession(rate, "pcm_f32le")
+    f0 = []
+    for start in range(0, len(samples), 1021):
+        f0.extend(chunked.process_chunk(samples[start:start + 1021])["f0"])
+    print(f"48kHz 分块: 帧数 {len(f0)} / {len(expected['f0'])}, 基频范围 {min(f0[5:])}~{max(f0[5:])}")
+    assert abs(chunked.ring.total_written - whole.ring.total_written) <= 1
+    assert abs(len(f0) - len(expected["f0"])) <= 1
+    assert max(abs(value - 220) for value in f0[5:]) <= 1.0
+
+
+def test_low_sample_rate_refused():
+    """过低的采样率上采样时数据量成倍膨胀，创建会话时直接拒绝"""
+    for rate in (0, 1, 100, 7999, 192001):
+        try:
+            LiveSession(rate, "pcm_s16le")
+        except ValueError as e:
+            print(f"采样率 {rate}: {e}")
+        else:
+            raise AssertionError(f"采样率 {rate} 应被拒绝")
+    assert LiveSession(8000, "pcm_s16le").sample_rate == 8000
+
+
+if __name__ == "__main__":
+    test_sustained_tone()
+    test_silence_and_noise()
+    test_notes_match_offline()
+    test_resampled_chunks_are_continuous()
+    test_low_sample_rate_refused()
+    print("全部通过")
@@ -0,0 +1,52 @@
+"""离线本地分析（analyze_pcm）测试
+
+用法（需要能导入 app 包，与 benchmarks 相同）:
+    python test_local_analysis.py
+"""
+import numpy as np
+
+from app.services.local_analysis import analyze_pcm
+
+SR = 16000
+
+
+def sing(freq: np.ndarray, amplitude: float = 0.3) -> np.ndarray:
+    """按逐样本的频率合成正弦（相位连续）"""
+    return (amplitude * np.sin(2 * np.pi * np.cumsum(freq) / SR)).astype(np.float32)
+
+
+def with_lead_in(samples: np.ndarray, seconds: float = 0.5) -> np.ndarray:
+    return np.concatenate([np.zeros(int(seconds * SR), dtype=np.float32), samples])
+
+
+def test_sustained_vibrato_note():
+    """20秒长音带1%、5.5Hz的颤音：只有开头一个起音点，不应编出节奏分"""
+    t = np.arange(20 * SR) / SR
+    result = analyze_pcm(with_lead_in(sing(220 * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t)))))
+    print(f"颤音长音: 起音点 {result['onset_count']}, 节奏 {result['rhythm_stability']}, BPM {result['tempo_bpm']}")
+    assert result["onset_count"] <= 2
+    assert result["rhythm_stability"] == 0.0
+
+
+def test_slow_glide():
+    t = np.arange(20 * SR) / SR
+    result = analyze_pcm(with_lead_in(sing(220 * 2 ** (t / 20))))
+    print(f"慢速滑音: 起音点 {result['onset_count']}, 节奏 {result['rhythm_stability']}")
+    assert result["onset_count"] <= 2
+
+
+def test_separate_notes():
+    """断开的音符（每0.5秒一个）仍然逐个检测到，节奏稳定"""
+    gap = np.zeros(int(0.08 * SR), dtype=np.float32)
+    notes = [np.concatenate([sing(np.full(int(0.42 * SR), freq)), gap]) for freq in (220, 247, 262, 294) * 10]
+    result = analyze_pcm(np.concatenate(notes))
+    print(f"断开的音符: 起音点 {result['onset_count']}, 节奏 {result['rhythm_stability']}, BPM {result['tempo_bpm']}")
+    assert abs(result["onset_count"] - 40) <= 1
+    assert abs(result["tempo_bpm"] - 120) <= 2
+
+
+if __name__ == "__main__":
+    test_sustained_vibrato_note()
+    test_slow_glide()
+    test_separate_notes()
+    print("全部通过")
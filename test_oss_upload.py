@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.core.cloud_services import CloudServiceManager
+from app.core.audio_buffer import NormalizedAudio
+
+import numpy as np
+
+
+class FakeBucket:
+    """本地OSS替身：每次调用模拟网络延迟，记录并发的分片上传数"""
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.objects = {}
+        self.parts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+
+    def put_object(self, key, data):
+        self._enter()
+        self.objects[key] = bytes(data)
+        return SimpleNamespace(status=200)
+
+    def delete_object(self, key):
+        self.objects.pop(key, None)
+
+    def sign_url(self, method, key, expires):
+        return f"http://fake-oss.local/{key}?expires={expires}"
+
+    def init_multipart_upload(self, key):
+        return SimpleNamespace(upload_id="upload-1")
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self._enter()
+        self.parts[part_number] = bytes(data)
+        return SimpleNamespace(etag=f"etag-{part_number}")
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.objects[key] = b"".join(self.parts[p.part_number] for p in parts)
+        return SimpleNamespace(status=200)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.parts.clear()
+
+
+async def ticker(stop: asyncio.Event, ticks: list):
+    # 上传期间事件循环应保持响应
+    while not stop.is_set():
+        ticks.append(time.monotonic())
+        await asyncio.sleep(0.01)
+
+
+async def main():
+    bucket = FakeBucket()
+    manager = CloudServiceManager(settings, oss_bucket=bucket)
+    manager.oss_uploader.multipart_threshold = 1024 * 1024
+    manager.oss_uploader.part_size = 256 * 1024
+
+    # 60秒16kHz音频约1.9MB，会走分片上传
+    audio = NormalizedAudio(np.zeros(60 * 16000, dtype=np.int16))
+
+    stop = asyncio.Event()
+    ticks = []
+    tick_task = asyncio.create_task(ticker(stop, ticks))
+    started = time.monotonic()
+    url = await manager.upload_audio(audio, preprocessed=True)
+    elapsed = time.monotonic() - started
+    stop.set()
+    await tick_task
+    await manager.close()
+
+    max_gap = max(b - a for a, b in zip(ticks, ticks[1:]))
+    uploaded = next(iter(bucket.objects.values()))
+    print(f"签名URL: {url}")
+    print(f"上传耗时: {elapsed:.2f}秒, 最大并发分片: {bucket.max_in_flight}, 事件循环最大停顿: {max_gap*1000:.0f}ms")
+    if uploaded == audio.to_wav() and bucket.max_in_flight > 1 and max_gap < 0.1:
+        print("✅ 分片并行上传且未阻塞事件循环")
+    else:
+        print("❌ 上传结果不符合预期")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
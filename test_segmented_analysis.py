@@ -0,0 +1,79 @@
+"""长音频分段分析测试
+
+用法（需要能导入 app 包，与 benchmarks 相同）:
+    python test_segmented_analysis.py
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+from app.core.admission import build_stage_gates
+from app.core.audio_buffer import NormalizedAudio
+from app.core.config import Settings
+from app.services.analysis_service import AnalysisService
+
+SR = 16000
+
+
+class SlowCloudManager:
+    """按真实闸门限流、每次上传/ASR都耗时的云服务替身，记录同时进行的ASR数"""
+
+    def __init__(self, settings: Settings, upload_seconds: float = 0.02, asr_seconds: float = 0.3):
+        self.settings = settings
+        self.gates = build_stage_gates(settings)
+        self.upload_seconds = upload_seconds
+        self.asr_seconds = asr_seconds
+        self.active = 0
+        self.peak = 0
+
+    @asynccontextmanager
+    async def deliver_audio(self, audio_data):
+        async with self.gates["upload"].slot():
+            await asyncio.sleep(self.upload_seconds)
+        yield "https://example.com/segment.wav"
+
+    async def analyze_singing(self, audio_url: str):
+        async with self.gates["asr"].slot():
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                await asyncio.sleep(self.asr_seconds)
+            finally:
+                self.active -= 1
+        return {"analysis": {"score": 80, "transcribed_text": "啦"}, "source": "real_api"}
+
+
+def phrases(count: int, seconds: float = 2.0) -> NormalizedAudio:
+    """count 个乐句，句间 0.3 秒停顿"""
+    t = np.arange(int(seconds * SR)) / SR
+    phrase = 0.3 * np.sin(2 * np.pi * 220 * t)
+    gap = np.zeros(int(0.3 * SR))
+    samples = np.concatenate([np.concatenate([phrase, gap]) for _ in range(count)])
+    return NormalizedAudio((samples * 32767).astype(np.int16))
+
+
+def test_many_segments_fit_small_gates():
+    """20 段的请求在名额为 4、等待 0.2 秒的闸门下应能完成，不会被自己的分段挤成503"""
+    settings = Settings()
+    settings.SEGMENT_TARGET_SECONDS = 2
+    settings.SEGMENT_MAX_SECONDS = 3
+    settings.ADMISSION_UPLOAD_CONCURRENCY = 4
+    settings.ADMISSION_ASR_CONCURRENCY = 4
+    settings.ADMISSION_WAIT_TIMEOUT = 0.2
+    cloud = SlowCloudManager(settings)
+    service = AnalysisService(cloud)
+
+    local, merged, segments, _ = asyncio.run(service._run_analysis(phrases(20)))
+    rejected = {stage: gate.rejected for stage, gate in cloud.gates.items()}
+    print(f"分段 {len(segments)}, ASR最大并发 {cloud.peak}, 拒绝 {rejected}")
+    assert len(segments) >= 20
+    assert cloud.peak <= 4
+    assert not any(rejected.values())
+    assert merged["source"] == "real_api"
+    assert local is not None
+
+
+if __name__ == "__main__":
+    test_many_segments_fit_small_gates()
+    print("全部通过")